@@ -1,21 +1,65 @@
 from django.contrib import admin, messages
+from django.forms.models import BaseInlineFormSet
+from django.http import HttpResponseRedirect
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.html import format_html
 from django.db.models import Count
 from django.core.exceptions import ValidationError
 
-from .models import Author, Book, Loan, Category
+from .models import Author, Book, BorrowerCard, Hold, Loan, LoanArchive, Category
+from . import services
+from .cache import catalog_changed
+from .pagination import EstimatedCountPaginator
+from .search import search_books
 
 
-class LoanInline(admin.TabularInline):
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist for tables with millions of rows: no exact COUNT(*) per page
+    and no second count of the unfiltered table when filtering."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class LimitedInlineFormSet(BaseInlineFormSet):
+    """Only the first `max_rows` related objects, in the inline's ordering."""
+    max_rows = None
+
+    def get_queryset(self):
+        if not hasattr(self, '_limited_queryset'):
+            queryset = super().get_queryset()[:self.max_rows]
+            # each row's label (Loan.__str__) reads the parent: no query per row
+            for obj in queryset:
+                self.fk.set_cached_value(obj, self.instance)
+            self._limited_queryset = queryset
+        return self._limited_queryset
+
+
+class LimitedInline(admin.TabularInline):
+    """Inline showing `max_rows` rows instead of the whole relation."""
+    formset = LimitedInlineFormSet
+    max_rows = 20
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.max_rows = self.max_rows
+        return formset
+
+
+class LoanInline(LimitedInline):
     model = Loan
+    verbose_name_plural = 'Derniers emprunts'
+    # newest first on the book_id index (ids follow borrowed_at), no sort
+    ordering = ('-id',)
     extra = 0
     fields = ('borrower_name', 'borrower_email', 'card_number', 'borrowed_at', 'due_date', 'status')
     readonly_fields = ('borrower_name', 'borrower_email', 'card_number', 'borrowed_at', 'due_date', 'status')
     can_delete = False
 
 
-class BookInline(admin.TabularInline):
+class BookInline(LimitedInline):
     model = Book
+    ordering = ('title', 'id')
     fields = ('title', 'publication_year', 'copies_available')
     readonly_fields = ('title', 'publication_year', 'copies_available')
     extra = 0
@@ -35,21 +79,26 @@ class AuthorAdmin(admin.ModelAdmin):
 
 @admin.action(description='Marquer les livres sélectionnés comme indisponibles')
 def make_unavailable(modeladmin, request, queryset):
-    updated = queryset.update(copies_available=0)
+    ids = list(queryset.values_list('pk', flat=True))
+    updated = Book.objects.filter(pk__in=ids).update(copies_available=0)
+    catalog_changed(ids)
     messages.success(request, f'{updated} livre(s) marqués comme indisponibles.')
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(LargeTableAdmin):
     list_display = ('title', 'author', 'isbn', 'category', 'copies_available')
-    list_filter = ('category', 'author', 'publication_year')
+    # no author filter: the sidebar would list every author
+    list_filter = ('category', 'publication_year')
+    list_select_related = ('author', 'category')
     search_fields = ('title', 'isbn', 'author__first_name', 'author__last_name')
+    autocomplete_fields = ('author', 'category')
     actions = [make_unavailable]
-    readonly_fields = ('date_added',)
+    readonly_fields = ('date_added', 'loan_history')
     inlines = (LoanInline,)
     fieldsets = (
         ('Informations', {'fields': ('title', 'author', 'isbn', 'category', 'publication_year', 'language', 'publisher', 'pages')}),
-        ('Disponibilité', {'fields': ('copies_total', 'copies_available')}),
+        ('Disponibilité', {'fields': ('copies_total', 'copies_available', 'loan_history')}),
         ('Média & description', {'fields': ('cover', 'description')}),
         ('Dates', {'fields': ('date_added',)}),
     )
@@ -62,26 +111,70 @@ class BookAdmin(admin.ModelAdmin):
             raise
         super().save_model(request, obj, form, change)
 
+    def get_search_results(self, request, queryset, search_term):
+        # the catalog search index rather than LIKE '%...%' on four columns;
+        # the autocomplete widgets pointing at books search through here too
+        if not search_term:
+            return queryset, False
+        return search_books(queryset, search_term), False
+
+    @admin.display(description='Historique')
+    def loan_history(self, obj):
+        if obj.pk is None:
+            return '-'
+        url = reverse('admin:books_loan_changelist') + f'?book__id__exact={obj.pk}'
+        return format_html('<a href="{}">Tous les emprunts de ce livre</a>', url)
+
+
+class PenaltyFilter(admin.SimpleListFilter):
+    title = 'pénalité'
+    parameter_name = 'penalty'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', 'Avec pénalité'),
+            ('no', 'Sans pénalité'),
+            ('10', 'Plus de 10 €'),
+        )
+
+    def queryset(self, request, queryset):
+        # `penalty` is annotated by LoanAdmin.get_queryset
+        if self.value() == 'yes':
+            return queryset.filter(penalty__gt=0)
+        if self.value() == 'no':
+            return queryset.filter(penalty=0)
+        if self.value() == '10':
+            return queryset.filter(penalty__gt=10)
+        return queryset
+
 
 @admin.register(Loan)
-class LoanAdmin(admin.ModelAdmin):
-    list_display = ('book', 'borrower_name', 'borrower_email', 'card_number', 'borrowed_at', 'status', 'penalty')
-    list_filter = ('status', 'borrowed_at')
+class LoanAdmin(LargeTableAdmin):
+    list_display = ('book', 'borrower_name', 'borrower_email', 'card_number', 'borrowed_at', 'status', 'overdue_days', 'penalty')
+    list_filter = ('status', PenaltyFilter, 'borrowed_at')
+    list_select_related = ('book',)
     search_fields = ('borrower_name', 'borrower_email', 'card_number', 'book__title')
+    autocomplete_fields = ('book',)
+    # newest first in primary key order: no sort of the whole table per page
+    ordering = ('-id',)
     actions = ['mark_returned']
     readonly_fields = ('borrowed_at', 'due_date', 'returned_at')
 
+    def get_queryset(self, request):
+        # penalties computed in SQL so the changelist can sort and filter on them
+        return super().get_queryset(request).with_penalties()
+
+    @admin.display(description='Jours de retard', ordering='overdue_days')
+    def overdue_days(self, obj):
+        return obj.overdue_days
+
+    @admin.display(description='Pénalité (€)', ordering='penalty')
     def penalty(self, obj):
-        return obj.penalty_amount()
-    penalty.short_description = 'Pénalité (€)'
+        return obj.penalty
 
     @admin.action(description='Marquer les emprunts sélectionnés comme retournés')
     def mark_returned(self, request, queryset):
-        count = 0
-        for loan in queryset:
-            if loan.status != Loan.STATUS_RETURNED:
-                loan.mark_returned()
-                count += 1
+        count = services.return_loans(queryset.values_list('pk', flat=True))
         messages.success(request, f'{count} emprunt(s) marqué(s) comme retournés.')
 
     def save_model(self, request, obj, form, change):
@@ -90,8 +183,69 @@ class LoanAdmin(admin.ModelAdmin):
         except ValidationError as e:
             self.message_user(request, f'Erreur de validation: {e}', level=messages.ERROR)
             raise
+        if not change:
+            try:
+                services.checkout(obj)
+            except ValidationError as e:
+                # a concurrent checkout took the last copy or card slot since
+                # the form validated: nothing saved, see response_add()
+                self.message_user(request, f"L'emprunt n'a pas été créé : {'; '.join(e.messages)}",
+                                  level=messages.ERROR)
+            return
         super().save_model(request, obj, form, change)
 
+    def log_addition(self, request, obj, message):
+        if obj.pk is not None:
+            return super().log_addition(request, obj, message)
+
+    def response_add(self, request, obj, post_url_continue=None):
+        if obj.pk is None:
+            return HttpResponseRedirect(request.get_full_path())
+        return super().response_add(request, obj, post_url_continue)
+
+
+@admin.register(LoanArchive)
+class LoanArchiveAdmin(LargeTableAdmin):
+    """Read-only: rows get here through books.archive only."""
+    list_display = ('book', 'borrower_name', 'card_number', 'borrowed_at', 'returned_at', 'status')
+    list_filter = ('status',)
+    list_select_related = ('book',)
+    search_fields = ('card_number', 'borrower_name', 'book__title')
+    ordering = ('-id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BorrowerCard)
+class BorrowerCardAdmin(admin.ModelAdmin):
+    list_display = ('card_number', 'active_loans')
+    search_fields = ('card_number',)
+    readonly_fields = ('active_loans',)
+
+
+@admin.register(Hold)
+class HoldAdmin(LargeTableAdmin):
+    list_display = ('book', 'card_number', 'borrower_name', 'status', 'created_at', 'expires_at')
+    list_filter = ('status',)
+    search_fields = ('card_number', 'borrower_name', 'book__title', 'book__isbn')
+    list_select_related = ('book',)
+    autocomplete_fields = ('book',)
+    # the queue moves through books.services, not by editing statuses
+    readonly_fields = ('status', 'allocated_at', 'expires_at')
+    actions = ['cancel_holds']
+
+    @admin.action(description='Annuler les réservations sélectionnées')
+    def cancel_holds(self, request, queryset):
+        canceled = sum(services.cancel_hold(hold) for hold in queryset.filter(status__in=Hold.ACTIVE_STATUSES))
+        self.message_user(request, f'{canceled} réservation(s) annulée(s).')
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
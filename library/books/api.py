@@ -0,0 +1,279 @@
+"""Read-only JSON API of the catalog.
+
+Rows are fetched with ``values()`` projections: no model instances are built
+and only the columns (and joins) of the requested fields are queried. Clients
+pick them with ``?fields=title,isbn,copies_available``; without it a
+resource answers its ``default_fields``. Lists are keyset-paginated with
+opaque ``?cursor=`` tokens (``?limit=`` rows per page, at most MAX_LIMIT);
+``next`` and ``previous`` are URLs relative to the API's host.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views.generic import View
+
+from .cache import cache_catalog_page
+from .replicas import use_replica
+from .models import Author, Book, Category
+from .pagination import CursorPaginator, InvalidCursor
+from .search import suggest_books
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MIN_LENGTH = 2
+
+
+class ApiError(Exception):
+    pass
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'ensure_ascii': False})
+
+
+class ResourceMixin:
+    """What a resource exposes. `fields` maps each public name to a model
+    field, a ``__`` lookup across relations or an expression; joins and
+    aggregates are only added to the query when their field is requested."""
+
+    model = None
+    fields = {}
+    default_fields = ()
+    # query parameter -> lookup, e.g. {'author': 'author_id'}
+    filters = {}
+
+    def get_queryset(self):
+        return self.model._default_manager.all()
+
+    def requested_fields(self):
+        raw = self.request.GET.get('fields')
+        if not raw:
+            return list(self.default_fields)
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Champ(s) inconnu(s) : {', '.join(unknown)}. Disponibles : {', '.join(self.fields)}.")
+        return list(dict.fromkeys(names))
+
+    def project(self, queryset, names, extra=()):
+        """``values()`` of `names` (plus `extra` columns, e.g. the sort key)."""
+        plain, expressions = [], {}
+        for name in names:
+            spec = self.fields[name]
+            if spec == name:
+                plain.append(name)
+            else:
+                expressions[name] = F(spec) if isinstance(spec, str) else spec
+        plain.extend(name for name in extra if name not in names)
+        return queryset.values(*plain, **expressions)
+
+    def filter_queryset(self, queryset):
+        for param, lookup in self.filters.items():
+            value = self.request.GET.get(param)
+            if value:
+                try:
+                    queryset = queryset.filter(**{lookup: value})
+                except (TypeError, ValueError):
+                    raise ApiError(f'Valeur invalide pour {param}.')
+        return queryset
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            return _json({'error': str(e)}, status=400)
+
+
+class ApiListView(ResourceMixin, View):
+    ordering = ('id',)
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise ApiError('limit doit être un entier.')
+        return max(1, min(limit, MAX_LIMIT))
+
+    def get(self, request, *args, **kwargs):
+        names = self.requested_fields()
+        sort_keys = [name.lstrip('-') for name in self.ordering]
+        qs = self.project(self.filter_queryset(self.get_queryset()), names, extra=sort_keys)
+        paginator = CursorPaginator(qs, self.get_limit(), self.ordering)
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise ApiError('Curseur de pagination invalide.')
+        hidden = [key for key in sort_keys if key not in names]
+        for row in page.object_list:
+            for key in hidden:
+                del row[key]
+        return _json({
+            'results': page.object_list,
+            'next': self._page_url(page.next_cursor),
+            'previous': self._page_url(page.previous_cursor),
+        })
+
+    def _page_url(self, cursor):
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query['cursor'] = cursor
+        # relative: the page cache key does not include the Host the page was built for
+        return f'{self.request.path}?{query.urlencode()}'
+
+
+class ApiDetailView(ResourceMixin, View):
+    def get(self, request, pk, *args, **kwargs):
+        row = self.project(self.get_queryset().filter(pk=pk), self.requested_fields()).first()
+        if row is None:
+            raise Http404
+        return _json(row)
+
+
+class BookResource(ResourceMixin):
+    model = Book
+    fields = {
+        'id': 'id',
+        'title': 'title',
+        'isbn': 'isbn',
+        'publication_year': 'publication_year',
+        'language': 'language',
+        'pages': 'pages',
+        'publisher': 'publisher',
+        'description': 'description',
+        'price': 'price',
+        'copies_total': 'copies_total',
+        'copies_available': 'copies_available',
+        'author_id': 'author_id',
+        'author_first_name': 'author__first_name',
+        'author_last_name': 'author__last_name',
+        'category_id': 'category_id',
+        'category_name': 'category__name',
+    }
+    default_fields = ('id', 'title', 'isbn', 'author_id', 'category_id', 'copies_available')
+    filters = {'author': 'author_id', 'category': 'category_id', 'isbn': 'isbn'}
+
+
+class AuthorResource(ResourceMixin):
+    model = Author
+    fields = {
+        'id': 'id',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'nationality': 'nationality',
+        'birth_date': 'birth_date',
+        'date_of_death': 'date_of_death',
+        'website': 'website',
+        'biography': 'biography',
+        'book_count': Count('books'),
+    }
+    default_fields = ('id', 'first_name', 'last_name')
+
+    def get_queryset(self):
+        # names are nullable: sort on non-NULL copies, as AuthorListView does
+        return super().get_queryset().annotate(
+            sort_last_name=Coalesce('last_name', Value('')),
+            sort_first_name=Coalesce('first_name', Value('')),
+        )
+
+
+class CategoryResource(ResourceMixin):
+    model = Category
+    fields = {
+        'id': 'id',
+        'name': 'name',
+        'description': 'description',
+        'book_count': Count('books'),
+    }
+    default_fields = ('id', 'name')
+
+
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
+class BookApiList(BookResource, ApiListView):
+    ordering = ('title', 'id')
+
+
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
+class BookApiDetail(BookResource, ApiDetailView):
+    pass
+
+
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
+class AuthorApiList(AuthorResource, ApiListView):
+    ordering = ('sort_last_name', 'sort_first_name', 'id')
+
+
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
+class AuthorApiDetail(AuthorResource, ApiDetailView):
+    pass
+
+
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
+class CategoryApiList(CategoryResource, ApiListView):
+    ordering = ('name', 'id')
+
+
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
+class CategoryApiDetail(CategoryResource, ApiDetailView):
+    pass
+
+
+def _availability(request):
+    """Queryset of the books listed in ``?ids=`` or a 400 response."""
+    try:
+        ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()]
+    except ValueError:
+        return _json({'error': 'ids doit être une liste de nombres.'}, status=400)
+    if not ids or len(ids) > MAX_LIMIT:
+        return _json({'error': f'Entre 1 et {MAX_LIMIT} identifiants.'}, status=400)
+    return Book.objects.filter(pk__in=ids).values('id', 'copies_available', 'copies_total').order_by('id')
+
+
+def _availability_row(row):
+    return dict(row, available=row['copies_available'] > 0)
+
+
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
+class AvailabilityApi(View):
+    """``?ids=1,2,3``: copies of up to MAX_LIMIT books in one query."""
+
+    def get(self, request, *args, **kwargs):
+        rows = _availability(request)
+        if isinstance(rows, JsonResponse):
+            return rows
+        return _json({'results': [_availability_row(row) for row in rows]})
+
+
+@use_replica
+@cache_catalog_page
+async def availability_async(request):
+    """AvailabilityApi for the ASGI deployment."""
+    rows = _availability(request)
+    if isinstance(rows, JsonResponse):
+        return rows
+    return _json({'results': [_availability_row(row) async for row in rows]})
+
+
+@use_replica
+@cache_catalog_page
+def book_typeahead(request):
+    """``?q=``: up to TYPEAHEAD_LIMIT books by ISBN or title prefix, for the
+    book pickers of the loan and hold forms (books.widgets.BookPicker)."""
+    q = request.GET.get('q', '').strip()
+    if len(q) < TYPEAHEAD_MIN_LENGTH:
+        return _json({'results': []})
+    rows = Book.objects.values(
+        'id', 'title', 'isbn', 'copies_available',
+        author_first_name=F('author__first_name'), author_last_name=F('author__last_name'),
+    )
+    return _json({'results': suggest_books(rows, q, limit=TYPEAHEAD_LIMIT)})
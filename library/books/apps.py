@@ -11,3 +11,5 @@ class BooksConfig(AppConfig):
             from . import signals  # noqa: F401
         except Exception:
             pass
+        # the optional in-process overdue sweeper is started by the server
+        # entry points (library_project/wsgi.py, asgi.py): see books.sweeper
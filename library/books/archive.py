@@ -0,0 +1,84 @@
+"""Archive tier of the loans.
+
+Closed loans (returned or canceled) make up most of Loan as the years go by,
+while the hot paths (checkout, the active and late lists, the card limits)
+only care about the others. archive_loans() moves the loans closed more than
+BOOKS_LOAN_ARCHIVE_AFTER_DAYS ago to LoanArchive, same id and columns, one
+batch per transaction: each batch copies the rows into the archive with an
+``INSERT ... SELECT`` and deletes them from Loan, so a loan is always in
+exactly one of the tables.
+Run it with ``manage.py archive_loans`` (cron).
+
+The readers of the whole history go through this module or merge both
+tables themselves: the card history (MergedCursorPaginator), the exports
+(books.exports.loan_querysets) and the fines report (fines_report()).
+"""
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Loan, LoanArchive
+
+BATCH_SIZE = 2000
+# ids per statement (SQLite builds may allow as few as 999 parameters)
+ID_CHUNK = 900
+COLUMNS = [field.column for field in LoanArchive._meta.concrete_fields]
+
+
+def archive_after():
+    return datetime.timedelta(days=getattr(settings, 'BOOKS_LOAN_ARCHIVE_AFTER_DAYS', 365))
+
+
+def archivable(now=None, after=None):
+    """Loans closed before `now` - `after` (canceled ones without a return
+    date count from their due date)."""
+    cutoff = (now or timezone.now()) - (after if after is not None else archive_after())
+    return Loan.objects.filter(
+        Q(returned_at__lt=cutoff) | Q(returned_at__isnull=True, due_date__lt=cutoff),
+        status__in=Loan.CLOSED_STATUSES,
+    )
+
+
+def archive_loans(now=None, after=None, batch_size=BATCH_SIZE, limit=None):
+    """Move the archivable loans to LoanArchive, `batch_size` per transaction
+    and at most `limit`. Yields the number moved by each batch."""
+    loans = archivable(now, after)
+    connection = connections[loans.db]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in COLUMNS)
+    copy = (f'INSERT INTO {quote(LoanArchive._meta.db_table)} ({columns}) '
+            f'SELECT {columns} FROM {quote(Loan._meta.db_table)} WHERE id IN ({{}})')
+    last_id = 0
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        with transaction.atomic(using=loans.db):
+            ids = list(loans.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:size])
+            if not ids:
+                return
+            for start in range(0, len(ids), ID_CHUNK):
+                chunk = ids[start:start + ID_CHUNK]
+                with connection.cursor() as cursor:
+                    cursor.execute(copy.format(', '.join(['%s'] * len(chunk))), chunk)
+                # closed loans: no copy or card slot to give back, so no
+                # per-row post_delete signals to run
+                Loan.objects.filter(id__in=chunk)._raw_delete(loans.db)
+        last_id = ids[-1]
+        moved += len(ids)
+        yield len(ids)
+
+
+def fines_report(by='card', now=None):
+    """LoanQuerySet.fines_report() over the live and the archived loans."""
+    key = 'card_number' if by == 'card' else 'month'
+    rows = defaultdict(lambda: {'loans': 0, 'days': 0, 'total': 0})
+    for model in (Loan, LoanArchive):
+        for row in model.objects.fines_report(by=by, now=now):
+            merged = rows[row[key]]
+            for name in ('loans', 'days', 'total'):
+                merged[name] += row[name]
+    return [{key: value, **totals} for value, totals in sorted(rows.items())]
@@ -0,0 +1,240 @@
+"""Versioned response cache for the catalog pages.
+
+Rendered pages are cached under the URL, the query string and a *catalog
+version*. Any write that can change what a catalog page shows (Book, Author,
+Category, Loan signals, and the set-based services that bypass them) calls
+``catalog_changed()``, which bumps the version: older entries are simply
+never looked up again and expire on their own.
+
+Responses carry ``ETag`` and ``Last-Modified`` so browsers and reverse proxies
+revalidate with a conditional GET and get a 304 without a body.
+
+Below the page cache, each rendered ``partials/book_card.html`` is cached per
+book; ``catalog_changed(book_ids)`` drops the cards of the books that changed
+and a list page fetches all of its cards with one multi-get.
+
+The version lives in the default cache, which must therefore be shared by all
+worker processes (memcached, redis...) in production.
+
+With read replicas (books.replicas), a page or card rendered from a replica
+shortly after a change may predate it: it is kept only until the replica lag
+has passed (_store_timeout()), and the requests pinned to the primary neither
+read nor fill the page cache.
+"""
+import hashlib
+import math
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import replicas
+
+VERSION_KEY = 'books:catalog:version'
+CHANGED_KEY = 'books:catalog:changed'
+
+CARD_TEMPLATE = 'partials/book_card.html'
+# bump when partials/book_card.html changes
+CARD_VERSION = 1
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _timeout():
+    return getattr(settings, 'BOOKS_PAGE_CACHE_TIMEOUT', 600)
+
+
+def _store_timeout(changed=None):
+    """Lifetime of what the request just rendered: _timeout(), unless it was
+    read from a replica that may not have caught up with the last change
+    (at `changed`, a timestamp)."""
+    timeout = _timeout()
+    if not replicas.used_replica():
+        return timeout
+    if changed is None:
+        changed = catalog_version()[1]
+    remaining = changed + replicas.replica_lag() - time.time()
+    return timeout if remaining <= 0 else min(timeout, math.ceil(remaining))
+
+
+def catalog_version():
+    """Current ``(version, last change as a timestamp)``."""
+    values = cache.get_many([VERSION_KEY, CHANGED_KEY])
+    version, changed = values.get(VERSION_KEY), values.get(CHANGED_KEY)
+    if version is None:
+        # start from the clock so a flushed cache never reuses old versions
+        now = time.time()
+        cache.add(VERSION_KEY, int(now * 1000), None)
+        cache.add(CHANGED_KEY, now, None)
+        return cache.get(VERSION_KEY, int(now * 1000)), now
+    return version, changed or time.time()
+
+
+def _bump(book_ids=()):
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+    cache.set(CHANGED_KEY, time.time(), None)
+    if book_ids:
+        cache.delete_many([card_key(pk) for pk in book_ids])
+
+
+def catalog_changed(book_ids=()):
+    """Invalidate every cached catalog page and the cards of `book_ids`."""
+    book_ids = list(book_ids)
+    _bump(book_ids)
+    # a page rendered between this bump and COMMIT would still show the old
+    # data under the new version: bump once more when the write is visible
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(book_ids))
+
+
+def card_key(book_id):
+    return f'books:card:{CARD_VERSION}:{book_id}'
+
+
+def render_book_cards(books):
+    """Rendered card of each book, reusing cached HTML (one multi-get) and
+    storing the cards that had to be rendered (one multi-set)."""
+    keys = {book.pk: card_key(book.pk) for book in books}
+    cached = cache.get_many(list(keys.values()))
+    cards, fresh = [], {}
+    for book in books:
+        html = cached.get(keys[book.pk])
+        if html is None:
+            html = fresh[keys[book.pk]] = render_to_string(CARD_TEMPLATE, {'book': book})
+        cards.append(mark_safe(html))
+    if fresh:
+        cache.set_many(fresh, _store_timeout())
+    return cards
+
+
+def record(hit):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+
+
+def stats():
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 4) if total else None}
+
+
+def page_key(request, version):
+    query = '&'.join(sorted(request.GET.urlencode().split('&')))
+    raw = f'{request.path}?{query}|{getattr(request, "LANGUAGE_CODE", "")}'
+    return f'books:page:{version}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def _has_messages(request):
+    return hasattr(request, '_messages') and len(messages.get_messages(request)) > 0
+
+
+def _cacheable(request):
+    # pages showing flash messages are per-user, and a page cached from a
+    # lagging replica could hide a write of the pinned request's own:
+    # neither served from nor stored in the cache
+    return (request.method in ('GET', 'HEAD') and _timeout() and not replicas.pinned()
+            and not _has_messages(request))
+
+
+async def _acacheable(request):
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        # messages may live in the session, which is loaded by a sync query
+        return await sync_to_async(_cacheable)(request)
+    return _cacheable(request)
+
+
+def _entry(response, changed):
+    """``(response, cache entry)``; the entry is None for responses not to cache."""
+    if hasattr(response, 'render') and callable(response.render):
+        response = response.render()
+    if response.status_code != 200 or response.streaming:
+        return response, None
+    return response, {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'etag': '"%s"' % hashlib.md5(response.content).hexdigest(),
+        'last_modified': int(changed),
+    }
+
+
+def _respond(request, entry, response=None):
+    if response is None:
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    # let clients and proxies keep the page but revalidate it every time
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified'], response=response,
+    )
+
+
+async def acatalog_version():
+    """catalog_version() for async views."""
+    values = await cache.aget_many([VERSION_KEY, CHANGED_KEY])
+    version, changed = values.get(VERSION_KEY), values.get(CHANGED_KEY)
+    if version is None:
+        now = time.time()
+        await cache.aadd(VERSION_KEY, int(now * 1000), None)
+        await cache.aadd(CHANGED_KEY, now, None)
+        return await cache.aget(VERSION_KEY, int(now * 1000)), now
+    return version, changed or time.time()
+
+
+def cache_catalog_page(view):
+    """Serve a GET view from the versioned page cache, with conditional GET
+    support. Works on sync and async views."""
+    if iscoroutinefunction(view):
+        return _acache_catalog_page(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable(request):
+            return view(request, *args, **kwargs)
+        version, changed = catalog_version()
+        key = page_key(request, version)
+        entry = cache.get(key)
+        record(hit=entry is not None)
+        if entry is not None:
+            return _respond(request, entry)
+        response, entry = _entry(view(request, *args, **kwargs), changed)
+        if entry is None:
+            return response
+        cache.set(key, entry, _store_timeout(changed))
+        return _respond(request, entry, response)
+    return wrapper
+
+
+def _acache_catalog_page(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await _acacheable(request):
+            return await view(request, *args, **kwargs)
+        version, changed = await acatalog_version()
+        key = page_key(request, version)
+        entry = await cache.aget(key)
+        record(hit=entry is not None)
+        if entry is not None:
+            return _respond(request, entry)
+        response, entry = _entry(await view(request, *args, **kwargs), changed)
+        if entry is None:
+            return response
+        await cache.aset(key, entry, _store_timeout(changed))
+        return _respond(request, entry, response)
+    return wrapper
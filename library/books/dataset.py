@@ -0,0 +1,386 @@
+"""Synthetic catalog and loan history at production scale.
+
+``manage.py generate_dataset`` drives it. Categories, authors, books, borrower
+cards and loans are derived from a seed:
+
+- books get valid ISBN-13s (978 prefix, bodies spread over the whole range)
+  and 1 to 9 copies, the popular titles having more;
+- loan popularity is Zipfian: a book of popularity rank r is drawn with a
+  weight 1/(r + q), q = books/1000 flattening the head so that a bestseller
+  does not take a few percent of all loans; ranks are scattered over the ids;
+- card activity is log-normal; loans are spread evenly over the history and
+  their ids follow borrowed_at, as in production;
+- a loan is canceled (1 %), returned within the loan period, or returned
+  late (``overdue_rate``, mean delay 10 days) or never (2 % of the late ones).
+  Loans not returned by the end of the history are borrowed or late.
+
+Every chunk of rows is generated by its own random generator seeded with
+(seed, table, first row), so the same seed, volumes, end date and chunk size
+produce the same rows whatever the number of worker processes and the order
+they finish in. Primary keys are explicit.
+
+The chunks are inserted with bulk_create. Most of its cost is preparing the
+values in Python, which the worker processes do in parallel; there each
+statement is its own transaction, so that SQLite's single write lock is held
+for the statement only and not for a whole chunk. In process, a chunk is one
+transaction.
+"""
+import itertools
+import multiprocessing
+import random
+import unicodedata
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest, Least
+
+from .models import LOAN_PERIOD, MAX_ACTIVE_LOANS, Author, Book, BorrowerCard, Category, Loan
+
+PROFILES = {
+    'small': {'categories': 20, 'authors': 500, 'books': 5_000, 'cards': 2_000, 'loans': 50_000},
+    'medium': {'categories': 60, 'authors': 20_000, 'books': 100_000, 'cards': 20_000, 'loans': 1_000_000},
+    'large': {'categories': 150, 'authors': 100_000, 'books': 1_000_000, 'cards': 200_000, 'loans': 20_000_000},
+}
+CHUNK_SIZE = 20_000
+CANCEL_RATE = 0.01
+# share of the late loans never returned (lost books)
+LOST_RATE = 0.02
+MEAN_DAYS_LATE = 10
+
+GENRES = (
+    'Roman', 'Policier', 'Science-fiction', 'Fantasy', 'Poésie', 'Théâtre', 'Biographie', 'Histoire',
+    'Philosophie', 'Sciences', 'Jeunesse', 'Bande dessinée', 'Voyage', 'Cuisine', 'Art', 'Musique',
+    'Économie', 'Droit', 'Informatique', 'Santé', 'Sport', 'Nature', 'Religion', 'Psychologie',
+    'Essai', 'Nouvelles', 'Thriller', 'Romance', 'Horreur', 'Manga',
+)
+FIRST_NAMES = (
+    'Jean Marie Pierre Anne Louis Claire Paul Sophie Victor Émile Camille Hélène Jacques Isabelle '
+    'Michel Nathalie Alain Catherine Philippe Françoise André Monique Bernard Sylvie Henri Juliette '
+    'Georges Élise Lucien Margot Hugo Léa Thomas Chloé Antoine Manon Nicolas Inès Julien Zoé'
+).split()
+LAST_NAMES = (
+    'Martin Bernard Dubois Thomas Robert Richard Petit Durand Leroy Moreau Simon Laurent Lefebvre '
+    'Michel Garcia David Bertrand Roux Vincent Fournier Morel Girard André Lefèvre Mercier Dupont '
+    'Lambert Bonnet François Martinez Legrand Garnier Faure Rousseau Blanc Guérin Muller Henry '
+    'Roussel Nicolas Perrin Morin Mathieu Clément Gauthier Dumont Lopez Fontaine Chevalier Robin'
+).split()
+WORDS = (
+    'amour guerre paix nuit jour mer ciel terre feu ombre lumière secret voyage jardin maison rivière '
+    'montagne étoile histoire roi reine enfant silence chemin hiver été printemps automne rêve mémoire '
+    'ville forêt île temps vent neige sable pierre miroir porte fenêtre lettre nom visage cœur sang '
+    'or argent loup oiseau cheval fleuve désert empire royaume dernier premier grand petit noir blanc '
+    'rouge bleu long perdu oublié caché sauvage éternel'
+).split()
+LANGUAGES = (('français', 70), ('anglais', 18), ('espagnol', 4), ('allemand', 4), ('italien', 4))
+NATIONALITIES = (('France', 60), ('Belgique', 8), ('Suisse', 5), ('Canada', 7), ('États-Unis', 10),
+                 ('Royaume-Uni', 6), ('Espagne', 4))
+PUBLISHERS = (
+    'Gallimard', 'Flammarion', 'Albin Michel', 'Seuil', 'Grasset', 'Actes Sud', 'Fayard',
+    'Le Livre de Poche', 'Folio', 'Pocket', 'Hachette', 'Dargaud', 'Casterman', 'La Découverte',
+)
+
+
+def _ascii(text):
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower().replace(' ', '')
+
+
+def isbn13(n):
+    """The n-th valid ISBN-13 of the 978 prefix (0 <= n < 10**9)."""
+    body = f'978{n:09d}'
+    total = sum(int(ch) * (1 if i % 2 == 0 else 3) for i, ch in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def coprime(n, start):
+    """The first integer >= `start` coprime with `n`: ``i * p % n`` is then a permutation of range(n)."""
+    p = start
+    while n > 1 and _gcd(p, n) != 1:
+        p += 1
+    return p
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+def cum_weights(n, rng=None):
+    """Cumulative weights of ranks 0..n-1: Zipf-Mandelbrot 1/(r + q), or
+    log-normal draws of `rng` when given."""
+    if rng is not None:
+        return list(itertools.accumulate(rng.lognormvariate(0, 1) for _ in range(n)))
+    q = max(1, n // 1000)
+    return list(itertools.accumulate(1 / (r + q) for r in range(1, n + 1)))
+
+
+def _weighted(pairs):
+    return [value for value, _ in pairs], list(itertools.accumulate(weight for _, weight in pairs))
+
+
+class Dataset:
+    """The volumes and distributions of a dataset; builds its rows chunk by chunk."""
+
+    TABLES = ('categories', 'authors', 'books', 'loans')
+
+    def __init__(self, categories, authors, books, cards, loans, end, seed=42, years=5, overdue_rate=0.12):
+        self.volumes = {'categories': categories, 'authors': authors, 'books': books, 'loans': loans}
+        self.cards = cards
+        self.seed = seed
+        self.end = end
+        self.start = end - timedelta(days=round(365.25 * years))
+        self.overdue_rate = overdue_rate
+        # popularity rank -> id: multiplicative permutations, so that neither
+        # the popular books nor the prolific authors have neighbouring ids
+        self.book_step = coprime(books, 7_919)
+        self.book_rank_inverse = pow(self.book_step, -1, books) if books > 1 else 0
+        self.author_step = coprime(authors, 104_729)
+        self.book_weights = cum_weights(books)
+        self.author_weights = cum_weights(authors)
+        self.category_weights = cum_weights(categories)
+        self.card_weights = cum_weights(cards, random.Random(f'{seed}:cards'))
+        self.languages = _weighted(LANGUAGES)
+        self.nationalities = _weighted(NATIONALITIES)
+        self.ascii_first_names = [_ascii(name) for name in FIRST_NAMES]
+        self.ascii_last_names = [_ascii(name) for name in LAST_NAMES]
+
+    def rng(self, table, start):
+        return random.Random(f'{self.seed}:{table}:{start}')
+
+    def chunks(self, table, size=CHUNK_SIZE):
+        total = self.volumes[table]
+        return [(table, start, min(start + size, total)) for start in range(0, total, size)]
+
+    def build(self, table, start, stop):
+        """Model instances of rows [start, stop) of `table` (ids start + 1...)."""
+        return getattr(self, f'_{table}')(self.rng(table, start), start, stop)
+
+    def _categories(self, rng, start, stop):
+        return [
+            Category(id=i + 1, name=GENRES[i % len(GENRES)] + (f' {i // len(GENRES) + 1}' if i >= len(GENRES) else ''))
+            for i in range(start, stop)
+        ]
+
+    def _author_name(self, i):
+        # first name, then the base-len(LAST_NAMES) digits of the rest as a
+        # compound last name: unique for every i
+        rest = i // len(FIRST_NAMES)
+        parts = [LAST_NAMES[rest % len(LAST_NAMES)]]
+        rest //= len(LAST_NAMES)
+        while rest:
+            parts.append(LAST_NAMES[rest % len(LAST_NAMES)])
+            rest //= len(LAST_NAMES)
+        return FIRST_NAMES[i % len(FIRST_NAMES)], '-'.join(parts)
+
+    def _authors(self, rng, start, stop):
+        authors = []
+        nationalities, nationality_weights = self.nationalities
+        for i in range(start, stop):
+            first_name, last_name = self._author_name(i)
+            born = rng.randint(1850, 2000)
+            birth_date = self.end.date().replace(year=born, month=rng.randint(1, 12), day=rng.randint(1, 28))
+            death = born + rng.randint(40, 95) if born < 1950 and rng.random() < 0.7 else None
+            authors.append(Author(
+                id=i + 1, first_name=first_name, last_name=last_name, birth_date=birth_date,
+                date_of_death=birth_date.replace(year=death) if death and death < self.end.year else None,
+                nationality=rng.choices(nationalities, cum_weights=nationality_weights)[0],
+            ))
+        return authors
+
+    def book_rank(self, book_id):
+        """Popularity rank (0 = most borrowed) of a book id."""
+        return (book_id - 1) * self.book_rank_inverse % self.volumes['books']
+
+    def _books(self, rng, start, stop):
+        n_authors, n_categories = self.volumes['authors'], self.volumes['categories']
+        q = max(1, self.volumes['books'] // 1000)
+        languages, language_weights = self.languages
+        added_span = (self.start - self.start.replace(year=self.start.year - 5)).total_seconds()
+        books = []
+        for i in range(start, stop):
+            rank = self.book_rank(i + 1)
+            author_rank = rng.choices(range(n_authors), cum_weights=self.author_weights)[0]
+            category = None
+            if n_categories and rng.random() < 0.95:
+                category = rng.choices(range(n_categories), cum_weights=self.category_weights)[0] + 1
+            books.append(Book(
+                id=i + 1,
+                title=' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))).capitalize(),
+                # spread over the ISBN range rather than consecutive numbers
+                isbn=isbn13(i * 387_420_489 % 10 ** 9),
+                author_id=author_rank * self.author_step % n_authors + 1,
+                category_id=category,
+                publication_year=min(self.end.year, 1900 + int(rng.betavariate(5, 1.5) * 126)),
+                language=rng.choices(languages, cum_weights=language_weights)[0],
+                pages=max(32, int(rng.gauss(280, 120))),
+                publisher=rng.choice(PUBLISHERS),
+                price=Decimal(rng.randint(499, 3999)) / 100,
+                copies_total=1 + int(7 / (1 + rank / q)) + (rng.random() < 0.2),
+                date_added=self.start - timedelta(seconds=rng.uniform(0, added_span)),
+            ))
+            books[-1].copies_available = books[-1].copies_total
+        return books
+
+    def card(self, index):
+        """``(card number, borrower name, email)`` of card `index`."""
+        first = index % len(FIRST_NAMES)
+        last = index // len(FIRST_NAMES) % len(LAST_NAMES)
+        return (
+            f'L{index + 1:07d}',
+            f'{FIRST_NAMES[first]} {LAST_NAMES[last]}',
+            f'{self.ascii_first_names[first]}.{self.ascii_last_names[last]}.{index + 1}@example.org',
+        )
+
+    def _loans(self, rng, start, stop):
+        n_books, total = self.volumes['books'], self.volumes['loans']
+        span = (self.end - self.start).total_seconds()
+        books = rng.choices(range(n_books), cum_weights=self.book_weights, k=stop - start)
+        cards = rng.choices(range(self.cards), cum_weights=self.card_weights, k=stop - start)
+        loans = []
+        for i, rank, card in zip(range(start, stop), books, cards):
+            borrowed_at = self.start + timedelta(seconds=span * (i + rng.random()) / total)
+            due_date = borrowed_at + LOAN_PERIOD
+            returned_at = None
+            if rng.random() < CANCEL_RATE:
+                status = Loan.STATUS_CANCELED
+            else:
+                if rng.random() >= self.overdue_rate:
+                    returned_at = borrowed_at + timedelta(seconds=rng.uniform(3600, LOAN_PERIOD.total_seconds()))
+                elif rng.random() >= LOST_RATE:
+                    returned_at = due_date + timedelta(days=rng.expovariate(1 / MEAN_DAYS_LATE))
+                if returned_at is not None and returned_at <= self.end:
+                    status = Loan.STATUS_RETURNED
+                else:
+                    returned_at = None
+                    status = Loan.STATUS_LATE if due_date < self.end else Loan.STATUS_BORROWED
+            card_number, name, email = self.card(card)
+            loans.append(Loan(
+                id=i + 1, book_id=rank * self.book_step % n_books + 1,
+                card_number=card_number, borrower_name=name, borrower_email=email,
+                borrowed_at=borrowed_at, due_date=due_date, returned_at=returned_at, status=status,
+            ))
+        return loans
+
+
+MODELS = {'categories': Category, 'authors': Author, 'books': Book, 'loans': Loan}
+
+
+@contextmanager
+def historical_dates():
+    """Keep the generated Book.date_added and Loan.borrowed_at (auto_now_add)."""
+    fields = [Book._meta.get_field('date_added'), Loan._meta.get_field('borrowed_at')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def insert(model, objs):
+    """bulk_create `objs` one statement (and one transaction) at a time."""
+    batch_size = max(connection.ops.bulk_batch_size(model._meta.concrete_fields, objs), 1)
+    for i in range(0, len(objs), batch_size):
+        model.objects.bulk_create(objs[i:i + batch_size])
+
+
+def insert_chunk(dataset, table, start, stop, atomic=True):
+    objs = dataset.build(table, start, stop)
+    with historical_dates(), transaction.atomic() if atomic else nullcontext():
+        insert(MODELS[table], objs)
+    return stop - start
+
+
+# the dataset of the forked workers, inherited from the parent
+_dataset = None
+
+
+def _init_worker():
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            # the other workers hold the lock one statement at a time: wait
+            cursor.execute('PRAGMA busy_timeout = 60000')
+            # a crash leaves a half-generated dataset to regenerate anyway
+            cursor.execute('PRAGMA synchronous = OFF')
+
+
+def _insert_chunk(chunk):
+    return insert_chunk(_dataset, *chunk, atomic=False)
+
+
+def run(dataset, table, workers=0, chunk_size=CHUNK_SIZE):
+    """Insert the rows of `table`, in `workers` forked processes (or in this
+    one for 0); yield the number of rows of each chunk as it is stored."""
+    global _dataset
+    chunks = dataset.chunks(table, chunk_size)
+    if not workers or len(chunks) < 2:
+        for chunk in chunks:
+            yield insert_chunk(dataset, *chunk)
+        return
+    # forked: the children share the weights tables; they open their own connections
+    connections.close_all()
+    _dataset = dataset
+    try:
+        with multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker) as pool:
+            yield from pool.imap_unordered(_insert_chunk, chunks)
+    finally:
+        _dataset = None
+
+
+def _active_loans():
+    return Loan.objects.exclude(status__in=Loan.CLOSED_STATUSES)
+
+
+def cap_active_loans(end):
+    """Close (as returned on their due date) the oldest active loans of the
+    cards holding more than MAX_ACTIVE_LOANS; return how many."""
+    over = list(
+        _active_loans().values('card_number').annotate(n=Count('id'))
+        .filter(n__gt=MAX_ACTIVE_LOANS).order_by().values_list('card_number', flat=True)
+    )
+    ids = []
+    for card_number in over:
+        ids.extend(
+            _active_loans().filter(card_number=card_number)
+            .order_by('-borrowed_at', '-id').values_list('pk', flat=True)[MAX_ACTIVE_LOANS:]
+        )
+    for i in range(0, len(ids), 500):
+        Loan.objects.filter(pk__in=ids[i:i + 500]).update(
+            status=Loan.STATUS_RETURNED, returned_at=Least(F('due_date'), Value(end)),
+        )
+    return len(ids)
+
+
+def adjust_copies():
+    """Make copies_available = copies_total - active loans, raising
+    copies_total where a book has more active loans than copies."""
+    books = defaultdict(list)
+    for row in _active_loans().values('book_id').annotate(n=Count('id')).order_by():
+        books[row['n']].append(row['book_id'])
+    for n, ids in books.items():
+        total = Greatest(F('copies_total'), Value(n))
+        for i in range(0, len(ids), 500):
+            Book.objects.filter(pk__in=ids[i:i + 500]).update(copies_total=total, copies_available=total - n)
+
+
+def reset_sequences():
+    """Move the id sequences past the explicit primary keys (no-op on SQLite)."""
+    statements = connection.ops.sequence_reset_sql(no_style(), list(MODELS.values()))
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def delete_all():
+    """Empty the catalog and loan tables with plain DELETEs (no signals)."""
+    from .models import Hold, LoanArchive, SweeperState
+    with connection.cursor() as cursor:
+        for model in (Hold, Loan, LoanArchive, BorrowerCard, SweeperState, Book, Author, Category):
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
@@ -0,0 +1,135 @@
+"""Streaming exports of loans and of the catalog.
+
+Rows come from ``values_list().iterator()``: no model instances are built and
+the database cursor is read ``CHUNK_SIZE`` rows at a time, so memory stays
+flat however many rows are exported. Days overdue and penalty are annotated
+by the database (LoanQuerySet.with_penalties), not computed per row.
+
+The loan exports read Loan and LoanArchive (books.archive) as one table: both
+are read in id order and merged as they stream.
+"""
+import csv
+import datetime
+import heapq
+import json
+from decimal import Decimal
+from operator import itemgetter
+
+from django.utils import timezone
+
+from .models import Book, Loan, LoanArchive
+
+CHUNK_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+# (column, queryset field)
+LOAN_COLUMNS = [
+    ('id', 'id'),
+    ('book_id', 'book_id'),
+    ('isbn', 'book__isbn'),
+    ('title', 'book__title'),
+    ('card_number', 'card_number'),
+    ('borrower_name', 'borrower_name'),
+    ('borrower_email', 'borrower_email'),
+    ('status', 'status'),
+    ('borrowed_at', 'borrowed_at'),
+    ('due_date', 'due_date'),
+    ('returned_at', 'returned_at'),
+    ('overdue_days', 'overdue_days'),
+    ('penalty', 'penalty'),
+]
+
+BOOK_COLUMNS = [
+    ('id', 'id'),
+    ('isbn', 'isbn'),
+    ('title', 'title'),
+    ('author_first_name', 'author__first_name'),
+    ('author_last_name', 'author__last_name'),
+    ('category', 'category__name'),
+    ('publication_year', 'publication_year'),
+    ('language', 'language'),
+    ('publisher', 'publisher'),
+    ('pages', 'pages'),
+    ('price', 'price'),
+    ('copies_total', 'copies_total'),
+    ('copies_available', 'copies_available'),
+]
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def loan_queryset(status=None, since=None, until=None, card_number=None, now=None, model=Loan):
+    """Loans borrowed between `since` and `until` (dates, inclusive), with
+    their overdue days and penalty as of `now`."""
+    qs = model.objects.with_penalties(now)
+    if status:
+        qs = qs.filter(status=status)
+    if since:
+        qs = qs.filter(borrowed_at__gte=_day_start(since))
+    if until:
+        qs = qs.filter(borrowed_at__lt=_day_start(until + datetime.timedelta(days=1)))
+    if card_number:
+        qs = qs.filter(card_number=card_number)
+    return qs.order_by('id')
+
+
+def loan_querysets(status=None, since=None, until=None, card_number=None, now=None):
+    """loan_queryset() of the live and of the archived loans, for stream()."""
+    querysets = [loan_queryset(status, since, until, card_number, now)]
+    # only closed loans are archived
+    if not status or status in Loan.CLOSED_STATUSES:
+        querysets.insert(0, loan_queryset(status, since, until, card_number, now, model=LoanArchive))
+    return querysets
+
+
+def book_queryset():
+    return Book.objects.order_by('id')
+
+
+def _cell(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # amounts (price, penalty): SQLite hands back computed ones unquantized
+        return f'{value:.2f}'
+    return value
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def stream(queryset, columns, fmt='csv', chunk_size=CHUNK_SIZE):
+    """Yield the export as text, one string per `chunk_size` rows.
+
+    `queryset` may be a list of querysets ordered by the first column, merged
+    on it (loan_querysets())."""
+    headers = [name for name, _ in columns]
+    fields = [field for _, field in columns]
+    if isinstance(queryset, (list, tuple)):
+        rows = heapq.merge(*(qs.values_list(*fields).iterator(chunk_size=chunk_size) for qs in queryset),
+                           key=itemgetter(0))
+    else:
+        rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(headers)
+        line = lambda row: writer.writerow(['' if v is None else _cell(v) for v in row])
+    elif fmt == 'jsonl':
+        line = lambda row: json.dumps(dict(zip(headers, map(_cell, row))), ensure_ascii=False) + '\n'
+    else:
+        raise ValueError(f'unknown format {fmt!r}')
+    buffer = []
+    for row in rows:
+        buffer.append(line(row))
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,36 @@
+"""Database functions Django doesn't ship in a portable form."""
+from django.db.models import Func, IntegerField, Lookup
+
+
+class DaysBetween(Func):
+    """Whole days from `start` to `end` (two datetimes), like ``(end - start).days``
+    for positive intervals."""
+    arity = 2
+    output_field = IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL / Oracle: day part of the interval
+        return super().as_sql(compiler, connection, template='CAST(EXTRACT(DAY FROM (%(expressions)s)) AS INTEGER)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        end, start = self.source_expressions
+        return Func(start, end, function='TIMESTAMPDIFF', output_field=IntegerField()).as_sql(
+            compiler, connection, template='TIMESTAMPDIFF(DAY, %(expressions)s)', **extra_context
+        )
+
+
+
+class Match(Lookup):
+    """SQLite full-text condition ``<FTS5 column> MATCH <query>`` (``__match``)."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
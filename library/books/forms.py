@@ -1,5 +1,6 @@
 from django import forms
-from .models import Loan, Book
+from .models import Loan, BorrowerCard, Hold, MAX_ACTIVE_LOANS
+from .widgets import BookPicker
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
@@ -8,20 +9,58 @@ class LoanCreateForm(forms.ModelForm):
     class Meta:
         model = Loan
         fields = ['book', 'borrower_name', 'borrower_email', 'card_number', 'comments']
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Limit the book choices to those with available copies
-        self.fields['book'].queryset = Book.objects.filter(copies_available__gt=0).order_by('title')
+        # every book (a patron may come for the copy their hold set aside),
+        # picked by typeahead: only the submitted id is looked up
+        widgets = {'book': BookPicker}
 
     def clean(self):
         cleaned = super().clean()
         book = cleaned.get('book')
         card = cleaned.get('card_number')
-        if book and book.copies_available <= 0:
-            raise ValidationError("Ce livre n'a pas d'exemplaires disponibles.")
+        if book and book.copies_available <= 0 and not (card and Hold.is_ready(book.pk, card)):
+            raise ValidationError("Ce livre n'a pas d'exemplaires disponibles. Vous pouvez le réserver.")
         if card:
-            active = Loan.objects.filter(card_number=card).exclude(status__in=[Loan.STATUS_RETURNED, Loan.STATUS_CANCELED]).count()
-            if active >= 5:
+            if BorrowerCard.active_count(card) >= MAX_ACTIVE_LOANS:
                 raise ValidationError('Cet usager a déjà 5 emprunts actifs.')
         return cleaned
+
+
+class BatchCheckoutForm(forms.Form):
+    """Borrower part of a multi-item (kiosk) checkout; the basket itself is
+    validated by services.checkout_batch."""
+    borrower_name = forms.CharField(max_length=200)
+    borrower_email = forms.EmailField()
+    card_number = forms.CharField(max_length=50)
+    comments = forms.CharField(required=False)
+    book_ids = forms.JSONField()
+
+    def clean_book_ids(self):
+        ids = self.cleaned_data['book_ids']
+        if not isinstance(ids, list) or not ids:
+            raise ValidationError('Liste de livres attendue.')
+        try:
+            return [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            raise ValidationError('Identifiants de livre invalides.')
+
+
+class LoanExportForm(forms.Form):
+    """Filters of the loan export (query string)."""
+    status = forms.ChoiceField(choices=[('', '')] + Loan.STATUS_CHOICES, required=False)
+    since = forms.DateField(required=False)
+    until = forms.DateField(required=False)
+    card_number = forms.CharField(max_length=50, required=False)
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], required=False)
+
+
+class HoldCreateForm(forms.ModelForm):
+    class Meta:
+        model = Hold
+        fields = ['book', 'borrower_name', 'borrower_email', 'card_number']
+        widgets = {'book': BookPicker}
+
+    def clean_book(self):
+        book = self.cleaned_data['book']
+        if book.copies_available > 0:
+            raise ValidationError('Un exemplaire est disponible : empruntez-le directement.')
+        return book
@@ -0,0 +1,205 @@
+"""Bulk catalog import from CSV or JSON Lines.
+
+Records are read lazily and handled in chunks: each chunk is validated in
+Python, its authors and categories are resolved through in-memory maps (one
+query per chunk for the names not seen yet), and its books are upserted on
+``isbn`` with a single ``bulk_create``. ``manage.py import_catalog`` drives it
+and adds progress reporting and a resumable checkpoint.
+
+Recognised columns: ``isbn`` and ``title`` (required), ``author`` ("Prénom
+Nom") or ``author_first_name``/``author_last_name``, ``category``,
+``publication_year``, ``copies`` (or ``copies_total``), ``language``,
+``pages``, ``publisher``, ``description``, ``price``. ISBN-10 values are
+converted to ISBN-13.
+"""
+import csv
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import search
+from .cache import catalog_changed
+from .models import Author, Book, Category, normalize_isbn
+
+FORMATS = ('csv', 'jsonl')
+
+# copies are only set on creation: on an existing book copies_available
+# depends on its loans and is not the importer's business
+UPDATE_FIELDS = [
+    'title', 'author', 'category', 'publication_year', 'language',
+    'pages', 'publisher', 'description', 'price',
+]
+
+
+class RowError(Exception):
+    pass
+
+
+def guess_format(path):
+    return 'jsonl' if str(path).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_records(stream, fmt='csv', delimiter=','):
+    """Yield ``(line number, record)`` from a text stream; `record` is a
+    dict, or a RowError for a line that could not be parsed."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream, delimiter=delimiter)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_num, RowError(f'JSON invalide : {exc}')
+                continue
+            if not isinstance(record, dict):
+                record = RowError('Objet JSON attendu.')
+            yield line_num, record
+    else:
+        raise ValueError(f'unknown format {fmt!r}')
+
+
+def _text(record, *names):
+    for name in names:
+        value = record.get(name)
+        if value not in (None, ''):
+            return str(value).strip()
+    return ''
+
+
+def _integer(record, name, default=None, minimum=0):
+    value = _text(record, name)
+    if not value:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise RowError(f'{name} : nombre entier attendu.')
+    if value < minimum:
+        raise RowError(f'{name} : doit être supérieur ou égal à {minimum}.')
+    return value
+
+
+def _fits(value, model, field, name):
+    """`value`, or RowError when it exceeds `model`.`field`'s max_length."""
+    max_length = model._meta.get_field(field).max_length
+    if value and len(value) > max_length:
+        raise RowError(f'{name} : trop long ({max_length} caractères au plus).')
+    return value
+
+
+def parse_record(record):
+    """Validate one input record; returns the book fields plus the author and
+    category keys, or raises RowError."""
+    try:
+        isbn = normalize_isbn(record.get('isbn'))
+    except ValidationError as exc:
+        raise RowError(f'isbn : {" ".join(exc.messages)}')
+    title = _text(record, 'title')
+    if not title:
+        raise RowError('title : titre manquant.')
+    if len(title) > Book._meta.get_field('title').max_length:
+        raise RowError('title : titre trop long.')
+    first_name, last_name = _text(record, 'author_first_name'), _text(record, 'author_last_name')
+    if not (first_name or last_name):
+        # "Jean de La Fontaine": the first word is the first name
+        first_name, _, last_name = _text(record, 'author').partition(' ')
+        if not last_name:
+            first_name, last_name = '', first_name
+    if not last_name:
+        raise RowError('author : auteur manquant.')
+    _fits(first_name, Author, 'first_name', 'author')
+    _fits(last_name, Author, 'last_name', 'author')
+    price = _text(record, 'price') or '0'
+    try:
+        price = Decimal(price.replace(',', '.'))
+    except InvalidOperation:
+        raise RowError('price : montant invalide.')
+    year = _integer(record, 'publication_year', minimum=1450)
+    if year and year > date.today().year:
+        raise RowError('publication_year : année dans le futur.')
+    copies = _integer(record, 'copies', default=None)
+    if copies is None:
+        copies = _integer(record, 'copies_total', default=1)
+    return {
+        'isbn': isbn,
+        'title': title,
+        'author': (first_name, last_name),
+        'category': _fits(_text(record, 'category'), Category, 'name', 'category') or None,
+        'publication_year': year,
+        'copies_total': copies,
+        'copies_available': copies,
+        'language': _fits(_text(record, 'language'), Book, 'language', 'language'),
+        'pages': _integer(record, 'pages'),
+        'publisher': _fits(_text(record, 'publisher'), Book, 'publisher', 'publisher'),
+        'description': _text(record, 'description'),
+        'price': price,
+    }
+
+
+class CatalogImporter:
+    """Upserts chunks of parsed records; remembers the authors and categories
+    it has already resolved across chunks."""
+
+    def __init__(self):
+        self.authors = {}
+        self.categories = {}
+
+    def _resolve_authors(self, keys):
+        missing = {key for key in keys if key not in self.authors}
+        if not missing:
+            return
+        existing = Author.objects.filter(last_name__in={last for _, last in missing})
+
+        def lookup():
+            return {
+                (first or '', last or ''): pk
+                for first, last, pk in existing.values_list('first_name', 'last_name', 'pk')
+            }
+
+        found = lookup()
+        new = [Author(first_name=first, last_name=last) for first, last in missing if (first, last) not in found]
+        if new:
+            # another import may have created some of them meanwhile
+            Author.objects.bulk_create(new, ignore_conflicts=True)
+            found = lookup()
+        self.authors.update((key, found[key]) for key in missing)
+
+    def _resolve_categories(self, names):
+        missing = {name for name in names if name and name not in self.categories}
+        if not missing:
+            return
+        Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+        self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'pk'))
+
+    def import_chunk(self, parsed):
+        """Upsert a list of parsed records in one transaction; returns the ids
+        of the books written."""
+        # the same ISBN twice in a chunk: the last one wins
+        parsed = list({row['isbn']: row for row in parsed}.values())
+        if not parsed:
+            return []
+        with transaction.atomic():
+            self._resolve_authors({row['author'] for row in parsed})
+            self._resolve_categories({row['category'] for row in parsed})
+            books = []
+            for row in parsed:
+                fields = dict(row)
+                fields['author_id'] = self.authors[fields.pop('author')]
+                category = fields.pop('category')
+                fields['category_id'] = self.categories[category] if category else None
+                books.append(Book(**fields))
+            Book.objects.bulk_create(
+                books, update_conflicts=True, unique_fields=['isbn'], update_fields=UPDATE_FIELDS,
+            )
+            ids = list(Book.objects.filter(isbn__in=[b.isbn for b in books]).values_list('pk', flat=True))
+            # bulk_create sends no signals: keep search and caches in step ourselves
+            search.get_backend().index_books(ids)
+            catalog_changed(ids)
+        return ids
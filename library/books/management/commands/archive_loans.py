@@ -0,0 +1,37 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace les emprunts clos depuis plus de BOOKS_LOAN_ARCHIVE_AFTER_DAYS jours vers "
+        "l'archive (LoanArchive), par lots transactionnels. Voir books.archive."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Âge minimal de la clôture, en jours (remplace le réglage).')
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help='Emprunts par transaction.')
+        parser.add_argument('--limit', type=int, help="Nombre maximal d'emprunts à déplacer.")
+        parser.add_argument('--dry-run', action='store_true', help='Compter seulement.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or (options['days'] is not None and options['days'] < 0):
+            raise CommandError('--batch-size et --days doivent être positifs.')
+        after = datetime.timedelta(days=options['days']) if options['days'] is not None else None
+        if options['dry_run']:
+            self.stdout.write(f'{archive.archivable(after=after).count()} emprunt(s) à archiver.')
+            return
+        start = time.perf_counter()
+        moved = 0
+        for count in archive.archive_loans(after=after, batch_size=options['batch_size'], limit=options['limit']):
+            moved += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{moved} emprunt(s) archivé(s)…')
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                f'{moved} emprunt(s) archivé(s) en {time.perf_counter() - start:.1f}s.'
+            ))
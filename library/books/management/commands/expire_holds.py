@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from books.services import expire_holds
+
+
+class Command(BaseCommand):
+    help = "Expire les réservations non retirées à temps et passe l'exemplaire à la suivante."
+
+    def handle(self, *args, **options):
+        count = expire_holds()
+        self.stdout.write(f'{count} réservation(s) expirée(s).')
@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from books import exports
+from books.models import Loan
+
+
+class Command(BaseCommand):
+    help = 'Exporte les emprunts ou le catalogue en CSV ou JSON Lines, en flux.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=['loans', 'books'])
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--output', '-o', help='Fichier de sortie (sortie standard par défaut).')
+        parser.add_argument('--status', choices=[value for value, _ in Loan.STATUS_CHOICES])
+        parser.add_argument('--since', type=datetime.date.fromisoformat, help="Emprunts à partir de cette date (AAAA-MM-JJ).")
+        parser.add_argument('--until', type=datetime.date.fromisoformat, help="Emprunts jusqu'à cette date incluse.")
+        parser.add_argument('--card', help='Numéro de carte.')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['dataset'] == 'loans':
+            qs = exports.loan_querysets(options['status'], options['since'], options['until'], options['card'])
+            columns = exports.LOAN_COLUMNS
+        else:
+            qs, columns = exports.book_queryset(), exports.BOOK_COLUMNS
+        chunks = exports.stream(qs, columns, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                out.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
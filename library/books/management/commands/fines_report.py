@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from books import archive
+
+
+class Command(BaseCommand):
+    help = 'Affiche les pénalités en cours par carte ou par mois.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--by', choices=['card', 'month'], default='card')
+
+    def handle(self, *args, **options):
+        by = options['by']
+        key = 'card_number' if by == 'card' else 'month'
+        total = 0
+        for row in archive.fines_report(by=by):
+            label = row[key].strftime('%Y-%m') if by == 'month' else row[key]
+            self.stdout.write(f"{label}\t{row['loans']} emprunt(s)\t{row['days']} jour(s)\t{row['total']:.2f} €")
+            total += row['total']
+        self.stdout.write(self.style.SUCCESS(f'Total : {total:.2f} €'))
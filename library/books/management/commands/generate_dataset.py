@@ -0,0 +1,107 @@
+import io
+import os
+import time
+from datetime import datetime, time as dt_time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from books import dataset, search
+from books.cache import catalog_changed
+from books.models import Author, Book, Category, Loan, LoanArchive
+
+VOLUMES = {'categories': 'catégories', 'authors': 'auteurs', 'books': 'livres', 'cards': 'cartes', 'loans': 'emprunts'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données synthétique et déterministe : catégories, auteurs, livres "
+        "(ISBN-13 valides), cartes et historique d'emprunts (popularité zipfienne, retards, "
+        "annulations). Voir books.dataset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=sorted(dataset.PROFILES), default='small',
+                            help='Volumes de départ (large : 1M livres, 20M emprunts).')
+        for name, label in VOLUMES.items():
+            parser.add_argument(f'--{name}', type=int, help=f'Nombre de {label} (remplace le profil).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--years', type=float, default=5, help="Durée de l'historique d'emprunts.")
+        parser.add_argument('--end-date', type=datetime.fromisoformat,
+                            help="Fin de l'historique, AAAA-MM-JJ (aujourd'hui par défaut) : "
+                                 'à fixer pour obtenir les mêmes données un autre jour.')
+        parser.add_argument('--overdue-rate', type=float, default=0.12, help='Part des emprunts rendus en retard.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processus de génération (0 : dans ce processus).')
+        parser.add_argument('--chunk-size', type=int, default=dataset.CHUNK_SIZE, help='Lignes par lot.')
+        parser.add_argument('--flush', action='store_true',
+                            help='Vider le catalogue et les emprunts existants au préalable.')
+
+    def handle(self, *args, **options):
+        volumes = dict(dataset.PROFILES[options['profile']])
+        volumes.update({name: options[name] for name in VOLUMES if options[name] is not None})
+        if min(volumes.values()) < 0 or options['chunk_size'] < 1 or options['workers'] < 0:
+            raise CommandError('Les volumes, --chunk-size et --workers doivent être positifs.')
+        if volumes['books'] > 10 ** 9:
+            raise CommandError('Au plus 10⁹ livres (ISBN 978).')
+        if volumes['books'] and not volumes['authors']:
+            raise CommandError('Des livres demandent au moins un auteur.')
+        if volumes['loans'] and not (volumes['books'] and volumes['cards']):
+            raise CommandError('Des emprunts demandent au moins un livre et une carte.')
+        if not 0 <= options['overdue_rate'] <= 1:
+            raise CommandError('--overdue-rate doit être entre 0 et 1.')
+
+        if options['flush']:
+            dataset.delete_all()
+        elif any(model.objects.exists() for model in (Category, Author, Book, Loan, LoanArchive)):
+            raise CommandError('La base contient déjà des données : relancer avec --flush pour les remplacer.')
+
+        end = options['end_date'] or timezone.localdate()
+        if not isinstance(end, datetime):
+            end = datetime.combine(end, dt_time())
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        workers = options['workers']
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # the forked processes would each see their own empty database
+            workers = 0
+
+        start = time.perf_counter()
+        data = dataset.Dataset(
+            end=end, seed=options['seed'], years=options['years'], overdue_rate=options['overdue_rate'],
+            **volumes,
+        )
+        for table in dataset.Dataset.TABLES:
+            self._run(data, table, workers, options)
+
+        step = time.perf_counter()
+        capped = dataset.cap_active_loans(end)
+        dataset.adjust_copies()
+        dataset.reset_sequences()
+        call_command('rebuild_card_counters', stdout=self.stdout if options['verbosity'] > 1 else io.StringIO())
+        search.get_backend().rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        catalog_changed()
+        if options['verbosity'] > 1:
+            self.stdout.write(f'{capped} emprunt(s) clos au-delà de la limite par carte.')
+        if options['verbosity']:
+            self.stdout.write(f'Exemplaires, compteurs, index de recherche et statistiques en {time.perf_counter() - step:.1f}s.')
+            self.stdout.write(self.style.SUCCESS(
+                ', '.join(f'{volumes[name]} {label}' for name, label in VOLUMES.items())
+                + f' générés en {time.perf_counter() - start:.1f}s.'
+            ))
+
+    def _run(self, data, table, workers, options):
+        total = data.volumes[table]
+        start = time.perf_counter()
+        done = 0
+        for rows in dataset.run(data, table, workers, options['chunk_size']):
+            done += rows
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{VOLUMES[table]} : {done}/{total}, {done / (time.perf_counter() - start):.0f} lignes/s')
+        elapsed = time.perf_counter() - start
+        if options['verbosity']:
+            self.stdout.write(f'{VOLUMES[table]} : {total} en {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} lignes/s)')
@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from books import thumbnails
+
+MODELS = {'books': 'books.Book', 'authors': 'books.Author', 'categories': 'books.Category'}
+
+
+class Command(BaseCommand):
+    help = 'Génère les miniatures et variantes WebP manquantes des couvertures, photos et images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(MODELS), action='append',
+                            help='Limiter à ces images (répétable ; toutes par défaut).')
+        parser.add_argument('--force', action='store_true', help='Régénérer aussi les miniatures existantes.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=64,
+                            help='Images lues et envoyées aux processus à la fois.')
+
+    def handle(self, *args, **options):
+        images = []
+        for key in options['model'] or sorted(MODELS):
+            model = apps.get_model(MODELS[key])
+            field = thumbnails.IMAGE_FIELDS[MODELS[key]]
+            storage = model._meta.get_field(field).storage
+            names = model._default_manager.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}) \
+                .values_list(field, flat=True).distinct().iterator()
+            images.extend((name, storage) for name in names)
+
+        start = time.perf_counter()
+        done = skipped = failed = 0
+        batch_size = options['batch_size']
+        with ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('spawn')) as pool:
+            for i in range(0, len(images), batch_size):
+                futures = []
+                for name, storage in images[i:i + batch_size]:
+                    if not options['force'] and thumbnails.has_derivatives(name, storage):
+                        skipped += 1
+                        continue
+                    try:
+                        with storage.open(name, 'rb') as f:
+                            data = f.read()
+                    except OSError as e:
+                        failed += 1
+                        self.stderr.write(f'{name} : {e}')
+                        continue
+                    futures.append((name, storage, pool.submit(thumbnails.render, data, thumbnails.fallback_extension(name))))
+                for name, storage, future in futures:
+                    try:
+                        thumbnails.store(name, future.result(), storage)
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'{name} : {e}')
+                    else:
+                        done += 1
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{done} image(s) traitée(s), {skipped} déjà à jour, {failed} en erreur, en {elapsed:.2f}s.'
+        ))
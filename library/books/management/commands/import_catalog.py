@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books.importer import FORMATS, CatalogImporter, RowError, guess_format, parse_record, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe un catalogue CSV ou JSON Lines par lots (création ou mise à jour sur l'ISBN). "
+        "Les exemplaires ne sont renseignés qu'à la création d'un livre."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier à importer ('-' pour l'entrée standard).")
+        parser.add_argument('--format', choices=FORMATS, help="Format d'entrée (déduit de l'extension par défaut).")
+        parser.add_argument('--delimiter', default=',', help='Séparateur CSV.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Lignes par lot et par transaction.')
+        parser.add_argument('--checkpoint', help='Fichier de reprise (par défaut <path>.checkpoint).')
+        parser.add_argument('--resume', action='store_true', help='Reprendre après la dernière ligne validée.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size doit être positif.')
+        checkpoint = options['checkpoint'] or (None if path == '-' else f'{path}.checkpoint')
+        if options['resume'] and not checkpoint:
+            raise CommandError("--resume demande --checkpoint pour l'entrée standard.")
+        state = {'path': os.path.abspath(path) if path != '-' else path, 'records': 0, 'imported': 0, 'errors': 0}
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                saved = json.load(f)
+            if saved.get('path') != state['path']:
+                raise CommandError(f"Le point de reprise {checkpoint} concerne {saved.get('path')}.")
+            state.update(saved)
+            self.stdout.write(f"Reprise après {state['records']} enregistrement(s).")
+
+        fmt = options['format'] or guess_format(path)
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            self._import(stream, fmt, options, state, checkpoint)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    def _import(self, stream, fmt, options, state, checkpoint):
+        importer = CatalogImporter()
+        skip = state['records']
+        chunk, seen, start = [], 0, time.perf_counter()
+
+        def flush():
+            state['imported'] += len(importer.import_chunk(chunk))
+            state['records'] = seen
+            chunk.clear()
+            if checkpoint:
+                self._save_checkpoint(checkpoint, state)
+            elapsed = time.perf_counter() - start
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{seen} enregistrement(s), {(seen - skip) / elapsed:.0f} lignes/s")
+
+        for line_num, record in read_records(stream, fmt, options['delimiter']):
+            seen += 1
+            if seen <= skip:
+                continue
+            try:
+                if isinstance(record, RowError):
+                    raise record
+                chunk.append(parse_record(record))
+            except RowError as exc:
+                state['errors'] += 1
+                self.stderr.write(f'Ligne {line_num} ignorée : {exc}')
+            if len(chunk) >= options['chunk_size']:
+                flush()
+        if chunk or seen > state['records']:
+            flush()
+
+        elapsed = time.perf_counter() - start
+        rate = (seen - skip) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{state['imported']} livre(s) importé(s), {state['errors']} ligne(s) rejetée(s) "
+            f"en {elapsed:.2f}s ({rate:.0f} lignes/s)."
+        ))
+
+    def _save_checkpoint(self, checkpoint, state):
+        # written beside the final file then renamed: a crash never leaves half a checkpoint
+        tmp = f'{checkpoint}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, checkpoint)
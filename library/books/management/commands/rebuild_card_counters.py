@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from books.models import BorrowerCard, Loan
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs d'emprunts actifs (BorrowerCard) à partir des emprunts."
+
+    def handle(self, *args, **options):
+        counts = (
+            Loan.objects.exclude(status__in=Loan.CLOSED_STATUSES)
+            .values('card_number')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        with transaction.atomic():
+            BorrowerCard.objects.update(active_loans=0)
+            cards = [BorrowerCard(card_number=row['card_number'], active_loans=row['n']) for row in counts]
+            BorrowerCard.objects.bulk_create(
+                cards, batch_size=1000,
+                update_conflicts=True, unique_fields=['card_number'], update_fields=['active_loans'],
+            )
+        self.stdout.write(self.style.SUCCESS(f'{len(cards)} carte(s) avec emprunts actifs recalculée(s).'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books.models import Hold, HoldCancellation, HoldQueue
+
+
+class Command(BaseCommand):
+    help = "Renumérote les files de réservation (HoldQueue) à partir des réservations en attente."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # the write lock first: no hold placed or allocated while renumbering
+            HoldQueue.objects.update(issued=0, allocated=0)
+            HoldCancellation.objects.all().delete()
+            issued = {}
+            holds = list(Hold.objects.filter(status=Hold.STATUS_WAITING).order_by('id').only('id', 'book_id'))
+            for hold in holds:
+                issued[hold.book_id] = hold.ticket = issued.get(hold.book_id, 0) + 1
+            Hold.objects.bulk_update(holds, ['ticket'], batch_size=1000)
+            HoldQueue.objects.bulk_create(
+                [HoldQueue(book_id=book_id, issued=n) for book_id, n in issued.items()], batch_size=1000,
+                update_conflicts=True, unique_fields=['book'], update_fields=['issued'],
+            )
+        self.stdout.write(self.style.SUCCESS(f'{len(holds)} réservation(s) en attente renumérotée(s) sur {len(issued)} livre(s).'))
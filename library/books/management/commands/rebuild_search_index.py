@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books import search
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche du catalogue."
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        start = time.perf_counter()
+        with transaction.atomic():
+            count = backend.rebuild()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{count} livre(s) indexé(s) avec {type(backend).__name__} en {elapsed:.2f}s.'
+        ))
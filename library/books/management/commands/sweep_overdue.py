@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from books.sweeper import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = 'Passe en retard les emprunts dont la date de retour est dépassée.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Ignorer la marque de progression et tout reparcourir.')
+        parser.add_argument('--loop', action='store_true', help='Tourner en continu.')
+        parser.add_argument('--interval', type=int, default=300, help='Secondes entre deux passages avec --loop.')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            count = sweep_overdue(full=full)
+            self.stdout.write(f'{count} emprunt(s) passé(s) en retard.')
+            if not options['loop']:
+                break
+            full = False
+            time.sleep(options['interval'])
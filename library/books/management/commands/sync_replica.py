@@ -0,0 +1,51 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from books import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Recopie la base principale dans les fichiers SQLite des réplicas (par défaut ceux de "
+        "BOOKS_READ_REPLICAS, sinon l'alias « replica »), pour essayer la lecture sur réplica "
+        "en local. Voir books.replicas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Alias des réplicas à recopier.')
+        parser.add_argument('--interval', type=float,
+                            help='Recopier toutes les N secondes, comme un réplica en retard (Ctrl-C pour arrêter).')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replicas.replica_aliases() or ['replica']
+        source = connections[DEFAULT_DB_ALIAS].settings_dict
+        targets = []
+        for alias in aliases:
+            if alias not in settings.DATABASES or alias == DEFAULT_DB_ALIAS:
+                raise CommandError(f'Alias de réplica inconnu : {alias}.')
+            target = connections[alias].settings_dict
+            if 'sqlite3' not in source['ENGINE'] or 'sqlite3' not in target['ENGINE']:
+                raise CommandError(f"{alias} : hors SQLite, la réplication est l'affaire de la base de données.")
+            if str(target['NAME']) == str(source['NAME']):
+                raise CommandError(f'{alias} : pas un fichier distinct de la base principale.')
+            targets.append((alias, Path(target['NAME'])))
+        if options['interval'] is not None and options['interval'] <= 0:
+            raise CommandError('--interval doit être positif.')
+        try:
+            while True:
+                for alias, path in targets:
+                    start = time.perf_counter()
+                    # the connections of this process must reopen the new file
+                    connections[alias].close()
+                    replicas.copy_sqlite(path)
+                    if options['verbosity']:
+                        self.stdout.write(f'{alias} : {path.name} recopié en {time.perf_counter() - start:.2f}s.')
+                if options['interval'] is None:
+                    return
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
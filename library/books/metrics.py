@@ -0,0 +1,248 @@
+"""Per-request SQL instrumentation and Prometheus metrics.
+
+``QueryMetricsMiddleware`` records, for every request, its duration, its
+number of SQL queries, their total time and how often each query *shape*
+(the SQL with its literals and IN lists folded, see fingerprint()) ran. A
+SELECT shape repeated BOOKS_METRICS_N_PLUS_ONE times or more in one request is
+logged as a probable N+1 (``books.metrics`` logger, WARNING) with the view
+name and the query.
+
+The queries are seen through an execute wrapper put on every database
+connection, which records into the recorder of the current request held in a
+context variable: this also covers the ORM calls of the async views, run by
+asgiref in another thread with a copy of the context. Queries run while a
+streamed response body is consumed are outside the request and not counted.
+
+Durations, query counts and SQL times are aggregated into histograms per
+view name (``books:book_detail``...) and method, exposed with the page cache
+counters at ``/metrics`` in the Prometheus text format. Like the page cache
+counters, they are per process: scrape each worker, or sum them.
+"""
+import bisect
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+from . import cache as page_cache
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+HISTOGRAMS = {
+    'books_request_duration_seconds': ('Time to produce the response, per view.', DURATION_BUCKETS),
+    'books_request_queries': ('SQL queries per request, per view.', QUERY_BUCKETS),
+    'books_request_sql_seconds': ('Time spent in SQL per request, per view.', DURATION_BUCKETS),
+}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = contextvars.ContextVar('books_query_recorder', default=None)
+_lock = threading.Lock()
+# histogram name -> {(view, method): [count per bucket..., count above, sum]}
+_histograms = {name: {} for name in HISTOGRAMS}
+_n_plus_one = Counter()
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """The shape of `sql`: literals and placeholders become ``?`` and IN lists
+    ``(...)``, so that the same query for other values has the same fingerprint."""
+    sql = _NUMBER.sub('?', _STRING.sub('?', sql)).replace('%s', '?')
+    return ' '.join(_IN_LIST.sub('(...)', sql).split())
+
+
+def n_plus_one_threshold():
+    return getattr(settings, 'BOOKS_METRICS_N_PLUS_ONE', 5)
+
+
+class QueryRecorder:
+    """The SQL queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.shapes = Counter()
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.time += duration
+        self.shapes[fingerprint(sql)] += 1
+
+    def repeated(self, threshold):
+        """``[(fingerprint, count)]`` of the SELECTs run `threshold` times or more."""
+        return [(shape, n) for shape, n in self.shapes.most_common()
+                if n >= threshold and shape.lstrip('( ').upper().startswith('SELECT')]
+
+
+def _record(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - start)
+
+
+def _instrument(connection, **kwargs):
+    # first, under the wrappers pushed by connection.execute_wrapper(): that
+    # context manager pops the last wrapper on exit, which must be its own
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record)
+
+
+def install():
+    """Record the queries of every connection: those opened from now on (in
+    any thread) and those of this thread.
+
+    The wrapper stays on the connections rather than being pushed around each
+    request with connection.execute_wrapper(): the ORM calls of an async view
+    run in asgiref's thread, on connections the middleware never sees. It
+    only records while a request's recorder is set."""
+    connection_created.connect(_instrument, dispatch_uid='books.metrics')
+    for connection in connections.all():
+        _instrument(connection)
+
+
+def observe(view, method, duration, recorder):
+    values = {
+        'books_request_duration_seconds': duration,
+        'books_request_queries': recorder.count,
+        'books_request_sql_seconds': recorder.time,
+    }
+    with _lock:
+        for name, value in values.items():
+            buckets = HISTOGRAMS[name][1]
+            series = _histograms[name].setdefault((view, method), [0] * (len(buckets) + 2))
+            series[bisect.bisect_left(buckets, value)] += 1
+            series[-1] += value
+
+
+def reset():
+    with _lock:
+        for series in _histograms.values():
+            series.clear()
+        _n_plus_one.clear()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    # unresolved paths share one label: the label values stay bounded
+    return match.view_name if match else '<unresolved>'
+
+
+class QueryMetricsMiddleware:
+    """Record the duration and SQL queries of each request (see module docstring)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install()
+        # async: instrument the connections of asgiref's ORM thread on the
+        # first request, in case they predate install()
+        self.thread_instrumented = not self.async_mode
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # the connection of this thread may predate install()
+        for connection in connections.all(initialized_only=True):
+            _instrument(connection)
+        recorder = QueryRecorder()
+        token = _current.set(recorder)
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+            self.finish(request, time.perf_counter() - start, recorder)
+
+    async def __acall__(self, request):
+        if not self.thread_instrumented:
+            # the threads started later open new connections
+            await sync_to_async(install)()
+            self.thread_instrumented = True
+        recorder = QueryRecorder()
+        token = _current.set(recorder)
+        start = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            _current.reset(token)
+            self.finish(request, time.perf_counter() - start, recorder)
+
+    def finish(self, request, duration, recorder):
+        view = view_name(request)
+        observe(view, request.method, duration, recorder)
+        repeated = recorder.repeated(n_plus_one_threshold())
+        if repeated:
+            with _lock:
+                _n_plus_one[view] += 1
+            for shape, n in repeated:
+                logger.warning('Probable N+1 in %s (%s %s): %d x %s', view, request.method, request.path, n, shape)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def render():
+    """All the metrics, in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        histograms = {name: {key: list(series) for key, series in data.items()} for name, data in _histograms.items()}
+        n_plus_one = dict(_n_plus_one)
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (view, method), series in sorted(histograms[name].items()):
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(view=view, method=method, le=bound)} {cumulative}')
+            total = cumulative + series[-2]
+            lines.append(f'{name}_bucket{_labels(view=view, method=method, le="+Inf")} {total}')
+            lines.append(f'{name}_sum{_labels(view=view, method=method)} {series[-1]:.6g}')
+            lines.append(f'{name}_count{_labels(view=view, method=method)} {total}')
+    lines += ['# HELP books_n_plus_one_total Requests with a probable N+1 query pattern, per view.',
+              '# TYPE books_n_plus_one_total counter']
+    lines += [f'books_n_plus_one_total{_labels(view=view)} {n}' for view, n in sorted(n_plus_one.items())]
+    stats = page_cache.stats()
+    for key in ('hits', 'misses'):
+        lines += [f'# HELP books_page_cache_{key}_total Page cache {key} of this process.',
+                  f'# TYPE books_page_cache_{key}_total counter',
+                  f'books_page_cache_{key}_total {stats[key]}']
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """``/metrics``, for Prometheus. With BOOKS_METRICS_TOKEN set, only for
+    ``Authorization: Bearer <token>``."""
+    token = getattr(settings, 'BOOKS_METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_counters(apps, schema_editor):
+    Loan = apps.get_model('books', 'Loan')
+    BorrowerCard = apps.get_model('books', 'BorrowerCard')
+    counts = (
+        Loan.objects.exclude(status__in=['returned', 'canceled'])
+        .values('card_number').annotate(n=Count('id')).order_by()
+    )
+    BorrowerCard.objects.bulk_create(
+        [BorrowerCard(card_number=row['card_number'], active_loans=row['n']) for row in counts],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_book_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowerCard',
+            fields=[
+                ('card_number', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('active_loans', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['card_number', 'status'], name='loan_card_status_idx'),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
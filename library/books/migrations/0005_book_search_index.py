@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Full-text index used by books.search.sqlite_fts; only created on SQLite.
+CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS books_book_fts "
+    "USING fts5(title, isbn, author, tokenize = 'unicode61 remove_diacritics 2')"
+)
+POPULATE = (
+    "INSERT INTO books_book_fts (rowid, title, isbn, author) "
+    "SELECT b.id, b.title, b.isbn, TRIM(COALESCE(a.first_name, '') || ' ' || COALESCE(a.last_name, '')) "
+    "FROM books_book b JOIN books_author a ON a.id = b.author_id"
+)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE)
+    schema_editor.execute(POPULATE)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS books_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_borrowercard_loan_card_status_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_sweeperstate_loan_status_due_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrower_name', models.CharField(max_length=200)),
+                ('borrower_email', models.EmailField(max_length=254)),
+                ('card_number', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('waiting', 'En attente'), ('ready', 'Disponible'), ('fulfilled', 'Honorée'), ('canceled', 'Annulée'), ('expired', 'Expirée')], default='waiting', max_length=20)),
+                ('allocated_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='books.book')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['book', 'status', 'id'], name='hold_book_status_id_idx'), models.Index(fields=['card_number', 'status'], name='hold_card_status_idx'), models.Index(fields=['status', 'expires_at'], name='hold_status_expires_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['waiting', 'ready'])), fields=('book', 'card_number'), name='unique_active_hold')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_hold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('borrower_name', models.CharField(max_length=200)),
+                ('borrower_email', models.EmailField(max_length=254)),
+                ('card_number', models.CharField(max_length=50)),
+                ('borrowed_at', models.DateTimeField()),
+                ('due_date', models.DateTimeField(blank=True, null=True)),
+                ('returned_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('borrowed', 'Emprunté'), ('returned', 'Restitué'), ('late', 'En retard'), ('canceled', 'Annulé')], max_length=20)),
+                ('comments', models.TextField(blank=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_loans', to='books.book')),
+            ],
+            options={
+                'ordering': ['-borrowed_at'],
+                'indexes': [models.Index(fields=['card_number', 'borrowed_at', 'id'], name='loanarchive_card_borrowed_idx')],
+            },
+        ),
+    ]
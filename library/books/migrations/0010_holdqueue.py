@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def number_waiting_holds(apps, schema_editor):
+    # the waiting holds of each book get tickets 1..n in id order: nothing allocated or canceled yet
+    Hold = apps.get_model('books', 'Hold')
+    HoldQueue = apps.get_model('books', 'HoldQueue')
+    issued = {}
+    holds = list(Hold.objects.filter(status='waiting').order_by('id'))
+    for hold in holds:
+        issued[hold.book_id] = hold.ticket = issued.get(hold.book_id, 0) + 1
+    Hold.objects.bulk_update(holds, ['ticket'], batch_size=1000)
+    HoldQueue.objects.bulk_create([HoldQueue(book_id=book_id, issued=n) for book_id, n in issued.items()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_loanarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HoldQueue',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='hold_queue', serialize=False, to='books.book')),
+                ('issued', models.PositiveBigIntegerField(default=0)),
+                ('allocated', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='hold',
+            name='ticket',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='HoldCancellation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField()),
+                ('block', models.PositiveBigIntegerField()),
+                ('canceled', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='books.book')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('book', 'level', 'block'), name='unique_hold_cancellation_range')],
+            },
+        ),
+        migrations.RunPython(number_waiting_holds, migrations.RunPython.noop),
+    ]
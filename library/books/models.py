@@ -5,7 +5,18 @@ from django.utils import timezone
 from django.conf import settings
 from decimal import Decimal
 from datetime import timedelta, date
-from django.db.models import Q
+from django.db.models import Q, F, Value, Count, Sum, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce, Greatest, TruncMonth
+
+from .expressions import DaysBetween, Match
+from .tracking import DirtyFieldsMixin
+
+# maximum number of simultaneous active loans per library card
+MAX_ACTIVE_LOANS = 5
+# a loan is due this long after it was borrowed
+LOAN_PERIOD = timedelta(days=14)
+# an allocated hold waits this long on the hold shelf
+HOLD_PICKUP_PERIOD = timedelta(days=3)
 
 
 def validate_isbn13(value):
@@ -24,6 +35,30 @@ def validate_isbn13(value):
         raise ValidationError('ISBN-13 invalide (checksum incorrect).')
 
 
+def isbn10_to_isbn13(value):
+    """Convert a valid ISBN-10 (last character may be X) to its 978 ISBN-13."""
+    if len(value) != 10 or not value[:9].isdigit() or not (value[9].isdigit() or value[9] in 'xX'):
+        raise ValidationError('L\'ISBN-10 doit contenir 10 caractères.')
+    total = sum((10 - i) * int(ch) for i, ch in enumerate(value[:9]))
+    total += 10 if value[9] in 'xX' else int(value[9])
+    if total % 11:
+        raise ValidationError('ISBN-10 invalide (checksum incorrect).')
+    body = '978' + value[:9]
+    total = sum(int(ch) * (1 if i % 2 == 0 else 3) for i, ch in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def normalize_isbn(value):
+    """Strip separators, convert ISBN-10 to ISBN-13 and validate."""
+    value = ''.join(ch for ch in str(value or '') if ch.isalnum())
+    if len(value) == 10:
+        value = isbn10_to_isbn13(value)
+    if not value:
+        raise ValidationError('ISBN manquant.')
+    validate_isbn13(value)
+    return value
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
@@ -60,7 +95,7 @@ class Author(models.Model):
         return self.full_name
 
 
-class Book(models.Model):
+class Book(DirtyFieldsMixin, models.Model):
     title = models.CharField(max_length=300)
     isbn = models.CharField(max_length=13, unique=True, validators=[validate_isbn13])
     publication_year = models.PositiveIntegerField(validators=[MinValueValidator(1450)], null=True, blank=True)
@@ -76,6 +111,12 @@ class Book(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     date_added = models.DateTimeField(auto_now_add=True, null=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination of the catalog
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ]
+
     def clean(self):
         # publication year can't be in the future
         current_year = date.today().year
@@ -92,16 +133,15 @@ class Book(models.Model):
         return self.copies_available > 0
 
     def decrement_available(self, qty=1):
-        if self.copies_available - qty < 0:
-            raise ValidationError("Pas assez d'exemplaires disponibles.")
-        self.copies_available -= qty
-        self.save()
+        # single conditional UPDATE, see books.services
+        from .services import reserve_copy
+        reserve_copy(self.pk, qty)
+        self.refresh_from_db(fields=['copies_available'])
 
     def increment_available(self, qty=1):
-        if self.copies_available + qty > self.copies_total:
-            raise ValidationError("Le nombre d'exemplaires disponibles ne peut dépasser le total.")
-        self.copies_available += qty
-        self.save()
+        from .services import release_copy
+        release_copy(self.pk, qty)
+        self.refresh_from_db(fields=['copies_available'])
 
     def delete(self, *args, **kwargs):
         """Prevent deletion if there are active loans (borrowed or late).
@@ -111,10 +151,72 @@ class Book(models.Model):
             raise ValidationError("Impossible de supprimer ce livre : il existe des emprunts actifs.")
         # Remove returned/canceled loans so PROTECT doesn't block deletion
         self.loans.filter(status__in=[Loan.STATUS_RETURNED, Loan.STATUS_CANCELED]).delete()
+        self.archived_loans.all().delete()
         return super().delete(*args, **kwargs)
 
 
-class Loan(models.Model):
+class BookSearchEntry(models.Model):
+    """A book's row in the FTS5 index of books.search.sqlite_fts, so that Book
+    querysets can join it (``search_entry``). The table only exists on SQLite
+    and is written by the search backend, not through this model."""
+    book = models.OneToOneField(
+        Book, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', db_constraint=False,
+        related_name='search_entry',
+    )
+    title = models.TextField()
+    isbn = models.TextField()
+    author = models.TextField()
+    # FTS5's hidden column named after the table: left side of MATCH, first argument of bm25()
+    document = models.TextField(db_column='books_book_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'books_book_fts'
+
+
+BookSearchEntry._meta.get_field('document').register_lookup(Match)
+
+
+def penalty_per_day():
+    return Decimal(getattr(settings, 'LOAN_PENALTY_PER_DAY', Decimal('0.50')))
+
+
+class LoanQuerySet(models.QuerySet):
+    def with_penalties(self, now=None):
+        """Annotate ``overdue_days`` and ``penalty`` computed by the database.
+
+        Same rules as Loan.days_overdue()/penalty_amount(): days late up to the
+        return (or `now` for loans still out), times LOAN_PENALTY_PER_DAY."""
+        now = now or timezone.now()
+        late_days = Greatest(DaysBetween(Coalesce('returned_at', Value(now)), 'due_date'), Value(0))
+        return self.annotate(
+            overdue_days=Coalesce(late_days, Value(0)),
+            penalty=ExpressionWrapper(
+                F('overdue_days') * Value(penalty_per_day()),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+        )
+
+    def fines_report(self, by='card', now=None):
+        """Outstanding fines grouped by card number or by month of the due date,
+        as one GROUP BY query: rows of ``card_number``/``month``, ``loans``,
+        ``days`` and ``total``."""
+        qs = self.exclude(status=Loan.STATUS_CANCELED).with_penalties(now).filter(overdue_days__gt=0)
+        if by == 'month':
+            qs = qs.annotate(month=TruncMonth('due_date'))
+            key = 'month'
+        elif by == 'card':
+            key = 'card_number'
+        else:
+            raise ValueError(f"unknown grouping {by!r}")
+        return (
+            qs.values(key)
+            .annotate(loans=Count('id'), days=Sum('overdue_days'), total=Sum('penalty'))
+            .order_by(key)
+        )
+
+
+class Loan(DirtyFieldsMixin, models.Model):
     STATUS_BORROWED = 'borrowed'
     STATUS_RETURNED = 'returned'
     STATUS_LATE = 'late'
@@ -137,17 +239,29 @@ class Loan(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_BORROWED)
     comments = models.TextField(blank=True)
 
+    objects = LoanQuerySet.as_manager()
+
+    # statuses that no longer hold a copy nor count against the card limit
+    CLOSED_STATUSES = (STATUS_RETURNED, STATUS_CANCELED)
+
     class Meta:
         ordering = ['-borrowed_at']
+        indexes = [
+            models.Index(fields=['card_number', 'status'], name='loan_card_status_idx'),
+            # keyset pagination of the loan lists
+            models.Index(fields=['status', 'borrowed_at', 'id'], name='loan_status_borrowed_idx'),
+            models.Index(fields=['card_number', 'borrowed_at', 'id'], name='loan_card_borrowed_idx'),
+            # overdue sweeper range scan
+            models.Index(fields=['status', 'due_date'], name='loan_status_due_idx'),
+        ]
 
     def clean(self):
-        # Ensure book has available copies when creating a loan
-        if self._state.adding and (self.book.copies_available <= 0):
+        # Ensure book has available copies (or one set aside for this card) when creating a loan
+        if (self._state.adding and self.book_id is not None and self.book.copies_available <= 0
+                and not Hold.is_ready(self.book_id, self.card_number)):
             raise ValidationError('Ce livre n\'a pas d\'exemplaires disponibles.')
         # Check borrower doesn't exceed 5 active loans
-        from django.db.models import Q
-        active_count = Loan.objects.filter(card_number=self.card_number).filter(~Q(status=self.STATUS_RETURNED) & ~Q(status=self.STATUS_CANCELED)).count()
-        if self._state.adding and active_count >= 5:
+        if self._state.adding and BorrowerCard.active_count(self.card_number) >= MAX_ACTIVE_LOANS:
             raise ValidationError('Cet usager a déjà 5 emprunts actifs.')
 
     def save(self, *args, **kwargs):
@@ -156,7 +270,7 @@ class Loan(models.Model):
             now = timezone.now()
             if not self.borrowed_at:
                 self.borrowed_at = now
-            self.due_date = self.borrowed_at + timedelta(days=14)
+            self.due_date = self.borrowed_at + LOAN_PERIOD
         super().save(*args, **kwargs)
 
     @property
@@ -172,15 +286,192 @@ class Loan(models.Model):
         return max(0, delta.days)
 
     def penalty_amount(self):
-        per_day = getattr(settings, 'LOAN_PENALTY_PER_DAY', Decimal('0.50'))
-        return Decimal(self.days_overdue()) * Decimal(per_day)
+        return Decimal(self.days_overdue()) * penalty_per_day()
 
     def mark_returned(self):
         if self.status == self.STATUS_RETURNED:
             return
-        self.returned_at = timezone.now()
-        self.status = self.STATUS_RETURNED
-        self.save()
+        # not self.save(): the status this instance was loaded with may be stale
+        from .services import return_loan
+        return_loan(self)
+
+    def __str__(self):
+        return f"{self.book.title} — {self.borrower_name} ({self.status})"
+
+
+class LoanArchive(models.Model):
+    """A closed loan moved out of Loan by books.archive, under the same id.
+
+    Read only by a card's history and the exports: one index besides the
+    book's, against five on Loan, and no signals."""
+    id = models.BigIntegerField(primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.PROTECT, related_name='archived_loans')
+    borrower_name = models.CharField(max_length=200)
+    borrower_email = models.EmailField()
+    card_number = models.CharField(max_length=50)
+    borrowed_at = models.DateTimeField()
+    due_date = models.DateTimeField(null=True, blank=True)
+    returned_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Loan.STATUS_CHOICES)
+    comments = models.TextField(blank=True)
+
+    objects = LoanQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-borrowed_at']
+        indexes = [
+            # keyset pagination of a card's history, as on Loan
+            models.Index(fields=['card_number', 'borrowed_at', 'id'], name='loanarchive_card_borrowed_idx'),
+        ]
 
     def __str__(self):
         return f"{self.book.title} — {self.borrower_name} ({self.status})"
+
+
+class Hold(models.Model):
+    """A patron's place in the FIFO queue of a book.
+
+    When a copy comes back it goes to the oldest waiting hold (``ready``)
+    instead of the shelf; the checkout of that book by the same card then
+    consumes the hold (``fulfilled``). See books.services."""
+    STATUS_WAITING = 'waiting'
+    STATUS_READY = 'ready'
+    STATUS_FULFILLED = 'fulfilled'
+    STATUS_CANCELED = 'canceled'
+    STATUS_EXPIRED = 'expired'
+
+    STATUS_CHOICES = [
+        (STATUS_WAITING, 'En attente'),
+        (STATUS_READY, 'Disponible'),
+        (STATUS_FULFILLED, 'Honorée'),
+        (STATUS_CANCELED, 'Annulée'),
+        (STATUS_EXPIRED, 'Expirée'),
+    ]
+    ACTIVE_STATUSES = (STATUS_WAITING, STATUS_READY)
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    borrower_name = models.CharField(max_length=200)
+    borrower_email = models.EmailField()
+    card_number = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_WAITING)
+    allocated_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # number in the book's queue, in the order of the ids (see HoldQueue)
+    ticket = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # head of a book's queue: index range on (book, status, id)
+            models.Index(fields=['book', 'status', 'id'], name='hold_book_status_id_idx'),
+            models.Index(fields=['card_number', 'status'], name='hold_card_status_idx'),
+            # expiry of allocated holds
+            models.Index(fields=['status', 'expires_at'], name='hold_status_expires_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['book', 'card_number'], condition=Q(status__in=['waiting', 'ready']),
+                name='unique_active_hold',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.book} — {self.card_number} ({self.status})"
+
+    @classmethod
+    def is_ready(cls, book_id, card_number):
+        """Whether a copy of the book waits on the hold shelf for this card."""
+        return cls.objects.filter(book_id=book_id, card_number=card_number, status=cls.STATUS_READY).exists()
+
+    def position(self):
+        """1-based rank in the book's queue (None unless waiting), without
+        reading the holds before this one: two queries whatever the queue's
+        length (see HoldQueue)."""
+        if self.status != self.STATUS_WAITING or self.ticket is None:
+            return None
+        allocated = HoldQueue.objects.filter(pk=self.book_id).values_list('allocated', flat=True).first() or 0
+        return self.ticket - allocated - HoldQueue.canceled_before(self.book_id, self.ticket)
+
+
+class HoldQueue(models.Model):
+    """Counters of a book's hold queue, for O(log n) queue positions.
+
+    Each hold gets the next ``ticket`` (1, 2, ...) when it is placed. Holds
+    leave the queue from the head (allocation, counted in ``allocated``) or
+    from anywhere (cancellation, counted per ticket range in
+    HoldCancellation), so the rank of a waiting hold is its ticket less the
+    holds allocated and the waiting holds canceled below it. Canceled
+    tickets are counted in the dyadic ranges ``[block << level, (block + 1)
+    << level)`` holding them, one row per level: the count below a ticket is
+    a sum over at most TICKET_BITS rows (Fenwick tree).
+
+    Maintained by books.services in the transactions that move the queue;
+    rebuild with `manage.py rebuild_hold_queues`."""
+    TICKET_BITS = 32
+
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='hold_queue')
+    issued = models.PositiveBigIntegerField(default=0)
+    allocated = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.book} ({self.issued - self.allocated})"
+
+    @classmethod
+    def ranges_of(cls, ticket):
+        """The (level, block) ranges holding `ticket`, one per level."""
+        return [(level, ticket >> level) for level in range(cls.TICKET_BITS)]
+
+    @classmethod
+    def ranges_before(cls, ticket):
+        """Disjoint (level, block) ranges covering the tickets below `ticket`."""
+        return [(level, (ticket >> level) - 1) for level in range(cls.TICKET_BITS) if ticket >> level & 1]
+
+    @classmethod
+    def canceled_before(cls, book_id, ticket):
+        """Waiting holds of the book canceled with a ticket below `ticket`."""
+        ranges = Q()
+        for level, block in cls.ranges_before(ticket):
+            ranges |= Q(level=level, block=block)
+        return HoldCancellation.objects.filter(ranges, book_id=book_id).aggregate(n=Sum('canceled'))['n'] or 0
+
+
+class HoldCancellation(models.Model):
+    """Waiting holds of a book canceled with a ticket in one dyadic range (see HoldQueue)."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    level = models.PositiveSmallIntegerField()
+    block = models.PositiveBigIntegerField()
+    canceled = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'level', 'block'], name='unique_hold_cancellation_range'),
+        ]
+
+
+class SweeperState(models.Model):
+    """Bookkeeping of a periodic job, e.g. the overdue sweeper's high-water mark."""
+    name = models.CharField(max_length=50, primary_key=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class BorrowerCard(models.Model):
+    """Denormalized per-card counter of active (non returned/canceled) loans.
+
+    Maintained by books.services in the same transaction as checkout and
+    return; rebuild with `manage.py rebuild_card_counters`."""
+    card_number = models.CharField(max_length=50, primary_key=True)
+    active_loans = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.card_number} ({self.active_loans})"
+
+    @classmethod
+    def active_count(cls, card_number):
+        """Active loans of a card: one primary-key read, 0 for unknown cards."""
+        return cls.objects.filter(pk=card_number).values_list('active_loans', flat=True).first() or 0
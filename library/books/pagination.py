@@ -0,0 +1,254 @@
+"""Keyset (cursor) pagination.
+
+Django's Paginator runs ``COUNT(*)`` and ``OFFSET n`` on every page, so deep
+pages get slower as the table grows. A cursor page instead remembers the sort
+key of its first/last row and asks for the rows strictly before/after it:
+``WHERE (title, id) > (%s, %s) ORDER BY title, id LIMIT per_page + 1``, which
+an index answers in constant time whatever the depth.
+"""
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+from operator import attrgetter, itemgetter
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    """Quacks like django.core.paginator.Page, minus page numbers."""
+
+    number = None
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Paginate `queryset` on `ordering`, a tuple of field names ending with a
+    unique one (``('title', 'id')``, ``('-borrowed_at', '-id')``). Fields may
+    be annotations; they must not be NULL. Rows may be model instances or the
+    dicts of a ``values()`` queryset that includes the ordering fields."""
+
+    count = None
+    num_pages = None
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    # -- tokens ---------------------------------------------------------
+    def encode_cursor(self, direction, obj):
+        if isinstance(obj, dict):
+            values = [_dump(obj[name]) for name, _ in self.fields]
+        else:
+            values = [_dump(getattr(obj, name)) for name, _ in self.fields]
+        raw = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            direction, values = json.loads(raw)
+        except (ValueError, TypeError, binascii.Error):
+            raise InvalidCursor(token)
+        if direction not in ('n', 'p') or not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(token)
+        try:
+            values = [self._to_python(name, value) for (name, _), value in zip(self.fields, values)]
+        except ValidationError:
+            raise InvalidCursor(token)
+        return direction, values
+
+    def _to_python(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # annotation: JSON already gives back the right type for strings/numbers
+            return value
+        return field.to_python(value)
+
+    # -- queries --------------------------------------------------------
+    def _after(self, values, reverse):
+        """Q for rows strictly after `values` in the ordering (before it if `reverse`)."""
+        condition = Q()
+        for i, ((name, desc), value) in enumerate(zip(self.fields, values)):
+            lookup = 'lt' if desc != reverse else 'gt'
+            clause = Q(**{f'{name}__{lookup}': value})
+            for (prev_name, _), prev_value in zip(self.fields[:i], values[:i]):
+                clause &= Q(**{prev_name: prev_value})
+            condition |= clause
+        # redundant bound on the leading column: lets the planner start an
+        # index range scan instead of evaluating the OR on every row
+        (name, desc), value = self.fields[0], values[0]
+        return Q(**{f"{name}__{'lte' if desc != reverse else 'gte'}": value}) & condition
+
+    def _query(self, cursor, queryset=None):
+        direction, values = self.decode_cursor(cursor) if cursor else ('n', None)
+        backwards = direction == 'p'
+        ordering = self.ordering
+        if backwards:
+            ordering = tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+        qs = (self.queryset if queryset is None else queryset).order_by(*ordering)
+        if values is not None:
+            qs = qs.filter(self._after(values, reverse=backwards))
+        return qs[:self.per_page + 1], backwards, values is not None
+
+    def _page(self, rows, backwards, has_cursor):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else has_cursor
+        return CursorPage(
+            rows, self,
+            next_cursor=self.encode_cursor('n', rows[-1]) if rows and has_next else None,
+            previous_cursor=self.encode_cursor('p', rows[0]) if rows and has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        qs, backwards, has_cursor = self._query(cursor)
+        return self._page(list(qs), backwards, has_cursor)
+
+    async def apage(self, cursor=None):
+        """page() for async views."""
+        qs, backwards, has_cursor = self._query(cursor)
+        return self._page([row async for row in qs], backwards, has_cursor)
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """CursorPaginator over several querysets as if they were one, e.g. Loan
+    and LoanArchive: each one answers the page after the cursor on its own
+    index and the pages are merged. Their rows must share the ordering fields,
+    and the unique last one must not repeat across the querysets."""
+
+    def __init__(self, querysets, per_page, ordering):
+        super().__init__(querysets[0], per_page, ordering)
+        self.querysets = querysets
+
+    def page(self, cursor=None):
+        rows = []
+        for queryset in self.querysets:
+            qs, backwards, has_cursor = self._query(cursor, queryset)
+            rows += qs
+        # stable sorts, least significant field first
+        for name, desc in reversed(self.fields):
+            rows.sort(key=itemgetter(name) if rows and isinstance(rows[0], dict) else attrgetter(name),
+                      reverse=desc != backwards)
+        return self._page(rows[:self.per_page + 1], backwards, has_cursor)
+
+
+class CursorPaginationMixin:
+    """ListView mixin making the pagination mode selectable per view.
+
+    ``pagination_mode = 'cursor'`` pages with opaque ``?cursor=`` tokens on
+    ``cursor_ordering``; ``'offset'`` keeps Django's ``?page=N`` paginator.
+    The template context (``paginator``, ``page_obj``, ``is_paginated``) is the
+    same in both modes."""
+
+    pagination_mode = 'cursor'
+    cursor_ordering = ('id',)
+    cursor_kwarg = 'cursor'
+
+    def get_pagination_mode(self):
+        return self.pagination_mode
+
+    def get_cursor_paginator(self, queryset, page_size):
+        return CursorPaginator(queryset, page_size, self.cursor_ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != 'cursor':
+            return super().paginate_queryset(queryset, page_size)
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Curseur de pagination invalide.')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+def estimated_count(queryset):
+    """Row count of `queryset`'s table according to the planner statistics,
+    or None when there are none (SQLite before ``ANALYZE``, other vendors)."""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # one row per index, its first number is the number of entries
+            cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    # PostgreSQL says -1 for a table never analyzed
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for tables too large to ``COUNT(*)`` on every page.
+
+    An unfiltered queryset is counted from the planner statistics once the
+    table holds more than `count_limit` rows; a filtered one (or a table
+    without statistics) is counted up to `count_limit` rows only, so the last
+    pages of a huge result are not reachable. Meant for the admin changelists
+    (``ModelAdmin.paginator``), where an approximate total is fine."""
+
+    count_limit = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.has_filters():
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        return queryset.order_by().values('pk')[:self.count_limit].count()
+
+
+def _dump(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
@@ -0,0 +1,280 @@
+"""On-demand cProfile captures of requests.
+
+With BOOKS_PROFILING on, ``ProfilingMiddleware`` runs a request under
+cProfile when:
+
+- it carries the header ``X-Profile: <token>``, a signed token shown on the
+  admin page of the profiles (valid TOKEN_MAX_AGE seconds), e.g.
+  ``curl -H 'X-Profile: …' '/books/?q=amour'``;
+- it is drawn at BOOKS_PROFILING_SAMPLE_RATE (0 to 1);
+- its view was slower than BOOKS_PROFILING_SLOW_MS on its previous request:
+  a slow request arms the profiling of the next one of the same view (at
+  most one per view every SLOW_COOLDOWN seconds), since the slow one itself
+  ran unprofiled.
+
+Each capture is stored in BOOKS_PROFILING_DIR as a pstats file (``python -m
+pstats``, snakeviz...), the folded stacks of a StackSampler run alongside
+(flamegraph.pl, speedscope: cProfile only keeps caller -> callee edges, which
+cannot rebuild the stacks of Django's recursive middleware chain) and a JSON
+file of its view, path, trigger and duration; the BOOKS_PROFILING_KEEP most
+recent are kept. The admin page (``/admin/profiles/``) lists them for download.
+
+With BOOKS_PROFILING off the middleware removes itself at startup, and a
+request that is not profiled costs a few attribute reads. One request is
+profiled at a time per process.
+
+Under ASGI, cProfile and the sampler see the whole event loop thread: every
+coroutine the loop runs while the profiled request awaits, the other
+requests served meanwhile included, is counted in the capture, and the sync
+ORM calls of the async views, run in another thread, show up as time spent
+awaiting them. Such captures are marked ASGI on the admin page; to isolate
+one request, profile it under WSGI or with no concurrent traffic.
+"""
+import cProfile
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.contrib import admin
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+from django.urls import Resolver404, get_resolver
+
+from .metrics import view_name
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-Profile'
+TOKEN_MAX_AGE = 24 * 3600
+SLOW_COOLDOWN = 60
+# seconds between two stack samples; in practice at least the interpreter's
+# switch interval (5 ms) while the request holds the GIL
+SAMPLE_INTERVAL = 0.001
+FORMATS = {'prof': 'application/octet-stream', 'folded': 'text/plain; charset=utf-8'}
+_SALT = 'books.profiling'
+_NAME = re.compile(r'^[\w.-]+$')
+_UNSAFE = re.compile(r'[^\w.-]')
+
+_busy = threading.Lock()
+_armed_lock = threading.Lock()
+# views whose next request is to be profiled
+_armed = set()
+# view name -> time.monotonic() of its last arming
+_last_armed = {}
+
+
+def profiles_dir():
+    return Path(getattr(settings, 'BOOKS_PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def make_token():
+    """A value for the X-Profile header."""
+    return signing.TimestampSigner(salt=_SALT).sign('profile')
+
+
+def valid_token(value):
+    try:
+        return signing.TimestampSigner(salt=_SALT).unsign(value, max_age=TOKEN_MAX_AGE) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+class StackSampler(threading.Thread):
+    """Sample the stack of the thread `thread_id` until stop(), as folded stacks."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name='books-profiling-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+    def folded(self):
+        """``frame;frame;frame <samples>`` lines."""
+        return ''.join(f'{stack} {n}\n' for stack, n in self.stacks.items())
+
+
+class ProfilingMiddleware:
+    """Profile the requests picked by the triggers of the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BOOKS_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'BOOKS_PROFILING_SAMPLE_RATE', 0)
+        slow_ms = getattr(settings, 'BOOKS_PROFILING_SLOW_MS', None)
+        self.slow = slow_ms / 1000 if slow_ms else None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        trigger = self.trigger(request)
+        if trigger is None:
+            if self.slow is None:
+                return self.get_response(request)
+            start = time.perf_counter()
+            response = self.get_response(request)
+            self.check_latency(request, time.perf_counter() - start)
+            return response
+        profiler, sampler = cProfile.Profile(), StackSampler(threading.get_ident())
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            response = profiler.runcall(self.get_response, request)
+        finally:
+            sampler.stop()
+            _busy.release()
+        save_safely(profiler, sampler, request, trigger, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        trigger = self.trigger(request)
+        if trigger is None:
+            if self.slow is None:
+                return await self.get_response(request)
+            start = time.perf_counter()
+            response = await self.get_response(request)
+            self.check_latency(request, time.perf_counter() - start)
+            return response
+        # the event loop's thread: the other tasks it runs meanwhile are captured too
+        profiler, sampler = cProfile.Profile(), StackSampler(threading.get_ident())
+        sampler.start()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+            sampler.stop()
+            _busy.release()
+        save_safely(profiler, sampler, request, trigger, time.perf_counter() - start, asgi=True)
+        return response
+
+    def trigger(self, request):
+        """Why `request` is to be profiled, or None. Takes the profiling slot."""
+        token = request.headers.get(HEADER)
+        if token is not None and valid_token(token):
+            trigger = 'header'
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trigger = 'sample'
+        elif _armed and self.disarm(request):
+            trigger = 'slow'
+        else:
+            return None
+        return trigger if _busy.acquire(blocking=False) else None
+
+    @staticmethod
+    def disarm(request):
+        # the view is resolved later in the chain: match the path now
+        try:
+            view = get_resolver(getattr(request, 'urlconf', None)).resolve(request.path_info).view_name
+        except Resolver404:
+            return False
+        with _armed_lock:
+            if view in _armed:
+                _armed.remove(view)
+                return True
+        return False
+
+    def check_latency(self, request, duration):
+        if duration < self.slow:
+            return
+        view = view_name(request)
+        now = time.monotonic()
+        with _armed_lock:
+            if view not in _last_armed or now - _last_armed[view] >= SLOW_COOLDOWN:
+                _armed.add(view)
+                _last_armed[view] = now
+
+
+def save(profiler, sampler, request, trigger, duration, asgi=False):
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    view = view_name(request)
+    created = datetime.now()
+    stem = f"{created:%Y%m%dT%H%M%S%f}-{_UNSAFE.sub('_', view)}-{trigger}"
+    profiler.dump_stats(directory / f'{stem}.prof')
+    (directory / f'{stem}.folded').write_text(sampler.folded())
+    (directory / f'{stem}.json').write_text(json.dumps({
+        'view': view, 'method': request.method, 'path': request.get_full_path(), 'trigger': trigger,
+        'duration_ms': round(duration * 1000, 1), 'created': created.isoformat(timespec='seconds'),
+        'asgi': asgi,
+    }))
+    logger.info('Profiled %s %s (%s, %.0f ms): %s.prof', request.method, request.path, trigger, duration * 1000, stem)
+    for old in sorted(directory.glob('*.json'), reverse=True)[getattr(settings, 'BOOKS_PROFILING_KEEP', 200):]:
+        for fmt in ('json', *FORMATS):
+            old.with_suffix(f'.{fmt}').unlink(missing_ok=True)
+
+
+def save_safely(profiler, sampler, request, trigger, duration, asgi=False):
+    """save(), logging its errors: a full disk must not fail the request."""
+    try:
+        save(profiler, sampler, request, trigger, duration, asgi)
+    except Exception:
+        logger.exception('Could not save the profile of %s %s', request.method, request.path)
+
+
+def recent_profiles():
+    """Metadata of the stored profiles, the most recent first."""
+    profiles = []
+    for path in sorted(profiles_dir().glob('*.json'), reverse=True):
+        try:
+            profiles.append({**json.loads(path.read_text()), 'name': path.stem})
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profiles_view(request):
+    """Admin page: the recent profiles and the X-Profile token."""
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Profils de requêtes',
+        'profiles': recent_profiles(),
+        'header': HEADER,
+        'token': make_token(),
+        'token_hours': TOKEN_MAX_AGE // 3600,
+        'enabled': getattr(settings, 'BOOKS_PROFILING', False),
+    }
+    return TemplateResponse(request, 'admin/books/profiles.html', context)
+
+
+def profile_download(request, name, fmt):
+    """A stored profile, as pstats (``prof``) or folded stacks (``folded``)."""
+    path = profiles_dir() / f'{name}.{fmt}'
+    if not _NAME.match(name) or fmt not in FORMATS or not path.is_file():
+        raise Http404
+    return FileResponse(path.open('rb'), as_attachment=True, filename=path.name, content_type=FORMATS[fmt])
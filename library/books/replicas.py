@@ -0,0 +1,212 @@
+"""Read replicas for the catalog pages.
+
+The views decorated with ``use_replica`` (book and author lists and details,
+search, the API reads, the exports) read the models of this app from one of
+the BOOKS_READ_REPLICAS aliases, picked at random per query. Everything else
+reads from and writes to the primary (``default``): the loan pages, the
+checkout and return flows and their redirect to ``loans_active``, the admin,
+sessions and users. The decision is taken by ``ReplicaRouter`` from the state
+that ``ReplicaMiddleware`` keeps for the current request.
+
+Replicas lag behind the primary by up to BOOKS_REPLICA_LAG seconds, so:
+
+- a browser that wrote (an unsafe method, or a write through the router) gets
+  the PIN_COOKIE for that long and all of its reads stay on the primary:
+  after a checkout its next book page shows the copy it took;
+- a request reads from the primary once it wrote, and inside a transaction;
+- a catalog page or book card rendered from a replica less than
+  BOOKS_REPLICA_LAG seconds after the last catalog change may predate it:
+  books.cache keeps it only until the end of that window.
+
+Locally, the ``replica`` alias is a copy of db.sqlite3 refreshed by
+``manage.py sync_replica``: list it in BOOKS_READ_REPLICAS to try the routing.
+With no replica configured the middleware is not loaded and the router only
+reads a context variable.
+"""
+import contextvars
+import random
+import sqlite3
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'books_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+APP_LABEL = 'books'
+
+_state = contextvars.ContextVar('books_replica_state', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'BOOKS_READ_REPLICAS', [])
+
+
+def replica_lag():
+    return getattr(settings, 'BOOKS_REPLICA_LAG', 5)
+
+
+class ReadState:
+    """Routing state of one request. Shared, not copied, by the threads that
+    run the ORM calls of an async view."""
+
+    def __init__(self, pinned=False):
+        # the request carries the PIN_COOKIE
+        self.pinned = pinned
+        # inside a use_replica view
+        self.replica = False
+        # a read went to a replica
+        self.used = False
+        # a write of this app went through the router
+        self.wrote = False
+
+
+def pinned():
+    """Whether the current request must read from the primary."""
+    state = _state.get()
+    return state is not None and state.pinned
+
+
+def used_replica():
+    """Whether the current request read from a replica."""
+    state = _state.get()
+    return state is not None and state.used
+
+
+class ReplicaRouter:
+    """Send the reads of this app made by use_replica views to a replica."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica or state.wrote or model._meta.app_label != APP_LABEL:
+            return None
+        aliases = replica_aliases()
+        # a transaction on the primary must read its own writes
+        if not aliases or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        state.used = True
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label == APP_LABEL:
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas get their schema from the primary
+        return False if db in replica_aliases() else None
+
+
+def copy_sqlite(target, using=DEFAULT_DB_ALIAS):
+    """Copy the SQLite database `using` to the file `target` with SQLite's
+    online backup (consistent, writers only wait for each step)."""
+    connection = connections[using]
+    connection.ensure_connection()
+    destination = sqlite3.connect(target)
+    try:
+        connection.connection.backup(destination)
+    finally:
+        destination.close()
+
+
+def _routed(state, iterator):
+    """Consume `iterator` (a streamed body, read after the middleware
+    returned) with `state` as the routing state."""
+    iterator = iter(iterator)
+    while True:
+        token = _state.set(state)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _state.reset(token)
+        yield chunk
+
+
+def use_replica(view):
+    """Let `view` read the models of this app from a replica, unless the
+    request is pinned to the primary. Works on sync and async views."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            state = _state.get()
+            if state is None or state.pinned:
+                return await view(request, *args, **kwargs)
+            state.replica = True
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                state.replica = False
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _state.get()
+        if state is None or state.pinned:
+            return view(request, *args, **kwargs)
+        state.replica = True
+        try:
+            response = view(request, *args, **kwargs)
+            # render template responses here: their lazy queries read from the replica too
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+        finally:
+            state.replica = False
+        if response.streaming:
+            body = ReadState()
+            body.replica = True
+            response.streaming_content = _routed(body, response.streaming_content)
+        return response
+    return wrapper
+
+
+class ReplicaMiddleware:
+    """Hold the routing state of the request and pin the browsers that
+    wrote to the primary for BOOKS_REPLICA_LAG seconds."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = ReadState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        state = ReadState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(request, response, state)
+
+    @staticmethod
+    def pin(request, response, state):
+        # raw SQL writes bypass the router: any unsafe method pins as well
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=replica_lag(), httponly=True, samesite='Lax')
+        return response
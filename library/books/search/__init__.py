@@ -0,0 +1,71 @@
+"""Catalog search subsystem.
+
+Book search goes through a pluggable backend (``BOOKS_SEARCH_BACKEND``, a
+dotted path). By default SQLite databases use the FTS5 inverted index kept in
+sync by the Book/Author signals; other databases fall back to the former
+``icontains`` lookups.
+"""
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .base import tokenize
+
+DEFAULT_BACKENDS = {
+    'sqlite': 'books.search.sqlite_fts.FTS5Backend',
+}
+FALLBACK_BACKEND = 'books.search.database.DatabaseBackend'
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'BOOKS_SEARCH_BACKEND', None) or DEFAULT_BACKENDS.get(connection.vendor, FALLBACK_BACKEND)
+        _backend = import_string(path)()
+    return _backend
+
+
+def reset_backend():
+    """Forget the cached backend (used when BOOKS_SEARCH_BACKEND changes)."""
+    global _backend
+    _backend = None
+
+
+def search_books(queryset, q):
+    """Restrict a Book queryset to `q`, ordered by relevance."""
+    return get_backend().search(queryset, q)
+
+
+def isbn_prefix(q):
+    """The ISBN-13 prefix typed in `q` ("978-2-07", or the start of an
+    ISBN-10, which gets the 978 prefix), or None if `q` is not one."""
+    tokens = tokenize(q)
+    if len(tokens) != 1 or not tokens[0].isdigit():
+        return None
+    prefix = tokens[0]
+    if prefix.startswith('97') or len(prefix) < 2:
+        return prefix[:13]
+    return ('978' + prefix)[:12]  # an ISBN-10 check digit is not the ISBN-13 one
+
+
+def suggest_books(queryset, q, limit=10):
+    """Typeahead: up to `limit` books of `queryset` whose ISBN starts with the
+    digits of `q`, then books with title words starting with those of `q`
+    ("1984" is a title too). `queryset` may be a ``values()`` one including
+    ``id``.
+
+    The ISBN lookup is a range scan of the unique index (``isbn >= '97820'
+    AND isbn < '97821'``), which ``LIKE '97820%'`` is not on every database."""
+    books = []
+    prefix = isbn_prefix(q)
+    if prefix is not None:
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        books = list(queryset.filter(isbn__gte=prefix, isbn__lt=upper).order_by('isbn')[:limit])
+    if len(books) < limit:
+        titles = get_backend().suggest_titles(queryset, q)
+        if books:
+            titles = titles.exclude(pk__in=[book['id'] if isinstance(book, dict) else book.pk for book in books])
+        books += titles[:limit - len(books)]
+    return books
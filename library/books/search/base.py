@@ -0,0 +1,38 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS
+
+# words (letters/digits, accents included); hyphens inside ISBNs are dropped
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(q):
+    q = (q or '').strip()
+    if q.replace('-', '').replace(' ', '').isdigit():
+        # ISBN typed with separators: "978-2-07-036822-8"
+        return [q.replace('-', '').replace(' ', '')]
+    return TOKEN_RE.findall(q)
+
+
+class BaseSearchBackend:
+    """Interface of a catalog search backend."""
+
+    def search(self, queryset, q):
+        """Return `queryset` restricted to books matching `q`, best match first."""
+        raise NotImplementedError
+
+    def suggest_titles(self, queryset, q):
+        """Return `queryset` restricted to titles with words starting with
+        those of `q` (typeahead), best match first."""
+        return self.search(queryset, q)
+
+    def index_books(self, book_ids, using=DEFAULT_DB_ALIAS):
+        """(Re)index the given books of database `using`."""
+
+    def remove_books(self, book_ids, using=DEFAULT_DB_ALIAS):
+        """Drop the given books from the index of database `using`."""
+
+    def rebuild(self, using=DEFAULT_DB_ALIAS):
+        """Rebuild the whole index of database `using` from its Book table;
+        returns the number of books indexed."""
+        return 0
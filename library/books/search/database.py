@@ -0,0 +1,26 @@
+from django.db.models import Q
+
+from .base import BaseSearchBackend, tokenize
+
+
+class DatabaseBackend(BaseSearchBackend):
+    """No index: plain ``icontains`` lookups, every word must match somewhere."""
+
+    def search(self, queryset, q):
+        tokens = tokenize(q)
+        if not tokens:
+            return queryset.none()
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(title__icontains=token) | Q(isbn__icontains=token)
+                | Q(author__first_name__icontains=token) | Q(author__last_name__icontains=token)
+            )
+        return queryset.order_by('title')
+
+    def suggest_titles(self, queryset, q):
+        tokens = tokenize(q)
+        if not tokens:
+            return queryset.none()
+        for token in tokens:
+            queryset = queryset.filter(title__icontains=token)
+        return queryset.order_by('title')
@@ -0,0 +1,79 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, FloatField, Func, Value
+
+from .base import BaseSearchBackend, tokenize
+
+TABLE = 'books_book_fts'
+
+# one row per book, rowid = books_book.id
+INDEX_SELECT = (
+    "SELECT b.id, b.title, b.isbn, "
+    "TRIM(COALESCE(a.first_name, '') || ' ' || COALESCE(a.last_name, '')) "
+    "FROM books_book b JOIN books_author a ON a.id = b.author_id"
+)
+
+
+def _chunks(ids, size=500):
+    """Split ids in chunks small enough for SQLite's bound-parameter limit."""
+    ids = [int(pk) for pk in ids]
+    for i in range(0, len(ids), size):
+        chunk = ids[i:i + size]
+        yield chunk, ', '.join(['%s'] * len(chunk))
+
+
+class FTS5Backend(BaseSearchBackend):
+    """SQLite FTS5 inverted index over title, ISBN and author name.
+
+    Every query word is a prefix match (search-as-you-type) and results are
+    ranked with bm25, a title hit weighing more than an author or ISBN hit."""
+
+    # bm25 column weights: title, isbn, author
+    weights = (10.0, 2.0, 5.0)
+
+    def match_expression(self, q):
+        return ' '.join('"%s"*' % token.replace('"', '') for token in tokenize(q))
+
+    def search(self, queryset, q):
+        match = self.match_expression(q)
+        if not match:
+            return queryset.none()
+        return self._matching(queryset, match, *self.weights)
+
+    def suggest_titles(self, queryset, q):
+        # same index, title column only: "title : "word"* title : "word"*"
+        match = ' '.join('title : "%s"*' % token.replace('"', '') for token in tokenize(q))
+        if not match:
+            return queryset.none()
+        return self._matching(queryset, match)
+
+    def _matching(self, queryset, match, *weights):
+        # a join on the virtual table lets SQLite drive the query from the
+        # index and still read bm25() per row; it runs on the queryset's
+        # database, a replica's copy of the index included
+        rank = Func(F('search_entry__document'), *(Value(w) for w in weights), function='bm25', output_field=FloatField())
+        return (
+            queryset.filter(search_entry__document__match=match)
+            .alias(search_rank=rank).order_by('search_rank', 'title')
+        )
+
+    def index_books(self, book_ids, using=DEFAULT_DB_ALIAS):
+        with connections[using].cursor() as cursor:
+            for chunk, placeholders in _chunks(book_ids):
+                cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', chunk)
+                cursor.execute(
+                    f'INSERT INTO {TABLE} (rowid, title, isbn, author) {INDEX_SELECT} WHERE b.id IN ({placeholders})',
+                    chunk,
+                )
+
+    def remove_books(self, book_ids, using=DEFAULT_DB_ALIAS):
+        with connections[using].cursor() as cursor:
+            for chunk, placeholders in _chunks(book_ids):
+                cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+    def rebuild(self, using=DEFAULT_DB_ALIAS):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+            cursor.execute(f'INSERT INTO {TABLE} (rowid, title, isbn, author) {INDEX_SELECT}')
+            count = cursor.rowcount
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+        return count
@@ -0,0 +1,343 @@
+"""Checkout / return engine.
+
+Copy accounting never reads ``copies_available`` into Python: every change is a
+single conditional UPDATE, so two desks checking out the last copy at the same
+time cannot both succeed and no other column of ``Book`` is rewritten. The
+per-card active-loan counter (``BorrowerCard``) is maintained the same way.
+
+A returned copy goes to the book's hold queue before the shelf: the oldest
+waiting ``Hold`` is allocated in the same transaction and ``copies_available``
+is left untouched; only copies nobody is waiting for are released.
+"""
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .cache import catalog_changed
+from .models import Book, BorrowerCard, Hold, HoldCancellation, HoldQueue, Loan, HOLD_PICKUP_PERIOD, LOAN_PERIOD, MAX_ACTIVE_LOANS
+
+
+def reserve_copy(book_id, qty=1):
+    """Take `qty` copies of a book off the shelf.
+
+    ``UPDATE books_book SET copies_available = copies_available - qty
+    WHERE id = %s AND copies_available >= qty``; raises if no row matched."""
+    updated = (
+        Book.objects
+        .filter(pk=book_id, copies_available__gte=qty)
+        .update(copies_available=F('copies_available') - qty)
+    )
+    if not updated:
+        raise ValidationError("Ce livre n'a pas d'exemplaires disponibles.")
+
+
+def release_copy(book_id, qty=1):
+    """Put `qty` copies back on the shelf, never above ``copies_total``."""
+    updated = (
+        Book.objects
+        .filter(pk=book_id, copies_available__lte=F('copies_total') - qty)
+        .update(copies_available=F('copies_available') + qty)
+    )
+    if not updated:
+        raise ValidationError("Le nombre d'exemplaires disponibles ne peut dépasser le total.")
+
+
+def take_card_slot(card_number, qty=1):
+    """Count `qty` more active loans on a card, refusing past MAX_ACTIVE_LOANS.
+
+    One conditional UPDATE on the card row; the row is created on first use."""
+    cards = BorrowerCard.objects.filter(pk=card_number, active_loans__lte=MAX_ACTIVE_LOANS - qty)
+    if cards.update(active_loans=F('active_loans') + qty):
+        return
+    # unknown card (or full): create it if missing, then retry once
+    BorrowerCard.objects.bulk_create([BorrowerCard(card_number=card_number)], ignore_conflicts=True)
+    if not cards.update(active_loans=F('active_loans') + qty):
+        raise ValidationError('Cet usager a déjà 5 emprunts actifs.')
+
+
+def release_card_slot(card_number):
+    BorrowerCard.objects.filter(pk=card_number, active_loans__gt=0).update(active_loans=F('active_loans') - 1)
+
+
+def allocate_holds(book_id, qty=1):
+    """Give up to `qty` copies of a book to the oldest waiting holds; returns
+    how many were allocated. Each round is an index seek on (book, status, id)
+    and a conditional UPDATE, repeated if a hold was canceled meanwhile."""
+    now = timezone.now()
+    allocated = 0
+    while allocated < qty:
+        head = list(
+            Hold.objects.filter(book_id=book_id, status=Hold.STATUS_WAITING)
+            .order_by('id').values_list('pk', flat=True)[:qty - allocated]
+        )
+        if not head:
+            break
+        served = Hold.objects.filter(pk__in=head, status=Hold.STATUS_WAITING).update(
+            status=Hold.STATUS_READY, allocated_at=now, expires_at=now + HOLD_PICKUP_PERIOD,
+        )
+        if served:
+            HoldQueue.objects.filter(pk=book_id).update(allocated=F('allocated') + served)
+        allocated += served
+    return allocated
+
+
+def return_copy(book_id, qty=1):
+    """`qty` copies of a book are back: to the hold queue first, then the shelf."""
+    rest = qty - allocate_holds(book_id, qty)
+    if rest:
+        release_copy(book_id, rest)
+
+
+def return_copies(counts):
+    """return_copy() for ``{book_id: n}``: one query finds the books with a
+    queue, the rest go back to the shelf with a single grouped UPDATE."""
+    counts = Counter(counts)
+    queued = set(
+        Hold.objects.filter(book_id__in=list(counts), status=Hold.STATUS_WAITING)
+        .order_by().values_list('book_id', flat=True).distinct()
+    )
+    for book_id in queued:
+        counts[book_id] -= allocate_holds(book_id, counts[book_id])
+    release_copies({book_id: n for book_id, n in counts.items() if n > 0})
+
+
+def consume_hold(book_id, card_number):
+    """Turn the card's allocated hold on a book into its loan; True if there was one."""
+    return bool(
+        Hold.objects.filter(book_id=book_id, card_number=card_number, status=Hold.STATUS_READY)
+        .update(status=Hold.STATUS_FULFILLED)
+    )
+
+
+def issue_hold_tickets(book_id, qty=1):
+    """Take `qty` consecutive tickets in the book's hold queue; returns the first.
+
+    Create the holds in the same transaction: the UPDATE's lock makes the
+    tickets follow the order of the holds' ids, which allocate_holds() serves."""
+    HoldQueue.objects.bulk_create([HoldQueue(book_id=book_id)], ignore_conflicts=True)
+    HoldQueue.objects.filter(pk=book_id).update(issued=F('issued') + qty)
+    return HoldQueue.objects.values_list('issued', flat=True).get(pk=book_id) - qty + 1
+
+
+def leave_hold_queue(book_id, ticket):
+    """A waiting hold left the book's queue other than from the head: count
+    its ticket in the ranges holding it (see HoldQueue)."""
+    ranges = HoldQueue.ranges_of(ticket)
+    HoldCancellation.objects.bulk_create(
+        [HoldCancellation(book_id=book_id, level=level, block=block) for level, block in ranges],
+        ignore_conflicts=True,
+    )
+    match = Q()
+    for level, block in ranges:
+        match |= Q(level=level, block=block)
+    HoldCancellation.objects.filter(match, book_id=book_id).update(canceled=F('canceled') + 1)
+
+
+def place_hold(book_id, card_number, borrower_name, borrower_email):
+    """Queue a card for a book; one active hold per card and book."""
+    try:
+        with transaction.atomic():
+            return Hold.objects.create(
+                book_id=book_id, card_number=card_number,
+                borrower_name=borrower_name, borrower_email=borrower_email,
+            )
+    except IntegrityError:
+        raise ValidationError('Cet usager a déjà une réservation en cours pour ce livre.')
+
+
+def cancel_hold(hold):
+    """Cancel `hold`; an allocated copy passes to the next in line."""
+    # two conditional UPDATEs rather than read-then-write: a hold allocated
+    # concurrently (WAITING -> READY) must still give its copy back
+    with transaction.atomic():
+        if Hold.objects.filter(pk=hold.pk, status=Hold.STATUS_READY).update(status=Hold.STATUS_CANCELED):
+            return_copy(hold.book_id)
+            catalog_changed([hold.book_id])
+        elif Hold.objects.filter(pk=hold.pk, status=Hold.STATUS_WAITING).update(status=Hold.STATUS_CANCELED):
+            if hold.ticket is not None:
+                leave_hold_queue(hold.book_id, hold.ticket)
+        else:
+            return False
+    hold.status = Hold.STATUS_CANCELED
+    return True
+
+
+def expire_holds(now=None):
+    """Expire the allocated holds not picked up in time; their copies go to
+    the next holds or the shelf. Returns how many expired."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(
+            Hold.objects.select_for_update()
+            .filter(status=Hold.STATUS_READY, expires_at__lt=now)
+            .order_by().values_list('pk', 'book_id')
+        )
+        if not rows:
+            return 0
+        Hold.objects.filter(pk__in=[pk for pk, _ in rows]).update(status=Hold.STATUS_EXPIRED)
+        return_copies(Counter(book_id for _, book_id in rows))
+        catalog_changed({book_id for _, book_id in rows})
+    return len(rows)
+
+
+def lock_book(book_id):
+    """Lock the book row for the rest of the transaction.
+
+    SELECT ... FOR UPDATE on backends that support it; a no-op on SQLite, where
+    the write lock taken by the conditional UPDATE already serializes writers."""
+    return Book.objects.select_for_update().get(pk=book_id)
+
+
+def checkout(loan):
+    """Create `loan` and reserve its copy in one transaction.
+
+    The reservation itself happens in the ``pre_save`` signal, so the admin and
+    plain ``Loan.objects.create()`` go through the same path; this wrapper only
+    guarantees the copy is given back if the INSERT fails."""
+    with transaction.atomic():
+        loan.book = lock_book(loan.book_id)
+        loan.save()
+    return loan
+
+
+def return_loan(loan):
+    """Mark `loan` returned and release its copy and card slot in one transaction.
+
+    The status change is a conditional UPDATE, like return_loans(): of two
+    concurrent returns of the same loan only the one whose UPDATE matched
+    releases the copy and the card slot, whatever status `loan` was loaded
+    with."""
+    now = timezone.now()
+    with transaction.atomic():
+        returned = (
+            Loan.objects.filter(pk=loan.pk).exclude(status__in=Loan.CLOSED_STATUSES)
+            .update(returned_at=now, status=Loan.STATUS_RETURNED)
+        )
+        if returned:
+            return_copy(loan.book_id)
+            release_card_slot(loan.card_number)
+            # an UPDATE: no Loan signals fired
+            catalog_changed([loan.book_id])
+    if returned:
+        loan.returned_at, loan.status = now, Loan.STATUS_RETURNED
+        # what the database now holds: not a change for a later save()
+        loan._snapshot({'returned_at', 'status'})
+    else:
+        loan.refresh_from_db(fields=['status', 'returned_at'])
+    return loan
+
+
+def _per_row(counts):
+    """CASE id WHEN a THEN n_a WHEN b THEN n_b ... END, for grouped UPDATEs."""
+    return Case(*(When(pk=pk, then=Value(n)) for pk, n in counts.items()), default=Value(0), output_field=IntegerField())
+
+
+def release_copies(counts):
+    """Put back ``{book_id: n}`` copies with a single UPDATE (capped at copies_total)."""
+    if counts:
+        Book.objects.filter(pk__in=list(counts)).update(
+            copies_available=Least(F('copies_available') + _per_row(counts), F('copies_total'))
+        )
+
+
+def release_card_slots(counts):
+    """Give back ``{card_number: n}`` card slots with a single UPDATE."""
+    if counts:
+        BorrowerCard.objects.filter(pk__in=list(counts)).update(
+            active_loans=Greatest(F('active_loans') - _per_row(counts), Value(0))
+        )
+
+
+def return_loans(loan_ids):
+    """Return many loans at once (class drop-off, admin action, batch endpoint).
+
+    Set-based instead of one ``mark_returned()`` per loan: one UPDATE for the
+    loans, one grouped UPDATE for the books and one for the cards, whatever
+    the number of loans, plus the hold allocations of the books that have a
+    queue. Already closed loans are skipped. Returns the number
+    of loans returned."""
+    with transaction.atomic():
+        rows = list(
+            Loan.objects.select_for_update()
+            .filter(pk__in=list(loan_ids))
+            .exclude(status__in=Loan.CLOSED_STATUSES)
+            .order_by()
+            .values_list('pk', 'book_id', 'card_number')
+        )
+        if not rows:
+            return 0
+        Loan.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+            status=Loan.STATUS_RETURNED, returned_at=timezone.now()
+        )
+        return_copies(Counter(book_id for _, book_id, _ in rows))
+        release_card_slots(Counter(card for _, _, card in rows))
+        # set-based: no Loan signals fired
+        catalog_changed({book_id for _, book_id, _ in rows})
+    return len(rows)
+
+
+def checkout_batch(book_ids, card_number, borrower_name, borrower_email, comments=''):
+    """Check out a whole basket for one card, all or nothing.
+
+    Availability and the 5-loan limit are validated once for the basket, the
+    copies are taken with one UPDATE (or from the card's allocated holds) and
+    the loans inserted with one
+    ``bulk_create``. On failure nothing is written and a ValidationError is
+    raised whose ``message_dict`` maps each faulty book id (as a string) to its
+    errors, basket-wide problems being under ``__all__``."""
+    book_ids = [int(pk) for pk in book_ids]
+    errors = {}
+    if not book_ids:
+        raise ValidationError({'__all__': 'Le panier est vide.'})
+    if len(set(book_ids)) != len(book_ids):
+        errors['__all__'] = ['Un même livre ne peut être emprunté deux fois.']
+    with transaction.atomic():
+        books = Book.objects.select_for_update().in_bulk(book_ids)
+        # copies set aside for this card's allocated holds don't come from the shelf
+        held = set(
+            Hold.objects.filter(card_number=card_number, book_id__in=book_ids, status=Hold.STATUS_READY)
+            .values_list('book_id', flat=True)
+        )
+        for pk in book_ids:
+            if pk not in books:
+                errors[str(pk)] = ['Livre introuvable.']
+            elif pk not in held and books[pk].copies_available <= 0:
+                errors[str(pk)] = ["Ce livre n'a pas d'exemplaires disponibles."]
+        if BorrowerCard.active_count(card_number) + len(book_ids) > MAX_ACTIVE_LOANS:
+            errors.setdefault('__all__', []).append(f'Cet usager ne peut pas dépasser {MAX_ACTIVE_LOANS} emprunts actifs.')
+        if errors:
+            raise ValidationError(errors)
+
+        # still conditional: a concurrent checkout on a backend without row
+        # locks makes the counts differ and the whole basket roll back
+        shelf = [pk for pk in book_ids if pk not in held]
+        taken = (
+            Book.objects.filter(pk__in=shelf, copies_available__gt=0)
+            .update(copies_available=F('copies_available') - 1)
+        ) if shelf else 0
+        if held:
+            taken += (
+                Hold.objects.filter(card_number=card_number, book_id__in=held, status=Hold.STATUS_READY)
+                .update(status=Hold.STATUS_FULFILLED)
+            )
+        if taken != len(book_ids):
+            raise ValidationError({'__all__': ["Un des livres vient d'être emprunté, veuillez réessayer."]})
+        take_card_slot(card_number, len(book_ids))
+
+        now = timezone.now()
+        # bulk_create skips Loan.save() and the signals: the copies and the
+        # card slot were handled above
+        loans = Loan.objects.bulk_create([
+            Loan(
+                book_id=pk, card_number=card_number, borrower_name=borrower_name,
+                borrower_email=borrower_email, comments=comments,
+                borrowed_at=now, due_date=now + LOAN_PERIOD, status=Loan.STATUS_BORROWED,
+            )
+            for pk in book_ids
+        ])
+        catalog_changed(book_ids)
+    return loans
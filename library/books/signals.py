@@ -1,54 +1,136 @@
 from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Q
-from .models import Loan, Book
+from .models import Loan, Book, Author, Category, Hold
+from . import search, thumbnails
+from .cache import catalog_changed
+from .services import (
+    consume_hold, issue_hold_tickets, leave_hold_queue, reserve_copy, return_copy, take_card_slot, release_card_slot,
+)
 
 
 @receiver(pre_save, sender=Loan)
 def loan_pre_save(sender, instance, **kwargs):
     """Before saving a loan, ensure availability and reserve a copy for new loans."""
-    # store old status for post_save
-    if instance.pk:
-        try:
-            old = Loan.objects.get(pk=instance.pk)
-            instance._old_status = old.status
-        except Loan.DoesNotExist:
-            instance._old_status = None
-    else:
+    # store old status for post_save: from the loaded values, without a query
+    if instance._state.adding:
         instance._old_status = None
+    elif instance.is_tracked('status'):
+        instance._old_status = instance.loaded_value('status')
+    else:
+        # built by hand rather than loaded from the database
+        instance._old_status = Loan.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
 
-    # On creation: check availability, limit of 5 active loans and decrement
+    # On creation: take a slot on the card (limit of 5 active loans) and reserve a copy
     if instance._state.adding and instance.status == Loan.STATUS_BORROWED:
-        if instance.book.copies_available <= 0:
-            raise ValidationError('Ce livre n\'a pas d\'exemplaires disponibles.')
-        # check active loans for this card
-        active_count = Loan.objects.filter(card_number=instance.card_number).filter(~Q(status=Loan.STATUS_RETURNED) & ~Q(status=Loan.STATUS_CANCELED)).count()
-        if active_count >= 5:
-            raise ValidationError('Cet usager a déjà 5 emprunts actifs.')
-        # decrement inside a transaction to reduce race window
         with transaction.atomic():
-            instance.book.decrement_available()
+            take_card_slot(instance.card_number)
+            # the copy set aside for the card's hold, else one from the shelf
+            # (conditional UPDATE: fails instead of overselling when it is empty)
+            if not consume_hold(instance.book_id, instance.card_number):
+                reserve_copy(instance.book_id)
 
 
 @receiver(post_save, sender=Loan)
 def loan_post_save(sender, instance, created, **kwargs):
-    """After saving a loan, handle status changes (return) to increment availability."""
-    # If status changed to returned, increment available
+    """After saving a loan, handle status changes (return, cancel) to free the copy
+    (for the next hold, else the shelf) and the card slot."""
     old_status = getattr(instance, '_old_status', None)
-    if not created and old_status != instance.status and instance.status == Loan.STATUS_RETURNED:
-        with transaction.atomic():
-            instance.book.increment_available()
+    if (not created and old_status not in Loan.CLOSED_STATUSES
+            and instance.status in Loan.CLOSED_STATUSES):
+        return_copy(instance.book_id)
+        release_card_slot(instance.card_number)
 
 
 @receiver(post_delete, sender=Loan)
 def loan_post_delete(sender, instance, **kwargs):
-    """If a loan is deleted and it wasn't returned, free the copy."""
-    if instance.status not in [Loan.STATUS_RETURNED, Loan.STATUS_CANCELED]:
+    """If a loan is deleted and it wasn't returned, free the copy and card slot."""
+    if instance.status not in Loan.CLOSED_STATUSES:
+        release_card_slot(instance.card_number)
         try:
-            with transaction.atomic():
-                instance.book.increment_available()
+            return_copy(instance.book_id)
         except Exception:
             # don't raise to avoid failures during cleanup
             pass
+
+
+@receiver(pre_save, sender=Hold)
+def hold_pre_save(sender, instance, **kwargs):
+    """Give a new hold the next ticket in its book's queue (place_hold, the admin)."""
+    if instance._state.adding and instance.status == Hold.STATUS_WAITING and instance.ticket is None:
+        instance.ticket = issue_hold_tickets(instance.book_id)
+
+
+@receiver(post_delete, sender=Hold)
+def hold_post_delete(sender, instance, origin=None, **kwargs):
+    """A waiting hold deleted leaves the queue like a canceled one, unless its
+    book (and so its queue) goes with it."""
+    if instance.status == Hold.STATUS_WAITING and instance.ticket is not None and not isinstance(origin, Book):
+        leave_hold_queue(instance.book_id, instance.ticket)
+
+
+# -------------------------
+# Search index synchronisation
+# -------------------------
+
+# columns stored in the search index
+INDEXED_FIELDS = {'title', 'isbn', 'author', 'author_id'}
+
+
+@receiver(post_save, sender=Book)
+def book_post_save(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_FIELDS & set(update_fields):
+        return
+    search.get_backend().index_books([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Book)
+def book_post_delete(sender, instance, using, **kwargs):
+    search.get_backend().remove_books([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Author)
+def author_post_save(sender, instance, created, using, **kwargs):
+    """The author's name is indexed with each of their books."""
+    if not created:
+        search.get_backend().index_books(instance.books.using(using).values_list('pk', flat=True), using=using)
+
+
+# -------------------------
+# Page cache invalidation
+# -------------------------
+
+@receiver([post_save, post_delete], sender=Book)
+def book_catalog_changed(sender, instance, **kwargs):
+    catalog_changed([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Loan)
+def loan_catalog_changed(sender, instance, **kwargs):
+    """Catalog pages and cards show availability, so loans invalidate them too."""
+    catalog_changed([instance.book_id])
+
+
+@receiver(post_save, sender=Author)
+def author_catalog_changed(sender, instance, created, **kwargs):
+    catalog_changed([] if created else instance.books.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver([post_save, post_delete], sender=Category)
+def catalog_post_change(sender, **kwargs):
+    catalog_changed()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Category)
+def image_post_save(sender, instance, update_fields=None, **kwargs):
+    """New cover/photo/image: render its thumbnails in the background."""
+    field = thumbnails.IMAGE_FIELDS[sender._meta.label]
+    if update_fields is not None and field not in update_fields:
+        return
+    image = getattr(instance, field)
+    # uploads get a fresh name, so a rendered name is an unchanged image
+    if image and not thumbnails.has_derivatives(image.name, image.storage):
+        thumbnails.schedule(image.name, image.storage)
@@ -0,0 +1,117 @@
+// Book picker (books.widgets.BookPicker): asks the typeahead endpoint for
+// matches as the user types and stores the chosen book id in the hidden input.
+(function () {
+  'use strict';
+
+  var MIN_LENGTH = 2;
+  var DELAY = 150;
+
+  function label(book) {
+    var author = [book.author_first_name, book.author_last_name].filter(Boolean).join(' ');
+    return book.title + (author ? ' — ' + author : '') + ' (' + book.isbn + ')';
+  }
+
+  function setup(picker) {
+    var value = picker.querySelector('.book-picker-value');
+    var input = picker.querySelector('.book-picker-input');
+    var list = picker.querySelector('.book-picker-results');
+    var timer = null;
+    var pending = null;
+    var active = -1;
+
+    function close() {
+      list.hidden = true;
+      list.innerHTML = '';
+      input.setAttribute('aria-expanded', 'false');
+      active = -1;
+    }
+
+    function choose(book) {
+      value.value = book.id;
+      input.value = book.title + ' (' + book.isbn + ')';
+      close();
+    }
+
+    function highlight(index) {
+      var items = list.querySelectorAll('li');
+      if (!items.length) {
+        return;
+      }
+      active = (index + items.length) % items.length;
+      items.forEach(function (item, i) {
+        item.classList.toggle('active', i === active);
+        item.setAttribute('aria-selected', i === active ? 'true' : 'false');
+      });
+    }
+
+    function show(books) {
+      list.innerHTML = '';
+      books.forEach(function (book) {
+        var item = document.createElement('li');
+        item.className = 'list-group-item list-group-item-action';
+        item.setAttribute('role', 'option');
+        item.textContent = label(book);
+        if (book.copies_available <= 0) {
+          var badge = document.createElement('span');
+          badge.className = 'badge bg-secondary ms-2';
+          badge.textContent = 'indisponible';
+          item.appendChild(badge);
+        }
+        item.addEventListener('mousedown', function (event) {
+          event.preventDefault();  // keep the focus: no blur before the click
+          choose(book);
+        });
+        item.book = book;
+        list.appendChild(item);
+      });
+      list.hidden = !books.length;
+      input.setAttribute('aria-expanded', books.length ? 'true' : 'false');
+      active = -1;
+    }
+
+    function lookup() {
+      var q = input.value.trim();
+      if (q.length < MIN_LENGTH) {
+        close();
+        return;
+      }
+      if (pending) {
+        pending.abort();
+      }
+      pending = new AbortController();
+      fetch(picker.dataset.url + '?q=' + encodeURIComponent(q), {signal: pending.signal})
+        .then(function (response) { return response.json(); })
+        .then(function (data) { show(data.results); })
+        .catch(function (error) {
+          if (error.name !== 'AbortError') {
+            close();
+          }
+        });
+    }
+
+    input.addEventListener('input', function () {
+      value.value = '';  // typing again drops the previous choice
+      clearTimeout(timer);
+      timer = setTimeout(lookup, DELAY);
+    });
+    input.addEventListener('keydown', function (event) {
+      if (list.hidden) {
+        return;
+      }
+      if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+        event.preventDefault();
+        highlight(active + (event.key === 'ArrowDown' ? 1 : -1));
+      } else if (event.key === 'Enter' && active >= 0) {
+        event.preventDefault();
+        choose(list.querySelectorAll('li')[active].book);
+      } else if (event.key === 'Escape') {
+        close();
+      }
+    });
+    input.addEventListener('blur', close);
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('.book-picker').forEach(setup);
+  });
+})();
@@ -0,0 +1,81 @@
+"""Overdue sweeper: keeps ``Loan.STATUS_LATE`` up to date.
+
+Each run is a single indexed ``UPDATE`` on ``(status, due_date)``. Loans
+expire in due_date order, so the sweeper remembers up to when it already
+looked (its high-water mark) and the next run only touches loans that expired
+in between. Run it with ``manage.py sweep_overdue`` (cron, or ``--loop``), or
+in-process by setting ``BOOKS_OVERDUE_SWEEP_INTERVAL`` (seconds). The
+in-process loop also expires the holds not picked up in time; it only runs in
+the server processes, started by start_from_settings() from the WSGI/ASGI
+entry points (runserver included), not in migrate, shell, the other
+management commands or the tests.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import services
+from .models import Loan, SweeperState
+
+logger = logging.getLogger(__name__)
+
+OVERDUE = 'overdue'
+
+_thread = None
+_stop = None
+
+
+def sweep_overdue(now=None, full=False):
+    """Mark borrowed loans due before `now` as late; returns how many.
+
+    `full` ignores the high-water mark, e.g. after due dates were edited by hand."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        state, _ = SweeperState.objects.select_for_update().get_or_create(name=OVERDUE)
+        loans = Loan.objects.filter(status=Loan.STATUS_BORROWED, due_date__lt=now)
+        if state.high_water_mark and not full:
+            loans = loans.filter(due_date__gte=state.high_water_mark)
+        count = loans.update(status=Loan.STATUS_LATE)
+        state.high_water_mark = now
+        state.last_run_at = now
+        state.last_count = count
+        state.save()
+    return count
+
+
+def _run(interval, stop):
+    while not stop.wait(interval):
+        close_old_connections()
+        try:
+            count = sweep_overdue()
+            if count:
+                logger.info('%d emprunt(s) passé(s) en retard.', count)
+            count = services.expire_holds()
+            if count:
+                logger.info('%d réservation(s) expirée(s).', count)
+        except Exception:
+            logger.exception('overdue sweep failed')
+        finally:
+            close_old_connections()
+
+
+def start(interval):
+    """Run the sweeper every `interval` seconds in a daemon thread of this process.
+
+    Returns the Event that stops it."""
+    global _thread, _stop
+    if _thread is None or not _thread.is_alive():
+        _stop = threading.Event()
+        _thread = threading.Thread(target=_run, args=(interval, _stop), name='overdue-sweeper', daemon=True)
+        _thread.start()
+    return _stop
+
+
+def start_from_settings():
+    """start() every BOOKS_OVERDUE_SWEEP_INTERVAL seconds, if set."""
+    interval = getattr(settings, 'BOOKS_OVERDUE_SWEEP_INTERVAL', None)
+    if interval:
+        return start(interval)
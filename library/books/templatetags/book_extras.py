@@ -1,6 +1,9 @@
 from django import template
+from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from ..models import Loan
+from ..cache import render_book_cards
+from .. import thumbnails
 
 register = template.Library()
 
@@ -18,6 +21,9 @@ def format_isbn(value):
 
 @register.filter
 def days_overdue(loan):
+    # computed by the database when the queryset used Loan.objects.with_penalties()
+    if hasattr(loan, 'overdue_days'):
+        return loan.overdue_days
     try:
         return loan.days_overdue()
     except Exception:
@@ -26,6 +32,8 @@ def days_overdue(loan):
 
 @register.filter
 def penalty_amount(loan):
+    if hasattr(loan, 'penalty'):
+        return loan.penalty
     try:
         return loan.penalty_amount()
     except Exception:
@@ -45,6 +53,57 @@ def loan_status_badge(loan):
     return mark_safe(f"<span class='badge bg-{cls}'>{label}</span>")
 
 
+@register.simple_tag(takes_context=True)
+def page_url(context, page_obj, direction):
+    """Query string of the next/previous page, keeping the other GET parameters.
+
+    Works for both offset pages (?page=N) and cursor pages (?cursor=...)."""
+    params = context['request'].GET.copy()
+    if hasattr(page_obj, 'next_cursor'):
+        params.pop('page', None)
+        params['cursor'] = page_obj.next_cursor if direction == 'next' else page_obj.previous_cursor
+    else:
+        params.pop('cursor', None)
+        params['page'] = page_obj.next_page_number() if direction == 'next' else page_obj.previous_page_number()
+    return '?' + params.urlencode()
+
+
 @register.inclusion_tag('partials/book_card.html')
 def book_card(book):
     return {'book': book}
+
+
+@register.simple_tag
+def book_cards(books):
+    """Cached variant of book_card for a whole page: ``{% book_cards books as cards %}``."""
+    return render_book_cards(list(books))
+
+
+@register.simple_tag
+def cached_book_card(book):
+    return render_book_cards([book])[0]
+
+
+@register.filter
+def thumbnail_url(image, size='small'):
+    """``{{ book.cover|thumbnail_url:'medium' }}``: URL of a thumbnail (JPEG
+    or PNG), the original's until it is rendered."""
+    if not image:
+        return ''
+    urls = thumbnails.urls(image, size)
+    return urls[1] if urls else image.url
+
+
+@register.simple_tag
+def picture(image, size='small', alt='', css_class=''):
+    """``{% picture author.photo 'small' alt=author.full_name %}``: a <picture>
+    offering the WebP thumbnail, with the JPEG/PNG one as fallback."""
+    if not image:
+        return ''
+    urls = thumbnails.urls(image, size)
+    if urls is None:
+        return format_html('<img src="{}" class="{}" alt="{}">', image.url, css_class, alt)
+    return format_html(
+        '<picture><source srcset="{}" type="image/webp"><img src="{}" class="{}" alt="{}"></picture>',
+        urls[0], urls[1], css_class, alt,
+    )
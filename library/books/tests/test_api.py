@@ -0,0 +1,77 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from books.models import Author, Book, Category
+
+
+@override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hugo = Author.objects.create(first_name='Victor', last_name='Hugo')
+        cls.camus = Author.objects.create(first_name='Albert', last_name='Camus')
+        cls.roman = Category.objects.create(name='Roman')
+        cls.books = [
+            Book.objects.create(title=title, isbn=isbn, author=author, category=cls.roman, copies_total=2, copies_available=n)
+            for title, isbn, author, n in [
+                ('Les Misérables', '9780000000002', cls.hugo, 2),
+                ("L'Étranger", '9780000000019', cls.camus, 0),
+                ('Notre-Dame de Paris', '9780000000026', cls.hugo, 1),
+            ]
+        ]
+
+    def get(self, name, *args, **params):
+        resp = self.client.get(reverse(f'books:{name}', args=args), params)
+        return resp, resp.json()
+
+    def test_sparse_fields_project_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp, data = self.get('api_book_list', fields='title,copies_available')
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertEqual(data['results'][0], {'title': "L'Étranger", 'copies_available': 0})
+        sql = ctx.captured_queries[0]['sql']
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"description"', sql)
+
+    def test_related_fields_join_only_when_requested(self):
+        with CaptureQueriesContext(connection) as ctx:
+            _, data = self.get('api_book_list', fields='isbn,author_last_name,category_name', author=self.hugo.pk)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual([r['author_last_name'] for r in data['results']], ['Hugo', 'Hugo'])
+        self.assertEqual(data['results'][0]['category_name'], 'Roman')
+
+    def test_cursor_pagination(self):
+        _, data = self.get('api_book_list', limit=2)
+        self.assertEqual([r['id'] for r in data['results']], [self.books[1].pk, self.books[0].pk])
+        self.assertIsNone(data['previous'])
+        self.assertTrue(data['next'].startswith(reverse('books:api_book_list') + '?'))
+        resp = self.client.get(data['next'])
+        page2 = resp.json()
+        self.assertEqual([r['title'] for r in page2['results']], ['Notre-Dame de Paris'])
+        self.assertIsNone(page2['next'])
+        self.assertIsNotNone(page2['previous'])
+
+    def test_errors(self):
+        resp, data = self.get('api_book_list', fields='title,secret')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('secret', data['error'])
+        self.assertEqual(self.get('api_book_list', cursor='garbage')[0].status_code, 400)
+        self.assertEqual(self.get('api_book_list', author='abc')[0].status_code, 400)
+        self.assertEqual(self.client.get(reverse('books:api_book_detail', args=[999])).status_code, 404)
+
+    def test_authors_categories_and_details(self):
+        _, data = self.get('api_author_list', fields='last_name,book_count')
+        self.assertEqual(data['results'], [{'last_name': 'Camus', 'book_count': 1}, {'last_name': 'Hugo', 'book_count': 2}])
+        _, data = self.get('api_category_detail', self.roman.pk, fields='name,book_count')
+        self.assertEqual(data, {'name': 'Roman', 'book_count': 3})
+        _, data = self.get('api_book_detail', self.books[0].pk)
+        self.assertEqual(data['isbn'], '9780000000002')
+
+    def test_availability(self):
+        ids = f'{self.books[0].pk},{self.books[1].pk}'
+        with self.assertNumQueries(1):
+            _, data = self.get('api_availability', ids=ids)
+        self.assertEqual([r['available'] for r in data['results']], [True, False])
+        self.assertEqual(self.get('api_availability', ids='1,x')[0].status_code, 400)
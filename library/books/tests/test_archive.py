@@ -0,0 +1,133 @@
+import io
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from books import archive, exports
+from books.models import Author, Book, BorrowerCard, Loan, LoanArchive
+from books.pagination import MergedCursorPaginator
+
+
+class LoanArchiveTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name='Victor', last_name='Hugo')
+        self.book = Book.objects.create(title='Les Misérables', isbn='9780000000002', author=author,
+                                        copies_total=3, copies_available=3)
+        self.now = timezone.now()
+        # (status, days since borrowed, days since returned), in id order
+        self.loans = [
+            self.loan(Loan.STATUS_RETURNED, 900, 890),
+            self.loan(Loan.STATUS_LATE, 800, None),
+            self.loan(Loan.STATUS_CANCELED, 700, None),
+            self.loan(Loan.STATUS_RETURNED, 600, 560),  # 26 days late
+            self.loan(Loan.STATUS_RETURNED, 30, 20),
+            self.loan(Loan.STATUS_BORROWED, 5, None),
+        ]
+
+    def loan(self, status, borrowed, returned):
+        # created in its final status: only a borrowed loan takes a copy and a card slot
+        loan = Loan.objects.create(book=self.book, borrower_name='Jean', borrower_email='j@example.com',
+                                   card_number='C1', status=status)
+        borrowed_at = self.now - timedelta(days=borrowed)
+        Loan.objects.filter(pk=loan.pk).update(
+            borrowed_at=borrowed_at, due_date=borrowed_at + timedelta(days=14),
+            returned_at=self.now - timedelta(days=returned) if returned is not None else None,
+        )
+        return Loan.objects.get(pk=loan.pk)
+
+    def archive(self, **kwargs):
+        return sum(archive.archive_loans(now=self.now, **kwargs))
+
+    def test_moves_old_closed_loans(self):
+        copies = Book.objects.get(pk=self.book.pk).copies_available
+        active = BorrowerCard.active_count('C1')
+        self.assertEqual(self.archive(batch_size=1), 3)
+        self.assertEqual(list(LoanArchive.objects.order_by('id').values_list('id', flat=True)),
+                         [self.loans[0].pk, self.loans[2].pk, self.loans[3].pk])
+        self.assertEqual(list(Loan.objects.order_by('id').values_list('id', flat=True)),
+                         [self.loans[1].pk, self.loans[4].pk, self.loans[5].pk])
+        archived = LoanArchive.objects.get(pk=self.loans[3].pk)
+        self.assertEqual((archived.book_id, archived.card_number, archived.status, archived.borrowed_at, archived.returned_at),
+                         (self.book.pk, 'C1', 'returned', self.loans[3].borrowed_at, self.loans[3].returned_at))
+        # the copies and card counters only depend on the active loans
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_available, copies)
+        self.assertEqual(BorrowerCard.active_count('C1'), active)
+        self.assertEqual(self.archive(), 0)
+        # the next ids do not reuse the archived ones
+        self.assertGreater(self.loan(Loan.STATUS_BORROWED, 0, None).pk, self.loans[-1].pk)
+
+    def test_age_and_limit(self):
+        self.assertEqual(self.archive(after=timedelta(days=10), limit=2), 2)
+        self.assertEqual(self.archive(after=timedelta(days=10)), 2)
+        self.assertEqual(Loan.objects.count(), 2)
+
+    def test_history_reads_both_tables(self):
+        self.archive()
+        url = reverse('books:loan_history', args=['C1'])
+        with self.settings(BOOKS_PAGE_CACHE_TIMEOUT=0):
+            seen = []
+            params = {}
+            while True:
+                resp = self.client.get(url, params)
+                self.assertEqual(resp.status_code, 200)
+                page = resp.context['page_obj']
+                seen += [(type(loan), loan.pk) for loan in page]
+                if not page.has_next():
+                    break
+                params = {'cursor': page.next_cursor}
+                self.assertLessEqual(len(page), 20)
+        expected = sorted(self.loans, key=lambda loan: loan.borrowed_at, reverse=True)
+        self.assertEqual([pk for _, pk in seen], [loan.pk for loan in expected])
+        self.assertEqual({model for model, _ in seen}, {Loan, LoanArchive})
+
+    def test_history_pages_across_tables(self):
+        self.archive()
+        view = reverse('books:loan_history', args=['C1'])
+        paginator = MergedCursorPaginator(
+            [Loan.objects.filter(card_number='C1'), LoanArchive.objects.filter(card_number='C1')], 2, ('-borrowed_at', '-id'))
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        forward = [[loan.pk for loan in page] for page in pages]
+        self.assertEqual(sum(forward, []), [loan.pk for loan in sorted(self.loans, key=lambda l: l.borrowed_at, reverse=True)])
+        self.assertEqual(len(pages), 3)
+        back = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual([loan.pk for loan in back], forward[1])
+        self.assertEqual(self.client.get(view, {'cursor': 'x'}).status_code, 404)
+
+    def test_exports_and_fines(self):
+        fines = archive.fines_report(now=self.now)
+        self.archive()
+        self.assertEqual(archive.fines_report(now=self.now), fines)
+        self.assertEqual([row['loans'] for row in archive.fines_report(by='month', now=self.now)], [1, 1])
+        self.assertEqual(fines[0]['loans'], 2)
+        self.assertEqual(Loan.objects.fines_report(now=self.now).get()['loans'], 1)
+
+        with self.assertNumQueries(2):
+            lines = ''.join(exports.stream(exports.loan_querysets(now=self.now), exports.LOAN_COLUMNS, 'jsonl',
+                                           chunk_size=1)).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [loan.pk for loan in self.loans])
+        self.assertEqual(json.loads(lines[3])['overdue_days'], 26)
+        # the archive only holds closed loans
+        self.assertEqual(len(exports.loan_querysets(status=Loan.STATUS_LATE)), 1)
+
+        staff = get_user_model().objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        self.client.force_login(staff)
+        resp = self.client.get(reverse('books:loan_export'), {'format': 'jsonl', 'status': 'returned'})
+        ids = [json.loads(line)['id'] for line in b''.join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual(ids, [self.loans[0].pk, self.loans[3].pk, self.loans[4].pk])
+
+    def test_command_and_book_delete(self):
+        out = io.StringIO()
+        call_command('archive_loans', '--dry-run', stdout=out)
+        self.assertIn('3 emprunt(s) à archiver', out.getvalue())
+        call_command('archive_loans', '--days', '100', '--batch-size', '2', stdout=out)
+        self.assertIn('3 emprunt(s) archivé(s)', out.getvalue())
+        Loan.objects.filter(pk__in=[self.loans[1].pk, self.loans[5].pk]).update(status=Loan.STATUS_RETURNED)
+        self.book.delete()
+        self.assertFalse(LoanArchive.objects.exists())
@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from books.models import Author, Book
+
+
+class AsyncCatalogViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Victor', last_name='Hugo')
+        cls.books = [
+            Book.objects.create(title=f'Tome {i:02d}', isbn=isbn, author=cls.author, copies_total=2, copies_available=i % 2)
+            for i, isbn in enumerate(['9780000000002', '9780000000019', '9780000000026', '9780000000033',
+                                      '9780000000040', '9780000000057', '9780000000064', '9780000000071',
+                                      '9780000000088', '9780000000095'])
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+    async def test_list_matches_sync_view(self):
+        resp = await self.async_client.get(reverse('books:book_list_async'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, 'Tome 00')
+        self.assertNotContains(resp, 'Tome 08')
+        self.assertEqual(resp.context['page_obj'].paginator.count, None)  # keyset: no COUNT(*)
+        next_page = await self.async_client.get(reverse('books:book_list_async'), {'cursor': resp.context['page_obj'].next_cursor})
+        self.assertContains(next_page, 'Tome 09')
+        sync = await self.async_client.get(reverse('books:book_list'))
+        self.assertEqual(
+            [b.pk for b in sync.context['books']], [b.pk for b in resp.context['books']],
+        )
+        self.assertEqual((await self.async_client.get(reverse('books:book_list_async'), {'cursor': 'x'})).status_code, 404)
+
+    @override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+    async def test_search_pages_by_offset(self):
+        resp = await self.async_client.get(reverse('books:book_list_async'), {'q': 'tome', 'page': 2})
+        self.assertEqual(resp.context['page_obj'].number, 2)
+        self.assertEqual(len(resp.context['books']), 2)
+
+    async def test_detail_and_page_cache(self):
+        url = reverse('books:book_detail_async', args=[self.books[0].pk])
+        first = await self.async_client.get(url)
+        self.assertContains(first, 'Tome 00')
+        resp = await self.async_client.get(url, headers={'if-none-match': first['ETag']})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual((await self.async_client.get(reverse('books:book_detail_async', args=[999]))).status_code, 404)
+
+    @override_settings(MESSAGE_STORAGE='django.contrib.messages.storage.session.SessionStorage')
+    async def test_messages_in_session(self):
+        # flash messages read from the session: no sync query from the event loop
+        user = await get_user_model().objects.acreate_user('staff', 'staff@example.com', 'pw')
+        await self.async_client.aforce_login(user)
+        resp = await self.async_client.get(reverse('books:book_list_async'))
+        self.assertEqual(resp.status_code, 200)
+
+    async def test_availability(self):
+        ids = f'{self.books[0].pk},{self.books[1].pk}'
+        resp = await self.async_client.get(reverse('books:availability_async'), {'ids': ids})
+        self.assertEqual([r['available'] for r in resp.json()['results']], [False, True])
+        resp = await self.async_client.get(reverse('books:availability_async'), {'ids': 'a'})
+        self.assertEqual(resp.status_code, 400)
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from books.models import Author, Book, Loan
+from books import cache as page_cache
+from books import services
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='Jean', last_name='Dupont')
+        self.book = Book.objects.create(title='Cached', isbn='9780000000002', author=self.author, copies_total=2, copies_available=2)
+        self.url = reverse('books:book_detail', args=[self.book.pk])
+
+    def test_second_hit_skips_the_database(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url)
+        self.assertContains(resp, 'Cached')
+        self.assertIn('ETag', resp)
+        self.assertIn('Last-Modified', resp)
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)['ETag']
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b'')
+
+    def test_writes_invalidate(self):
+        self.client.get(self.url)
+        self.book.title = 'Renamed'
+        self.book.save()
+        self.assertContains(self.client.get(self.url), 'Renamed')
+        # availability changes through loans, including set-based paths
+        loan = Loan.objects.create(book=self.book, borrower_name='A', borrower_email='a@example.com', card_number='1')
+        self.assertContains(self.client.get(self.url), '1 / 2')
+        services.return_loans([loan.pk])
+        self.assertContains(self.client.get(self.url), '2 / 2')
+
+    def test_query_string_is_part_of_the_key(self):
+        url = reverse('books:book_list')
+        self.client.get(url, {'q': 'cached'})
+        resp = self.client.get(url, {'q': 'nothing'})
+        self.assertContains(resp, 'Aucun livre')
+
+    def test_stats(self):
+        before = page_cache.stats()
+        self.client.get(self.url)
+        self.client.get(self.url)
+        data = self.client.get(reverse('books:cache_stats')).json()
+        self.assertEqual(data['hits'] - before['hits'], 1)
+        self.assertEqual(data['misses'] - before['misses'], 1)
+
+    @override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+
+class BookCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='Jean', last_name='Dupont')
+        other = Author.objects.create(first_name='Anne', last_name='Martin')
+        self.books = [
+            Book.objects.create(title=f'Card {i}', isbn='978' + str(1000000000 + i), author=self.author if i < 2 else other)
+            for i in range(4)
+        ]
+
+    def cached_ids(self):
+        keys = {page_cache.card_key(b.pk): b.pk for b in self.books}
+        return sorted(keys[k] for k in cache.get_many(list(keys)))
+
+    def test_cards_are_cached_and_reused(self):
+        cards = page_cache.render_book_cards(self.books)
+        self.assertIn('Card 0', cards[0])
+        self.assertEqual(self.cached_ids(), [b.pk for b in self.books])
+        cache.set(page_cache.card_key(self.books[0].pk), 'from cache')
+        self.assertEqual(page_cache.render_book_cards(self.books)[0], 'from cache')
+
+    def test_invalidation_is_per_book(self):
+        page_cache.render_book_cards(self.books)
+        self.books[3].title = 'Changed'
+        self.books[3].save()
+        self.assertEqual(self.cached_ids(), [b.pk for b in self.books[:3]])
+        self.author.last_name = 'Durand'
+        self.author.save()
+        self.assertEqual(self.cached_ids(), [self.books[2].pk])
+        Loan.objects.create(book=self.books[2], borrower_name='A', borrower_email='a@example.com', card_number='1')
+        self.assertEqual(self.cached_ids(), [])
+
+    def test_list_page_uses_cards(self):
+        resp = self.client.get(reverse('books:book_list'))
+        self.assertContains(resp, 'Card 3')
+        self.assertEqual(len(self.cached_ids()), 4)
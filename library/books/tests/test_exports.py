@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from books import exports
+from books.models import Author, Book, Loan
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name='Victor', last_name='Hugo')
+        self.book = Book.objects.create(title='Les Misérables', isbn='9780000000002', author=author, copies_total=5, copies_available=5)
+        now = timezone.now()
+        for card, due in [('A', -3), ('A', 5), ('B', -1)]:
+            loan = Loan.objects.create(book=self.book, borrower_name=card, borrower_email='x@example.com', card_number=card)
+            Loan.objects.filter(pk=loan.pk).update(due_date=now + timedelta(days=due))
+        staff = get_user_model().objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        self.client.force_login(staff)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_loan_csv_with_penalties(self):
+        response = self.client.get(reverse('books:loan_export'), {'card_number': 'A'})
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual([(r['isbn'], r['overdue_days'], r['penalty']) for r in rows],
+                         [('9780000000002', '3', '1.50'), ('9780000000002', '0', '0.00')])
+
+    def test_one_query_whatever_the_size(self):
+        qs = exports.loan_queryset()
+        with self.assertNumQueries(1):
+            lines = ''.join(exports.stream(qs, exports.LOAN_COLUMNS, 'jsonl', chunk_size=1)).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['title'], 'Les Misérables')
+
+    def test_filters(self):
+        today = timezone.localdate()
+        url = reverse('books:loan_export')
+        self.assertEqual(self.read(self.client.get(url, {'format': 'jsonl', 'until': today - timedelta(days=1)})), '')
+        lines = self.read(self.client.get(url, {'format': 'jsonl', 'since': today, 'status': 'borrowed'})).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(self.client.get(url, {'since': 'hier'}).status_code, 400)
+
+    def test_book_export_and_command(self):
+        rows = list(csv.DictReader(io.StringIO(self.read(self.client.get(reverse('books:book_export'))))))
+        self.assertEqual((rows[0]['author_last_name'], rows[0]['copies_available']), ('Hugo', '2'))
+        out = io.StringIO()
+        call_command('export_data', 'loans', '--format', 'jsonl', '--card', 'B', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['overdue_days'], 1)
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('books:book_export')).status_code, 302)
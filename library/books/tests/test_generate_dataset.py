@@ -0,0 +1,88 @@
+import io
+from datetime import datetime
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from books import dataset, search
+from books.models import MAX_ACTIVE_LOANS, Author, Book, BorrowerCard, Category, Loan, validate_isbn13
+
+OPTIONS = ('--categories', '5', '--authors', '40', '--books', '300', '--cards', '60', '--loans', '4000',
+           '--chunk-size', '700', '--end-date', '2026-01-01', '--workers', '0')
+
+
+def snapshot():
+    return (
+        list(Author.objects.order_by('pk').values_list()),
+        list(Book.objects.order_by('pk').values_list()),
+        list(Loan.objects.order_by('pk').values_list()),
+    )
+
+
+@override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+class GenerateDatasetTests(TestCase):
+    def generate(self, *args):
+        out = io.StringIO()
+        call_command('generate_dataset', *OPTIONS, *args, stdout=out)
+        return out.getvalue()
+
+    def test_volumes_and_consistency(self):
+        out = self.generate()
+        self.assertIn('5 catégories, 40 auteurs, 300 livres, 60 cartes, 4000 emprunts générés', out)
+        self.assertEqual((Category.objects.count(), Author.objects.count(), Book.objects.count(), Loan.objects.count()),
+                         (5, 40, 300, 4000))
+        for isbn in Book.objects.values_list('isbn', flat=True):
+            validate_isbn13(isbn)
+        statuses = dict(Loan.objects.values_list('status').annotate(n=Count('id')))
+        self.assertEqual(set(statuses), {Loan.STATUS_BORROWED, Loan.STATUS_LATE, Loan.STATUS_RETURNED, Loan.STATUS_CANCELED})
+        end = timezone.make_aware(datetime(2026, 1, 1))
+        self.assertFalse(Loan.objects.filter(borrowed_at__gt=end).exists())
+        self.assertFalse(Loan.objects.filter(status=Loan.STATUS_LATE, due_date__gte=end).exists())
+        late = sum(loan.returned_at > loan.due_date for loan in Loan.objects.filter(status=Loan.STATUS_RETURNED))
+        self.assertAlmostEqual(late / len(Loan.objects.all()), 0.12, delta=0.03)
+        # ids follow borrowed_at
+        borrowed = list(Loan.objects.order_by('pk').values_list('borrowed_at', flat=True))
+        self.assertEqual(borrowed, sorted(borrowed))
+        # Zipf: the most borrowed 1% of the books take far more than 1% of the loans
+        per_book = sorted(Loan.objects.values('book').annotate(n=Count('id')).values_list('n', flat=True), reverse=True)
+        self.assertGreater(sum(per_book[:3]), 4000 * 0.05)
+
+        # the invariants maintained by books.services hold
+        active = Loan.objects.exclude(status__in=Loan.CLOSED_STATUSES)
+        per_card = dict(active.values_list('card_number').annotate(n=Count('id')))
+        self.assertLessEqual(max(per_card.values()), MAX_ACTIVE_LOANS)
+        self.assertEqual(dict(BorrowerCard.objects.filter(active_loans__gt=0).values_list('card_number', 'active_loans')),
+                         per_card)
+        per_book = dict(active.values_list('book').annotate(n=Count('id')))
+        for book in Book.objects.all():
+            self.assertEqual(book.copies_total - book.copies_available, per_book.get(book.pk, 0), book.pk)
+        # indexed for search, and the next ids follow the generated ones
+        book = Book.objects.get(pk=1)
+        self.assertIn(book, search.search_books(Book.objects.all(), book.title))
+        self.assertEqual(Category.objects.create(name='Nouvelle').pk, 6)
+
+    def test_deterministic(self):
+        self.generate()
+        first = snapshot()
+        self.generate('--flush')
+        self.assertEqual(snapshot(), first)
+        self.generate('--flush', '--seed', '7')
+        self.assertNotEqual(snapshot()[2], first[2])
+        # a chunk does not depend on the others, nor on the order they are built in
+        data = dataset.Dataset(categories=5, authors=40, books=300, cards=60, loans=4000,
+                               end=timezone.make_aware(datetime(2026, 1, 1)))
+        later, earlier = data.build('loans', 700, 1400), data.build('loans', 0, 700)
+        self.assertEqual([(loan.pk, loan.book_id, loan.card_number, loan.borrowed_at) for loan in earlier + later],
+                         [(row[0], row[1], row[4], row[5]) for row in first[2][:1400]])
+
+    def test_refuses_a_populated_database(self):
+        Category.objects.create(name='Roman')
+        with self.assertRaisesMessage(CommandError, '--flush'):
+            self.generate()
+        with self.assertRaises(CommandError):
+            self.generate('--flush', '--loans', '10', '--cards', '0')
+        self.generate('--flush', '--loans', '10')
+        self.assertEqual(Category.objects.count(), 5)
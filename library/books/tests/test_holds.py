@@ -0,0 +1,212 @@
+import io
+import random
+import threading
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from books import services
+from books.forms import LoanCreateForm
+from books.models import Author, Book, Hold, Loan
+from books.tests.test_services import _retry_locked
+
+
+def borrow(book, card):
+    return services.checkout(Loan(book=book, borrower_name=card, borrower_email='p@example.com', card_number=card))
+
+
+class HoldQueueTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name='Test', last_name='Author')
+        self.book = Book.objects.create(title='Popular', isbn='9780000000002', author=author, copies_total=1, copies_available=1)
+        self.loan = borrow(self.book, 'X')
+        self.first = services.place_hold(self.book.pk, 'A', 'A', 'a@example.com')
+        self.second = services.place_hold(self.book.pk, 'B', 'B', 'b@example.com')
+
+    def copies(self):
+        return Book.objects.values_list('copies_available', flat=True).get(pk=self.book.pk)
+
+    def status(self, hold):
+        return Hold.objects.values_list('status', flat=True).get(pk=hold.pk)
+
+    def test_return_allocates_oldest_hold(self):
+        self.assertEqual((self.first.position(), self.second.position()), (1, 2))
+        services.return_loan(self.loan)
+        self.assertEqual(self.status(self.first), Hold.STATUS_READY)
+        self.assertEqual(self.second.position(), 1)
+        # the copy is on the hold shelf, not back in the catalog
+        self.assertEqual(self.copies(), 0)
+
+    def test_only_the_hold_card_can_borrow_the_copy(self):
+        services.return_loan(self.loan)
+        data = {'book': self.book.pk, 'borrower_name': 'N', 'borrower_email': 'n@example.com'}
+        self.assertFalse(LoanCreateForm(dict(data, card_number='B')).is_valid())
+        with self.assertRaises(ValidationError):
+            borrow(self.book, 'B')
+        self.assertTrue(LoanCreateForm(dict(data, card_number='A')).is_valid())
+        borrow(self.book, 'A')
+        self.assertEqual(self.status(self.first), Hold.STATUS_FULFILLED)
+        self.assertEqual(self.copies(), 0)
+
+    def test_cancel_and_expiry_pass_the_copy_on(self):
+        services.return_loan(self.loan)
+        services.cancel_hold(self.first)
+        self.assertEqual(self.status(self.second), Hold.STATUS_READY)
+        now = timezone.now() + timedelta(days=4)
+        self.assertEqual(services.expire_holds(now=now), 1)
+        self.assertEqual(self.status(self.second), Hold.STATUS_EXPIRED)
+        # nobody left in the queue: back on the shelf
+        self.assertEqual(self.copies(), 1)
+
+    def test_cancel_of_a_hold_allocated_meanwhile(self):
+        stale = Hold.objects.get(pk=self.first.pk)  # read while waiting
+        services.return_loan(self.loan)  # allocated since
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(services.cancel_hold(stale))
+        # no read of the status before the write: the UPDATE itself decides
+        first = next(q['sql'] for q in queries.captured_queries if 'books_hold' in q['sql'])
+        self.assertTrue(first.startswith('UPDATE'), first)
+        self.assertEqual(self.status(self.second), Hold.STATUS_READY)
+        self.assertTrue(services.cancel_hold(self.second))
+        self.assertEqual(self.copies(), 1)
+        self.assertFalse(services.cancel_hold(self.second))
+        self.assertEqual(self.copies(), 1)
+
+    def test_bulk_return_and_batch_checkout(self):
+        other = Book.objects.create(title='Other', isbn='9780000000019', author=self.book.author, copies_total=2, copies_available=2)
+        loans = [borrow(other, 'Y'), borrow(other, 'Z')]
+        services.place_hold(other.pk, 'A', 'A', 'a@example.com')
+        services.return_loans([self.loan.pk] + [loan.pk for loan in loans])
+        self.assertEqual(Hold.objects.filter(card_number='A', status=Hold.STATUS_READY).count(), 2)
+        self.assertEqual(self.copies(), 0)
+        self.assertEqual(Book.objects.get(pk=other.pk).copies_available, 1)
+        services.checkout_batch([self.book.pk, other.pk], 'A', 'A', 'a@example.com')
+        self.assertFalse(Hold.objects.filter(card_number='A', status=Hold.STATUS_READY).exists())
+        self.assertEqual(Book.objects.get(pk=other.pk).copies_available, 1)
+
+    def test_one_active_hold_per_card(self):
+        with self.assertRaises(ValidationError):
+            services.place_hold(self.book.pk, 'A', 'A', 'a@example.com')
+
+    def test_queue_head_uses_the_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite query plan')
+        qs = Hold.objects.filter(book_id=self.book.pk, status=Hold.STATUS_WAITING).order_by('id')[:1]
+        sql, params = qs.values_list('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('hold_book_status_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_positions(self):
+        holds = [self.first, self.second] + [
+            services.place_hold(self.book.pk, card, card, 'p@example.com') for card in 'CDEFG'
+        ]
+        services.cancel_hold(holds[3])
+        services.return_loan(self.loan)
+        Hold.objects.get(pk=holds[5].pk).delete()
+        waiting = list(Hold.objects.filter(book=self.book, status=Hold.STATUS_WAITING))
+        self.assertEqual([hold.card_number for hold in waiting], ['B', 'C', 'E', 'G'])
+        # two queries, whatever the length of the queue
+        with self.assertNumQueries(2 * len(waiting)):
+            self.assertEqual([hold.position() for hold in waiting], [1, 2, 3, 4])
+        self.assertIsNone(Hold.objects.get(pk=self.first.pk).position())
+
+    def test_rebuild_hold_queues(self):
+        services.cancel_hold(self.first)
+        services.place_hold(self.book.pk, 'C', 'C', 'c@example.com')
+        out = io.StringIO()
+        call_command('rebuild_hold_queues', stdout=out)
+        self.assertIn('2 réservation(s) en attente', out.getvalue())
+        self.assertEqual([hold.ticket for hold in Hold.objects.filter(status=Hold.STATUS_WAITING)], [1, 2])
+        self.assertEqual(
+            [hold.position() for hold in Hold.objects.filter(status=Hold.STATUS_WAITING)], [1, 2])
+
+    def test_views(self):
+        services.return_loan(self.loan)
+        resp = self.client.post(reverse('books:hold_create'), {
+            'book': self.book.pk, 'borrower_name': 'C', 'borrower_email': 'c@example.com', 'card_number': 'C',
+        })
+        self.assertRedirects(resp, reverse('books:hold_list', args=['C']))
+        self.assertContains(self.client.get(reverse('books:hold_list', args=['C'])), 'position 2')
+        self.assertContains(self.client.get(reverse('books:hold_list', args=['A'])), 'disponible jusqu')
+        self.client.post(reverse('books:hold_cancel', args=[self.first.pk]))
+        self.assertEqual(self.status(self.second), Hold.STATUS_READY)
+
+
+class HoldStressTests(TransactionTestCase):
+    COPIES = 20
+    HOLDS = 10_000
+    WORKERS = 8
+    ROUNDS = 15
+
+    def setUp(self):
+        author = Author.objects.create(first_name='Stress', last_name='Test')
+        self.book = Book.objects.create(title='Bestseller', isbn='9780000000002', author=author,
+                                        copies_total=self.COPIES, copies_available=self.COPIES)
+        for i in range(self.COPIES):
+            borrow(self.book, f'L{i}')
+        first = services.issue_hold_tickets(self.book.pk, self.HOLDS)
+        Hold.objects.bulk_create(
+            [Hold(book=self.book, card_number=f'H{i}', borrower_name='H', borrower_email='h@example.com',
+                  ticket=first + i)
+             for i in range(self.HOLDS)],
+            batch_size=2000,
+        )
+
+    def test_popular_title_under_concurrent_returns(self):
+        errors = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(self.ROUNDS):
+                    # a copy comes back...
+                    loans = _retry_locked(lambda: list(Loan.objects.filter(book=self.book, status=Loan.STATUS_BORROWED)))
+                    loan = rng.choice(loans)
+                    _retry_locked(lambda: services.return_loan(Loan.objects.get(pk=loan.pk)))
+                    # ...and a patron whose hold is ready comes to pick one up
+                    hold = _retry_locked(
+                        lambda: Hold.objects.filter(book=self.book, status=Hold.STATUS_READY).order_by('?').first()
+                    )
+                    if hold:
+                        try:
+                            _retry_locked(lambda: borrow(self.book, hold.card_number))
+                        except ValidationError:
+                            pass  # another worker served that patron first
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.WORKERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+        book = Book.objects.get(pk=self.book.pk)
+        active = Loan.objects.filter(book=book).exclude(status__in=Loan.CLOSED_STATUSES).count()
+        ready = Hold.objects.filter(book=book, status=Hold.STATUS_READY).count()
+        # every copy is out, on the hold shelf, or (never, with such a queue) on the shelf
+        self.assertEqual(book.copies_available, 0)
+        self.assertEqual(active + ready, self.COPIES)
+        # FIFO: the holds served are exactly the oldest ones
+        served = list(Hold.objects.filter(book=book).exclude(status=Hold.STATUS_WAITING).values_list('pk', flat=True).order_by('pk'))
+        oldest = list(Hold.objects.filter(book=book).values_list('pk', flat=True).order_by('pk')[:len(served)])
+        self.assertEqual(served, oldest)
+        # one allocation per effective return (two workers may pick the same loan)
+        self.assertEqual(len(served), Loan.objects.filter(book=book, status=Loan.STATUS_RETURNED).count())
+        self.assertGreater(len(served), self.WORKERS * self.ROUNDS // 2)
+        # the positions follow the holds served
+        waiting = Hold.objects.filter(book=book, status=Hold.STATUS_WAITING)
+        self.assertEqual(waiting.first().position(), 1)
+        self.assertEqual(waiting.last().position(), self.HOLDS - len(served))
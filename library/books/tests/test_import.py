@@ -0,0 +1,133 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from books import search
+from books.importer import CatalogImporter
+from books.models import Author, Book, Category, isbn10_to_isbn13
+
+CSV = """isbn,title,author,category,publication_year,copies
+9780000000002,Les Misérables,Victor Hugo,Roman,1862,3
+2-07-036822-X,L'Étranger,Albert Camus,Roman,1942,2
+9780000000019,Notre-Dame de Paris,Victor Hugo,,1831,1
+1234,ISBN invalide,Victor Hugo,Roman,,1
+9780000000026,,Victor Hugo,Roman,,1
+9780000000033,Fables,Jean de La Fontaine,Poésie,1668,
+"""
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_catalog', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_isbn10_conversion(self):
+        self.assertEqual(isbn10_to_isbn13('207036822X'), '9782070368228')
+        self.assertEqual(isbn10_to_isbn13('0306406152'), '9780306406157')
+
+    def test_csv_import(self):
+        out, err = self.run_import(self.write('catalog.csv', CSV), '--chunk-size', '2')
+        self.assertEqual(Book.objects.count(), 4)
+        self.assertIn('Ligne 5 ignorée', err)
+        self.assertIn('Ligne 6 ignorée', err)
+        self.assertIn('4 livre(s) importé(s), 2 ligne(s) rejetée(s)', out)
+        # one row per author and category whatever the chunk they appear in
+        self.assertEqual(Author.objects.filter(first_name='Victor', last_name='Hugo').count(), 1)
+        self.assertEqual(Category.objects.filter(name='Roman').count(), 1)
+        fontaine = Book.objects.get(title='Fables')
+        self.assertEqual((fontaine.author.first_name, fontaine.author.last_name), ('Jean', 'de La Fontaine'))
+        self.assertEqual((fontaine.copies_total, fontaine.copies_available), (1, 1))
+        self.assertTrue(Book.objects.filter(isbn='9782070368228', title="L'Étranger").exists())
+        # bulk_create sends no signals: the importer indexes the books itself
+        self.assertEqual(
+            [b.title for b in search.search_books(Book.objects.all(), 'misérables')], ['Les Misérables'],
+        )
+
+    def test_jsonl_upsert_keeps_copies(self):
+        author = Author.objects.create(first_name='Victor', last_name='Hugo')
+        Book.objects.create(title='Ancien titre', isbn='9780000000002', author=author, copies_total=5, copies_available=2)
+        lines = [
+            {'isbn': '978-0-00-000000-2', 'title': 'Les Misérables', 'author_first_name': 'Victor',
+             'author_last_name': 'Hugo', 'copies': 1, 'price': '12,50'},
+            'pas du json',
+        ]
+        path = self.write('catalog.jsonl', '\n'.join(json.dumps(l) if isinstance(l, dict) else l for l in lines))
+        out, err = self.run_import(path)
+        self.assertIn('Ligne 2 ignorée : JSON invalide', err)
+        book = Book.objects.get(isbn='9780000000002')
+        self.assertEqual(book.title, 'Les Misérables')
+        self.assertEqual(str(book.price), '12.50')
+        self.assertEqual((book.copies_total, book.copies_available), (5, 2))
+        self.assertEqual(Author.objects.count(), 1)
+
+    def test_values_longer_than_the_columns_are_rejected(self):
+        base = {'isbn': '9780000000002', 'title': 'Les Misérables', 'author': 'Victor Hugo'}
+        lines = [dict(base, language='x' * 31), dict(base, publisher='x' * 201),
+                 dict(base, author='Victor ' + 'x' * 101), dict(base, category='x' * 101), base]
+        path = self.write('catalog.jsonl', '\n'.join(json.dumps(line) for line in lines))
+        out, err = self.run_import(path)
+        self.assertIn('Ligne 1 ignorée : language : trop long (30 caractères au plus).', err)
+        self.assertIn('Ligne 2 ignorée : publisher : trop long (200 caractères au plus).', err)
+        self.assertIn('Ligne 3 ignorée : author : trop long (100 caractères au plus).', err)
+        self.assertIn('Ligne 4 ignorée : category : trop long (100 caractères au plus).', err)
+        self.assertIn('1 livre(s) importé(s), 4 ligne(s) rejetée(s)', out)
+
+    def test_chunk_queries_do_not_grow_with_known_names(self):
+        importer = CatalogImporter()
+        rows = lambda start: [
+            {'isbn': isbn, 'title': f'T{i}', 'author': ('Victor', 'Hugo'), 'category': 'Roman',
+             'publication_year': None, 'copies_total': 1, 'copies_available': 1, 'language': '',
+             'pages': None, 'publisher': '', 'description': '', 'price': 0}
+            for i, isbn in enumerate(['9780000000002', '9780000000019', '9780000000026'][start:start + 2])
+        ]
+        importer.import_chunk(rows(0))
+        # authors and categories already resolved: upsert, ids, search index
+        with self.assertNumQueries(6):  # savepoint, upsert, ids, fts delete + insert, release
+            importer.import_chunk(rows(1))
+
+    def test_resume_after_interruption(self):
+        path = self.write('catalog.csv', CSV)
+        original = CatalogImporter.import_chunk
+        calls = []
+
+        def failing(importer, chunk):
+            calls.append(len(chunk))
+            if len(calls) == 2:
+                raise RuntimeError('coupure')
+            return original(importer, chunk)
+
+        with mock.patch.object(CatalogImporter, 'import_chunk', failing):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, '--chunk-size', '2')
+        with open(f'{path}.checkpoint') as f:
+            self.assertEqual(json.load(f)['records'], 2)
+        self.assertEqual(Book.objects.count(), 2)
+
+        out, _ = self.run_import(path, '--chunk-size', '2', '--resume')
+        self.assertIn('Reprise après 2', out)
+        self.assertEqual(Book.objects.count(), 4)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_resume_rejects_other_file(self):
+        path = self.write('catalog.csv', CSV)
+        self.write('catalog.csv.checkpoint', json.dumps({'path': '/ailleurs.csv', 'records': 3}))
+        with self.assertRaises(CommandError):
+            self.run_import(path, '--resume')
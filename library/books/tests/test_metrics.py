@@ -0,0 +1,128 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import include, path, reverse
+
+from books import metrics
+from books.models import Author, Book
+
+
+def titles_with_authors(request):
+    # one query per book for its author: the pattern to detect
+    books = Book.objects.order_by('pk')
+    return HttpResponse(', '.join(f'{book.title} ({book.author.last_name})' for book in books))
+
+
+urlpatterns = [
+    path('n-plus-one/', titles_with_authors, name='n_plus_one'),
+    path('', include('library_project.urls')),
+]
+
+
+def sample(text, name, **labels):
+    """The value of the sample `name` with exactly `labels` in `text`, or None."""
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    series = f'{name}{{{wanted}}}' if labels else name
+    match = re.search(rf'^{re.escape(series)} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else None
+
+
+class QueryMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [Author.objects.create(first_name='Auteur', last_name=f'N{i}') for i in range(6)]
+        cls.books = [
+            Book.objects.create(title=f'Tome {i}', isbn=isbn, author=cls.authors[i], copies_total=1, copies_available=1)
+            for i, isbn in enumerate(['9780000000002', '9780000000019', '9780000000026', '9780000000033',
+                                      '9780000000040', '9780000000057'])
+        ]
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def scrape(self, **headers):
+        resp = self.client.get(reverse('metrics'), headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], metrics.CONTENT_TYPE)
+        return resp.content.decode()
+
+    def test_wrapper_leaves_execute_wrapper_blocks_alone(self):
+        def other(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        metrics.install()
+        connection.execute_wrappers.remove(metrics._record)
+        self.addCleanup(metrics._instrument, connection)
+        with connection.execute_wrapper(other):
+            # e.g. a connection opened inside the block
+            metrics._instrument(connection)
+        self.assertEqual(connection.execute_wrappers, [metrics._record])
+
+    @override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+    def test_histograms_per_view(self):
+        url = reverse('books:author_detail', args=[self.authors[0].pk])
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        self.client.get(url)
+        self.client.get('/nowhere/')
+        text = self.scrape()
+        labels = {'view': 'books:author_detail', 'method': 'GET'}
+        self.assertEqual(sample(text, 'books_request_duration_seconds_count', **labels), 2)
+        self.assertEqual(sample(text, 'books_request_queries_sum', **labels), 4)
+        self.assertEqual(sample(text, 'books_request_queries_bucket', **labels, le='1'), 0)
+        self.assertEqual(sample(text, 'books_request_queries_bucket', **labels, le='2'), 2)
+        self.assertEqual(sample(text, 'books_request_queries_bucket', **labels, le='+Inf'), 2)
+        self.assertGreater(sample(text, 'books_request_sql_seconds_sum', **labels), 0)
+        self.assertEqual(sample(text, 'books_request_queries_count', view='<unresolved>', method='GET'), 1)
+        self.assertIn('# TYPE books_request_duration_seconds histogram', text)
+        self.assertIsNone(sample(text, 'books_n_plus_one_total', **labels))
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_n_plus_one_is_logged_and_counted(self):
+        with self.assertLogs('books.metrics', 'WARNING') as logs:
+            self.client.get(reverse('n_plus_one'))
+        [message] = logs.output
+        self.assertIn('Probable N+1 in n_plus_one (GET /n-plus-one/): 6 x SELECT', message)
+        self.assertIn('"books_author"."id" = ? LIMIT ?', message)
+        self.assertEqual(sample(self.scrape(), 'books_n_plus_one_total', view='n_plus_one'), 1)
+        # under the threshold: silent
+        with override_settings(BOOKS_METRICS_N_PLUS_ONE=7), self.assertNoLogs('books.metrics'):
+            self.client.get(reverse('n_plus_one'))
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            metrics.fingerprint('SELECT a FROM t WHERE id = 12 AND name = \'l\'\'été\' AND x IN (%s, %s,%s)'),
+            'SELECT a FROM t WHERE id = ? AND name = ? AND x IN (...)',
+        )
+        self.assertEqual(metrics.fingerprint('SELECT a FROM t2 WHERE  b IN (1, 2)\n LIMIT 21'),
+                         'SELECT a FROM t2 WHERE b IN (...) LIMIT ?')
+
+    @override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+    async def test_async_views(self):
+        # the ORM runs in a thread of asgiref: its queries are still counted
+        resp = await self.async_client.get(reverse('books:book_detail_async', args=[self.books[0].pk]))
+        self.assertEqual(resp.status_code, 200)
+        text = metrics.render()
+        labels = {'view': 'books:book_detail_async', 'method': 'GET'}
+        self.assertEqual(sample(text, 'books_request_duration_seconds_count', **labels), 1)
+        self.assertGreater(sample(text, 'books_request_queries_sum', **labels), 0)
+
+    def test_page_cache_counters(self):
+        url = reverse('books:book_detail', args=[self.books[0].pk])
+        text = self.scrape()
+        hits, misses = sample(text, 'books_page_cache_hits_total'), sample(text, 'books_page_cache_misses_total')
+        self.client.get(url)
+        self.client.get(url)
+        text = self.scrape()
+        self.assertEqual(sample(text, 'books_page_cache_misses_total'), misses + 1)
+        self.assertEqual(sample(text, 'books_page_cache_hits_total'), hits + 1)
+
+    @override_settings(BOOKS_METRICS_TOKEN='s3cret')
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'authorization': 'Bearer other'}).status_code, 403)
+        self.scrape(authorization='Bearer s3cret')
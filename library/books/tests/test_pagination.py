@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from books.models import Author, Book, Loan
+from books.pagination import CursorPaginator, InvalidCursor
+
+
+class CursorPaginatorTests(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name='Jean', last_name='Dupont')
+        # duplicate titles: the id tie-breaker must keep pages disjoint
+        for i in range(20):
+            Book.objects.create(title=f'Book {i % 7}', isbn='978' + str(1000000000 + i), author=self.author)
+        self.expected = list(Book.objects.order_by('title', 'id').values_list('pk', flat=True))
+
+    def walk_forward(self, paginator):
+        seen, page = [], paginator.page()
+        while True:
+            seen += [b.pk for b in page]
+            if not page.has_next():
+                return seen, page
+            page = paginator.page(page.next_cursor)
+
+    def test_forward_and_backward(self):
+        paginator = CursorPaginator(Book.objects.all(), 6, ('title', 'id'))
+        seen, last = self.walk_forward(paginator)
+        self.assertEqual(seen, self.expected)
+        self.assertFalse(last.has_next())
+        back, page = [], last
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            back = [b.pk for b in page] + back
+        self.assertEqual(back + [b.pk for b in last], self.expected)
+        self.assertFalse(page.has_previous())
+
+    def test_descending_datetime_ordering(self):
+        book = Book.objects.first()
+        book.copies_total = book.copies_available = 10
+        book.save()
+        now = timezone.now()
+        for i in range(7):
+            loan = Loan.objects.create(book=book, borrower_name='A', borrower_email='a@example.com', card_number=f'C{i}')
+            # same timestamp twice to exercise the tie-breaker
+            Loan.objects.filter(pk=loan.pk).update(borrowed_at=now - timedelta(microseconds=i // 2))
+        expected = list(Loan.objects.order_by('-borrowed_at', '-id').values_list('pk', flat=True))
+        seen, _ = self.walk_forward(CursorPaginator(Loan.objects.all(), 3, ('-borrowed_at', '-id')))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        paginator = CursorPaginator(Book.objects.all(), 6, ('title', 'id'))
+        for token in ('garbage', 'WyJ4IiwgW11d'):
+            with self.assertRaises(InvalidCursor):
+                paginator.page(token)
+
+
+class CursorViewsTests(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name='Jean', last_name='Dupont')
+        Author.objects.create(first_name=None, last_name=None)
+        for i in range(15):
+            Book.objects.create(title=f'Book {i:02d}', isbn='978' + str(1000000000 + i), author=self.author)
+
+    def test_book_list_uses_cursor_links(self):
+        resp = self.client.get(reverse('books:book_list'))
+        page = resp.context['page_obj']
+        self.assertTrue(page.has_next())
+        self.assertContains(resp, '?cursor=')
+        resp = self.client.get(reverse('books:book_list'), {'cursor': page.next_cursor})
+        self.assertEqual([b.title for b in resp.context['books']], [f'Book {i:02d}' for i in range(8, 15)])
+
+    def test_search_falls_back_to_offset(self):
+        resp = self.client.get(reverse('books:book_list'), {'q': 'book'})
+        self.assertEqual(resp.context['page_obj'].number, 1)
+        self.assertContains(resp, 'page=2')
+
+    def test_bad_cursor_is_404(self):
+        resp = self.client.get(reverse('books:book_list'), {'cursor': 'nope'})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_author_list_with_null_names(self):
+        resp = self.client.get(reverse('books:author_list'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['authors']), 2)
+
+    def test_loan_lists(self):
+        book = Book.objects.first()
+        Loan.objects.create(book=book, borrower_name='A', borrower_email='a@example.com', card_number='X')
+        for url in (reverse('books:loans_active'), reverse('books:loans_late'), reverse('books:loan_history', args=['X'])):
+            self.assertEqual(self.client.get(url).status_code, 200)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from books.models import Author, Book, Loan
+
+
+class PenaltyAnnotationTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name='Test', last_name='Author')
+        self.book = Book.objects.create(title='Fines', isbn='9780000000002', author=author, copies_total=10, copies_available=10)
+        self.now = timezone.now()
+        # (card, due in days, returned days after due)
+        for card, due, returned in [('A', -5, None), ('A', -10, 3), ('B', 3, None), ('B', -1.5, None), ('C', -2, -1)]:
+            loan = Loan.objects.create(book=self.book, borrower_name=card, borrower_email='x@example.com', card_number=card)
+            due_date = self.now + timedelta(days=due)
+            Loan.objects.filter(pk=loan.pk).update(
+                due_date=due_date,
+                returned_at=due_date + timedelta(days=returned) if returned is not None else None,
+            )
+
+    def test_matches_python_methods(self):
+        loans = list(Loan.objects.with_penalties(self.now))
+        self.assertEqual(len(loans), 5)
+        for loan in loans:
+            self.assertEqual(loan.overdue_days, loan.days_overdue())
+            self.assertEqual(loan.penalty, loan.penalty_amount())
+
+    def test_sorting_and_filtering_in_sql(self):
+        top = Loan.objects.with_penalties(self.now).order_by('-penalty').first()
+        self.assertEqual(top.overdue_days, 5)
+        self.assertEqual(Loan.objects.with_penalties(self.now).filter(penalty__gt=0).count(), 3)
+
+    def test_fines_report(self):
+        with self.assertNumQueries(1):
+            by_card = list(Loan.objects.fines_report(now=self.now))
+        self.assertEqual([(r['card_number'], r['loans'], r['days']) for r in by_card], [('A', 2, 8), ('B', 1, 1)])
+        self.assertEqual(by_card[0]['total'], Decimal('4.00'))
+        by_month = list(Loan.objects.fines_report(by='month', now=self.now))
+        self.assertEqual(sum(r['loans'] for r in by_month), 3)
+        out = StringIO()
+        call_command('fines_report', stdout=out)
+        self.assertIn('Total', out.getvalue())
+        self.assertEqual(self.client.get(reverse('books:loans_fines')).status_code, 200)
+
+    def test_admin_changelist(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        url = reverse('admin:books_loan_changelist')
+        resp = self.client.get(url, {'o': '-7', 'penalty': 'yes'})  # column 7: penalty
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['cl'].result_count, 3)
+        self.assertEqual(resp.context['cl'].result_list[0].overdue_days, 5)
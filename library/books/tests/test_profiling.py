@@ -0,0 +1,126 @@
+import marshal
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from books import profiling
+from books.models import Author, Book
+
+
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Victor', last_name='Hugo')
+        cls.book = Book.objects.create(title='Les Misérables', isbn='9780000000002', author=author,
+                                       copies_total=1, copies_available=1)
+
+    def setUp(self):
+        cache.clear()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        settings = override_settings(BOOKS_PROFILING=True, BOOKS_PROFILING_DIR=self.dir, BOOKS_PAGE_CACHE_TIMEOUT=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        profiling._armed.clear()
+        profiling._last_armed.clear()
+        self.url = reverse('books:book_list')
+
+    def triggers(self):
+        return [(p['view'], p['trigger']) for p in profiling.recent_profiles()]
+
+    def test_signed_header(self):
+        self.client.get(self.url, {'q': 'misérables'}, headers={'x-profile': profiling.make_token()})
+        self.client.get(self.url, headers={'x-profile': 'profile:forged:sig'})
+        self.client.get(self.url)
+        [profile] = profiling.recent_profiles()
+        self.assertEqual((profile['view'], profile['method'], profile['trigger']), ('books:book_list', 'GET', 'header'))
+        self.assertEqual(profile['path'], '/books/?q=mis%C3%A9rables')
+        self.assertFalse(profile['asgi'])
+        stats = pstats.Stats(f"{self.dir}/{profile['name']}.prof")
+        self.assertTrue(any(name == 'get_queryset' for _, _, name in stats.stats))
+
+    @override_settings(BOOKS_PROFILING_SAMPLE_RATE=1, BOOKS_PROFILING_KEEP=2)
+    def test_sampling_keeps_the_most_recent(self):
+        for _ in range(3):
+            self.client.get(self.url)
+        self.client.get(reverse('books:book_detail', args=[self.book.pk]))
+        self.assertEqual(self.triggers(), [('books:book_detail', 'sample'), ('books:book_list', 'sample')])
+        self.assertEqual(len(list(profiling.profiles_dir().glob('*.prof'))), 2)
+
+    @override_settings(BOOKS_PROFILING_SLOW_MS=0.001)
+    def test_slow_request_arms_the_next(self):
+        detail = reverse('books:book_detail', args=[self.book.pk])
+        self.client.get(self.url)  # slow: arms book_list
+        self.assertEqual(self.triggers(), [])
+        self.client.get(detail)  # arms book_detail
+        self.client.get(self.url)  # profiled
+        self.assertEqual(self.triggers(), [('books:book_list', 'slow')])
+        self.client.get(self.url)  # within the cooldown
+        self.client.get(detail)
+        self.assertEqual(self.triggers(), [('books:book_detail', 'slow'), ('books:book_list', 'slow')])
+
+    @override_settings(BOOKS_PROFILING=False)
+    def test_disabled(self):
+        self.client.get(self.url, headers={'x-profile': profiling.make_token()})
+        self.assertEqual(profiling.recent_profiles(), [])
+
+    async def test_async_view(self):
+        url = reverse('books:book_detail_async', args=[self.book.pk])
+        resp = await self.async_client.get(url, headers={'x-profile': profiling.make_token()})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.triggers(), [('books:book_detail_async', 'header')])
+        self.assertTrue(profiling.recent_profiles()[0]['asgi'])
+
+    def test_storage_error_keeps_the_response(self):
+        blocker = f'{self.dir}/file'
+        open(blocker, 'w').close()
+        with self.settings(BOOKS_PROFILING_DIR=f'{blocker}/profiles'), self.assertLogs('books.profiling', 'ERROR'):
+            resp = self.client.get(self.url, headers={'x-profile': profiling.make_token()})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_admin_page_and_downloads(self):
+        self.client.get(self.url, headers={'x-profile': profiling.make_token()})
+        [profile] = profiling.recent_profiles()
+        prof = reverse('profile_download', args=[profile['name'], 'prof'])
+        self.assertEqual(self.client.get(reverse('profiles')).status_code, 302)
+        self.assertEqual(self.client.get(prof).status_code, 302)
+
+        staff = get_user_model().objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        self.client.force_login(staff)
+        resp = self.client.get(reverse('profiles'))
+        self.assertContains(resp, 'books:book_list')
+        self.assertContains(resp, 'X-Profile: ')
+        self.assertNotContains(resp, 'ASGI')
+        self.assertTrue(profiling.valid_token(resp.context['token']))
+        data = b''.join(self.client.get(prof).streaming_content)
+        self.assertIsInstance(marshal.loads(data), dict)
+        folded = self.client.get(reverse('profile_download', args=[profile['name'], 'folded']))
+        self.assertEqual(folded['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(self.client.get(reverse('profile_download', args=['missing', 'prof'])).status_code, 404)
+
+    def test_stack_sampler(self):
+        sampler = profiling.StackSampler(threading.get_ident())
+        sampler.start()
+        deadline = time.perf_counter() + 0.1
+        while time.perf_counter() < deadline:
+            fib(15)
+        sampler.stop()
+        lines = sampler.folded().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, samples = line.rsplit(' ', 1)
+            self.assertGreater(int(samples), 0)
+        # whole stacks, from the outermost frame
+        self.assertTrue(any(';test_stack_sampler (test_profiling.py:' in line and ';fib (test_profiling.py:' in line
+                            for line in lines), lines)
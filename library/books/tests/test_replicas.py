@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from books import cache as page_cache, replicas, search
+from books.models import Author, Book, Loan
+
+
+class Queries:
+    """SQL run on one connection."""
+
+    def __init__(self):
+        self.sql = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.sql.append(sql)
+        return execute(sql, params, many, context)
+
+    def catalog(self):
+        return [sql for sql in self.sql if 'books_' in sql]
+
+
+@override_settings(BOOKS_READ_REPLICAS=['replica'], BOOKS_REPLICA_LAG=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(first_name='Victor', last_name='Hugo')
+        self.author = author
+        self.book = Book.objects.create(title='Les Misérables', isbn='9780000000002', author=author,
+                                        copies_total=1, copies_available=1)
+
+    @contextmanager
+    def queries(self):
+        primary, replica = Queries(), Queries()
+        with ExitStack() as stack:
+            stack.enter_context(connections['default'].execute_wrapper(primary))
+            stack.enter_context(connections['replica'].execute_wrapper(replica))
+            yield primary, replica
+
+    def assertOnReplica(self, url, params=None):
+        with self.queries() as (primary, replica):
+            resp = self.client.get(url, params)
+            self.assertEqual(resp.status_code, 200)
+            if resp.streaming:
+                b''.join(resp.streaming_content)
+        self.assertEqual(primary.catalog(), [], url)
+        self.assertTrue(replica.catalog(), url)
+        return resp
+
+    def assertOnPrimary(self, url, params=None):
+        with self.queries() as (primary, replica):
+            resp = self.client.get(url, params)
+        self.assertEqual(replica.sql, [], url)
+        self.assertTrue(primary.catalog(), url)
+        return resp
+
+    @override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+    def test_catalog_pages_read_from_the_replica(self):
+        for url in [reverse('books:book_list'), reverse('books:book_detail', args=[self.book.pk]),
+                    reverse('books:author_list'), reverse('books:author_detail', args=[self.author.pk]),
+                    reverse('books:book_list_fbv'), reverse('books:author_detail_fbv', args=[self.author.pk]),
+                    reverse('books:api_book_list'), reverse('books:api_book_typeahead') + '?q=mis']:
+            self.assertOnReplica(url)
+        self.assertOnReplica(reverse('books:book_search'), {'q': 'misérables'})
+        self.assertNotIn(replicas.PIN_COOKIE, self.client.cookies)
+        # the loan pages stay on the primary
+        self.assertOnPrimary(reverse('books:loans_active'))
+
+    @override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+    async def test_async_view(self):
+        # the ORM calls run in another thread, on its own connections: record
+        # the router's decisions instead
+        decisions = []
+        db_for_read = replicas.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            decisions.append(db_for_read(router, model, **hints))
+            return decisions[-1]
+
+        with mock.patch.object(replicas.ReplicaRouter, 'db_for_read', record):
+            resp = await self.async_client.get(reverse('books:book_detail_async', args=[self.book.pk]))
+        self.assertContains(resp, 'Les Misérables')
+        self.assertEqual(set(decisions), {'replica'})
+
+    def test_exports_stream_from_the_replica(self):
+        staff = get_user_model().objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        self.client.force_login(staff)
+        resp = self.assertOnReplica(reverse('books:book_export'), {'format': 'jsonl'})
+        self.assertEqual(resp['Content-Type'].split(';')[0], 'application/x-ndjson')
+        self.assertOnReplica(reverse('books:loan_export'))
+
+    @override_settings(BOOKS_PAGE_CACHE_TIMEOUT=600)
+    def test_checkout_pins_the_browser_to_the_primary(self):
+        detail = reverse('books:book_detail', args=[self.book.pk])
+        self.assertOnReplica(detail)
+        with self.queries() as (primary, replica):
+            resp = self.client.post(reverse('books:loan_create'), {
+                'book': self.book.pk, 'card_number': 'C1', 'borrower_name': 'Jean',
+                'borrower_email': 'j@example.com',
+            }, follow=True)
+        self.assertRedirects(resp, reverse('books:loans_active'))
+        self.assertEqual(replica.sql, [])
+        self.assertEqual(self.client.cookies[replicas.PIN_COOKIE]['max-age'], 5)
+        # pinned: the primary, and not the cached page the replica may have rendered
+        resp = self.assertOnPrimary(detail)
+        self.assertEqual(resp.context['book'].copies_available, 0)
+        self.assertFalse(resp.has_header('ETag'))
+        # once the pin expired
+        del self.client.cookies[replicas.PIN_COOKIE]
+        self.assertOnReplica(detail)
+
+    def test_search_index_on_the_database_written(self):
+        with self.queries() as (primary, replica):
+            book = Book(title='Quatrevingt-treize', isbn='9780000000019', author=self.author,
+                        copies_total=1, copies_available=1)
+            book.save(using='replica')
+            self.assertEqual(list(search.search_books(Book.objects.using('replica'), 'quatrevingt')), [book])
+            book.delete(using='replica')
+        self.assertEqual(primary.catalog(), [])
+        self.assertEqual(sum('books_book_fts' in sql for sql in replica.sql), 4)  # index (delete, insert), search, remove
+
+    def test_router(self):
+        router = replicas.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Book))
+        state = replicas.ReadState()
+        token = replicas._state.set(state)
+        try:
+            self.assertIsNone(router.db_for_read(Book))
+            state.replica = True
+            self.assertEqual(router.db_for_read(Book), 'replica')
+            self.assertIsNone(router.db_for_read(get_user_model()))
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Loan))
+            self.assertIsNone(router.db_for_write(get_user_model()))
+            self.assertFalse(state.wrote)
+            router.db_for_write(Loan)
+            self.assertIsNone(router.db_for_read(Book))
+        finally:
+            replicas._state.reset(token)
+        self.assertFalse(router.allow_migrate('replica', 'books'))
+        self.assertIsNone(router.allow_migrate('default', 'books'))
+
+    def test_pages_read_from_a_replica_expire_with_the_lag(self):
+        state = replicas.ReadState()
+        token = replicas._state.set(state)
+        try:
+            now = time.time()
+            self.assertEqual(page_cache._store_timeout(now), 600)
+            state.used = True
+            self.assertLessEqual(page_cache._store_timeout(now), 5)
+            self.assertGreater(page_cache._store_timeout(now), 0)
+            self.assertEqual(page_cache._store_timeout(now - 60), 600)
+        finally:
+            replicas._state.reset(token)
+
+    def test_sync_replica(self):
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        replicas.copy_sqlite(path)
+        copy = sqlite3.connect(path)
+        try:
+            self.assertEqual(copy.execute('SELECT title FROM books_book').fetchall(), [('Les Misérables',)])
+        finally:
+            copy.close()
+        # under tests the replica alias mirrors the primary
+        with self.assertRaisesMessage(CommandError, 'pas un fichier distinct'):
+            call_command('sync_replica')
+        with self.assertRaisesMessage(CommandError, 'inconnu'):
+            call_command('sync_replica', 'nope')
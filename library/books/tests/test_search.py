@@ -0,0 +1,65 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from books.models import Author, Book
+from books import search
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        search.reset_backend()
+        self.zola = Author.objects.create(first_name='Émile', last_name='Zola')
+        self.hugo = Author.objects.create(first_name='Victor', last_name='Hugo')
+        self.germinal = Book.objects.create(title='Germinal', isbn='9780000000002', author=self.zola)
+        self.miserables = Book.objects.create(title='Les Misérables', isbn='9780000000019', author=self.hugo)
+        # an author hit must rank below a title hit
+        self.notre_dame = Book.objects.create(title='Notre-Dame de Paris', isbn='9780000000026', author=self.hugo)
+        self.victor = Book.objects.create(title='Victor Hugo, une vie', isbn='9780000000033', author=self.zola)
+
+    def titles(self, q):
+        return [b.title for b in search.search_books(Book.objects.all(), q)]
+
+    def test_prefix_and_accent_insensitive(self):
+        self.assertEqual(self.titles('germ'), ['Germinal'])
+        self.assertEqual(self.titles('miserables'), ['Les Misérables'])
+        self.assertEqual(self.titles('emile'), ['Germinal', 'Victor Hugo, une vie'])
+
+    def test_isbn_with_separators(self):
+        self.assertEqual(self.titles('978-0-00-000001-9'), ['Les Misérables'])
+
+    def test_title_hits_rank_first(self):
+        self.assertEqual(self.titles('victor')[0], 'Victor Hugo, une vie')
+
+    def test_index_follows_saves_and_deletes(self):
+        self.germinal.title = 'Au Bonheur des Dames'
+        self.germinal.save()
+        self.assertEqual(self.titles('germinal'), [])
+        self.assertEqual(self.titles('bonheur'), ['Au Bonheur des Dames'])
+        self.zola.last_name = 'Zolaa'
+        self.zola.save()
+        self.assertEqual(len(self.titles('zolaa')), 2)
+        self.victor.delete()
+        self.assertEqual(self.titles('zolaa'), ['Au Bonheur des Dames'])
+
+    def test_rebuild_command(self):
+        Book.objects.filter(pk=self.germinal.pk).update(title='Nana')  # bypasses signals
+        self.assertEqual(self.titles('nana'), [])
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn(f'{Book.objects.count()} livre(s) indexé(s)', out.getvalue())
+        self.assertEqual(self.titles('nana'), ['Nana'])
+
+    @override_settings(BOOKS_SEARCH_BACKEND='books.search.database.DatabaseBackend')
+    def test_database_backend(self):
+        search.reset_backend()
+        try:
+            self.assertEqual(self.titles('hugo'), ['Les Misérables', 'Notre-Dame de Paris', 'Victor Hugo, une vie'])
+        finally:
+            search.reset_backend()
+
+    def test_book_list_views_use_search(self):
+        for name in ('books:book_list', 'books:book_list_fbv'):
+            resp = self.client.get(reverse(name), {'q': 'germ'})
+            self.assertEqual([b.title for b in resp.context['books']], ['Germinal'])
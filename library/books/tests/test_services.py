@@ -0,0 +1,249 @@
+import io
+import json
+import random
+import threading
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from books.models import Author, Book, BorrowerCard, Loan, MAX_ACTIVE_LOANS
+from books import services
+
+
+def _retry_locked(fn, attempts=500):
+    """SQLite's shared in-memory test database reports writer contention as
+    'table is locked' instead of waiting; retry like a busy timeout would."""
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            time.sleep(random.uniform(0, 0.002 * min(attempt + 1, 25)))
+    raise AssertionError('database stayed locked')
+
+
+class CheckoutEngineTests(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name='Test', last_name='Author')
+        self.book = Book.objects.create(title='Engine', isbn='9780000000002', author=self.author, copies_total=1, copies_available=1)
+
+    def test_reserve_and_release_are_conditional(self):
+        services.reserve_copy(self.book.pk)
+        with self.assertRaises(ValidationError):
+            services.reserve_copy(self.book.pk)
+        services.release_copy(self.book.pk)
+        with self.assertRaises(ValidationError):
+            services.release_copy(self.book.pk)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 1)
+
+    def test_reserve_is_a_single_update(self):
+        with self.assertNumQueries(1):
+            services.reserve_copy(self.book.pk)
+
+    def test_checkout_and_return(self):
+        loan = services.checkout(Loan(book=self.book, borrower_name='A', borrower_email='a@example.com', card_number='111'))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 0)
+        services.return_loan(loan)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 1)
+
+
+    def test_return_is_conditional(self):
+        # two requests returning the same loan, each with the instance it loaded
+        loan = services.checkout(Loan(book=self.book, borrower_name='A', borrower_email='a@example.com', card_number='111'))
+        first, second = Loan.objects.get(pk=loan.pk), Loan.objects.get(pk=loan.pk)
+        services.return_loan(first)
+        with CaptureQueriesContext(connection) as ctx:
+            services.return_loan(second)
+        self.assertFalse(any('books_book' in q['sql'] or 'books_borrowercard' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual((second.status, second.returned_at), (Loan.STATUS_RETURNED, first.returned_at))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 1)
+        self.assertEqual(BorrowerCard.active_count('111'), 0)
+
+class BorrowerCardCounterTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name='Test', last_name='Author')
+        self.book = Book.objects.create(title='Counter', isbn='9780000000002', author=author, copies_total=3, copies_available=3)
+
+    def _loan(self, card='111'):
+        return Loan.objects.create(book=self.book, borrower_name='A', borrower_email='a@example.com', card_number=card)
+
+    def test_counter_follows_checkout_return_and_cancel(self):
+        first = self._loan()
+        second = self._loan()
+        self.assertEqual(BorrowerCard.active_count('111'), 2)
+        services.return_loan(first)
+        self.assertEqual(BorrowerCard.active_count('111'), 1)
+        second.status = Loan.STATUS_CANCELED
+        second.save()
+        self.assertEqual(BorrowerCard.active_count('111'), 0)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 3)
+
+    def test_stale_instances_return_once(self):
+        loan = self._loan()
+        self._loan()
+        first, second = Loan.objects.get(pk=loan.pk), Loan.objects.get(pk=loan.pk)
+        first.mark_returned()
+        second.mark_returned()
+        services.return_loan(loan)
+        self.assertEqual(second.status, Loan.STATUS_RETURNED)
+        self.assertEqual(BorrowerCard.objects.get(card_number='111').active_loans, 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 2)
+
+    def test_limit_check_is_one_query(self):
+        self._loan()
+        with self.assertNumQueries(1):
+            BorrowerCard.active_count('111')
+
+    def test_rebuild_command(self):
+        self._loan()
+        self._loan(card='222')
+        BorrowerCard.objects.all().update(active_loans=4)
+        out = io.StringIO()
+        call_command('rebuild_card_counters', stdout=out)
+        self.assertIn('2 carte(s) avec emprunts actifs recalculée(s).', out.getvalue())
+        self.assertEqual(BorrowerCard.active_count('111'), 1)
+        self.assertEqual(BorrowerCard.active_count('222'), 1)
+
+
+class BulkReturnTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name='Test', last_name='Author')
+        self.books = [
+            Book.objects.create(title=f'B{i}', isbn='978' + str(1000000000 + i), author=author, copies_total=5, copies_available=5)
+            for i in range(3)
+        ]
+        self.loans = [
+            Loan.objects.create(book=self.books[i % 3], borrower_name='A', borrower_email='a@example.com', card_number=f'C{i % 2}')
+            for i in range(8)
+        ]
+
+    def test_return_loans_is_set_based(self):
+        ids = [loan.pk for loan in self.loans]
+        # savepoint, select, loans update, books with holds, books/cards updates,
+        # release: whatever the count
+        with self.assertNumQueries(7):
+            self.assertEqual(services.return_loans(ids), 8)
+        self.assertFalse(Loan.objects.exclude(status=Loan.STATUS_RETURNED).exists())
+        self.assertEqual([b.copies_available for b in Book.objects.order_by('pk')], [5, 5, 5])
+        self.assertEqual(BorrowerCard.active_count('C0') + BorrowerCard.active_count('C1'), 0)
+        # already returned: nothing to do
+        self.assertEqual(services.return_loans(ids), 0)
+
+    def test_batch_endpoint(self):
+        url = reverse('books:loan_return_batch')
+        resp = self.client.post(url, data=json.dumps({'loan_ids': [self.loans[0].pk, self.loans[3].pk]}), content_type='application/json')
+        self.assertEqual(resp.json(), {'returned': 2})
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].copies_available, 4)
+        resp = self.client.post(url, {'loan_ids': [self.loans[1].pk]})
+        self.assertEqual(resp.json(), {'returned': 1})
+        self.assertEqual(self.client.post(url, {'loan_ids': ['x']}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+
+class BatchCheckoutTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name='Test', last_name='Author')
+        self.books = [
+            Book.objects.create(title=f'B{i}', isbn='978' + str(1000000000 + i), author=author, copies_total=1, copies_available=1)
+            for i in range(6)
+        ]
+        self.ids = [b.pk for b in self.books]
+
+    def checkout(self, ids, card='K1'):
+        return services.checkout_batch(ids, card, 'Kiosk', 'k@example.com')
+
+    def test_basket_checkout(self):
+        loans = self.checkout(self.ids[:4])
+        self.assertEqual(len(loans), 4)
+        self.assertTrue(all(loan.due_date for loan in Loan.objects.all()))
+        self.assertEqual(BorrowerCard.active_count('K1'), 4)
+        self.assertEqual(Book.objects.filter(copies_available=0).count(), 4)
+
+    def test_all_or_nothing_with_item_errors(self):
+        self.checkout([self.ids[0]], card='OTHER')
+        with self.assertRaises(ValidationError) as ctx:
+            self.checkout([self.ids[0], self.ids[1], 99999])
+        self.assertEqual(set(ctx.exception.message_dict), {str(self.ids[0]), '99999'})
+        self.assertEqual(Loan.objects.filter(card_number='K1').count(), 0)
+        self.assertEqual(Book.objects.get(pk=self.ids[1]).copies_available, 1)
+
+    def test_card_limit_checked_once_for_basket(self):
+        with self.assertRaises(ValidationError) as ctx:
+            self.checkout(self.ids)
+        self.assertIn('__all__', ctx.exception.message_dict)
+        self.assertEqual(BorrowerCard.active_count('K1'), 0)
+
+    def test_batch_endpoint(self):
+        url = reverse('books:loan_checkout_batch')
+        payload = {'card_number': 'K2', 'borrower_name': 'Kiosk', 'borrower_email': 'k@example.com', 'book_ids': self.ids[:2]}
+        resp = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(resp.json()['loans']), 2)
+        resp = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn(str(self.ids[0]), resp.json()['errors'])
+
+
+class CheckoutStressTests(TransactionTestCase):
+    COPIES = 5
+    WORKERS = 24
+
+    def setUp(self):
+        author = Author.objects.create(first_name='Stress', last_name='Test')
+        self.book = Book.objects.create(title='Popular', isbn='9780000000002', author=author, copies_total=self.COPIES, copies_available=self.COPIES)
+
+    def _run_concurrently(self, make_loan):
+        barrier = threading.Barrier(self.WORKERS)
+        results = []
+
+        def worker(i):
+            try:
+                barrier.wait()
+                loan = make_loan(i)
+                _retry_locked(lambda: services.checkout(loan))
+                results.append(True)
+            except ValidationError:
+                results.append(False)
+            except Exception as e:  # surfaced by the assertions below
+                results.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.WORKERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results.count(True) + results.count(False), self.WORKERS, results)
+        return results.count(True)
+
+    def test_no_overselling_under_concurrent_checkouts(self):
+        succeeded = self._run_concurrently(
+            lambda i: Loan(book_id=self.book.pk, borrower_name=f'P{i}', borrower_email='p@example.com', card_number=f'C{i}')
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(succeeded, self.COPIES)
+        self.assertEqual(self.book.copies_available, 0)
+        self.assertEqual(Loan.objects.filter(book=self.book).count(), self.COPIES)
+
+    def test_card_limit_under_concurrent_checkouts(self):
+        self.book.copies_total = self.book.copies_available = self.WORKERS
+        self.book.save()
+        succeeded = self._run_concurrently(
+            lambda i: Loan(book_id=self.book.pk, borrower_name='P', borrower_email='p@example.com', card_number='SAME')
+        )
+        self.assertEqual(succeeded, MAX_ACTIVE_LOANS)
+        self.assertEqual(BorrowerCard.active_count('SAME'), MAX_ACTIVE_LOANS)
+        self.assertEqual(Loan.objects.filter(card_number='SAME').count(), MAX_ACTIVE_LOANS)
@@ -0,0 +1,71 @@
+import io
+import threading
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from books.models import Author, Book, Loan
+from books.sweeper import sweep_overdue
+from books import services, sweeper
+
+
+class OverdueSweeperTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name='Test', last_name='Author')
+        self.book = Book.objects.create(title='Sweep', isbn='9780000000002', author=author, copies_total=5, copies_available=5)
+        self.now = timezone.now()
+
+    def loan(self, due_in_days):
+        loan = Loan.objects.create(book=self.book, borrower_name='A', borrower_email='a@example.com', card_number='111')
+        Loan.objects.filter(pk=loan.pk).update(due_date=self.now + timedelta(days=due_in_days))
+        return loan
+
+    def test_marks_only_expired_loans(self):
+        sweep_overdue(now=self.now - timedelta(days=10))
+        late, current = self.loan(-2), self.loan(3)
+        with self.assertNumQueries(5):  # savepoint, state row, UPDATE, save state, release
+            self.assertEqual(sweep_overdue(now=self.now), 1)
+        self.assertEqual(Loan.objects.get(pk=late.pk).status, Loan.STATUS_LATE)
+        self.assertEqual(Loan.objects.get(pk=current.pk).status, Loan.STATUS_BORROWED)
+
+    def test_high_water_mark(self):
+        self.loan(-2)
+        sweep_overdue(now=self.now)
+        # expired before the mark without being swept (e.g. due date edited by hand)
+        missed = self.loan(-5)
+        newly_due = self.loan(1)
+        self.assertEqual(sweep_overdue(now=self.now + timedelta(days=2)), 1)
+        self.assertEqual(Loan.objects.get(pk=newly_due.pk).status, Loan.STATUS_LATE)
+        self.assertEqual(Loan.objects.get(pk=missed.pk).status, Loan.STATUS_BORROWED)
+        out = io.StringIO()
+        call_command('sweep_overdue', '--full', stdout=out)
+        self.assertIn('1 emprunt(s) passé(s) en retard.', out.getvalue())
+        self.assertEqual(Loan.objects.get(pk=missed.pk).status, Loan.STATUS_LATE)
+
+    def test_late_loans_view_and_return(self):
+        late = self.loan(-2)
+        self.loan(3)
+        sweep_overdue(now=self.now)
+        resp = self.client.get(reverse('books:loans_late'))
+        self.assertEqual([l.pk for l in resp.context['loans']], [late.pk])
+        resp = self.client.get(reverse('books:loans_active'))
+        self.assertEqual(len(resp.context['loans']), 2)
+        services.return_loan(Loan.objects.get(pk=late.pk))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 4)
+
+    @override_settings(BOOKS_OVERDUE_SWEEP_INTERVAL=3600)
+    def test_in_process_sweeper_starts_with_the_server_only(self):
+        def running():
+            return any(thread.name == 'overdue-sweeper' and thread.is_alive() for thread in threading.enumerate())
+        apps.get_app_config('books').ready()
+        self.assertFalse(running())
+        stop = sweeper.start_from_settings()
+        try:
+            self.assertTrue(running())
+        finally:
+            stop.set()
+            sweeper._thread.join()
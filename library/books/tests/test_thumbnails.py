@@ -0,0 +1,104 @@
+import io
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from books import thumbnails
+from books.models import Author, Book
+
+
+def upload(name, size=(1200, 1800), mode='RGB', fmt='JPEG'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(BOOKS_THUMBNAIL_WORKERS=0, BOOKS_PAGE_CACHE_TIMEOUT=0)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = Author.objects.create(first_name='Frank', last_name='Herbert')
+
+    def create_book(self, cover):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Book.objects.create(title='Dune', isbn='9780000000002', author=self.author, cover=cover)
+
+    def test_upload_renders_derivatives_beside_the_original(self):
+        book = self.create_book(upload('dune.jpg'))
+        self.assertTrue(book.cover.name.startswith('covers/dune'))
+        for (size, extension), name in thumbnails.derivative_names(book.cover.name).items():
+            self.assertTrue(name.startswith(book.cover.name.rsplit('.', 1)[0]))
+            with default_storage.open(name) as f, Image.open(f) as image:
+                self.assertEqual(image.format, {'jpg': 'JPEG', 'webp': 'WEBP'}[extension])
+                self.assertEqual(image.size, {'small': (200, 300), 'medium': (400, 600)}[size])
+        # saving again does not render again
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            Book.objects.get(pk=book.pk).save(update_fields=['cover'])
+            book.title = 'Dune (poche)'
+            book.save()
+        schedule.assert_not_called()
+
+    def test_transparent_png_stays_png(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.photo = upload('herbert.png', size=(300, 300), mode='RGBA', fmt='PNG')
+            self.author.save()
+        with default_storage.open(thumbnails.derivative_name(self.author.photo.name, 'small', 'png')) as f, Image.open(f) as image:
+            self.assertEqual((image.format, image.mode, image.size), ('PNG', 'RGBA', (200, 200)))
+
+    def test_template_helpers(self):
+        book = self.create_book(upload('dune.jpg'))
+        html = Template("{% load book_extras %}{% picture book.cover 'medium' alt='Couverture' %}").render(Context({'book': book}))
+        self.assertIn('dune', html)
+        self.assertIn('.medium.webp" type="image/webp"', html)
+        self.assertIn('.medium.jpg"', html)
+        url = Template("{% load book_extras %}{{ book.cover|thumbnail_url }}").render(Context({'book': book}))
+        self.assertTrue(url.endswith('.small.jpg'))
+        resp = self.client.get(f'/books/{book.pk}/')
+        self.assertContains(resp, '<picture>')
+        # not rendered yet: the original
+        for name in thumbnails.derivative_names(book.cover.name).values():
+            default_storage.delete(name)
+        html = Template("{% load book_extras %}{% picture book.cover %}").render(Context({'book': book}))
+        self.assertIn(f'src="{book.cover.url}"', html)
+
+    def test_backfill_command(self):
+        book = self.create_book(upload('dune.jpg'))
+        for name in thumbnails.derivative_names(book.cover.name).values():
+            default_storage.delete(name)
+        broken = Book.objects.create(title='Broken', isbn='9780000000019', author=self.author,
+                                     cover=SimpleUploadedFile('broken.jpg', b'not an image'))
+        out, err = StringIO(), StringIO()
+        call_command('generate_thumbnails', '--workers', '1', stdout=out, stderr=err)
+        self.assertIn('1 image(s) traitée(s), 0 déjà à jour, 1 en erreur', out.getvalue())
+        self.assertIn(broken.cover.name, err.getvalue())
+        self.assertTrue(thumbnails.has_derivatives(book.cover.name))
+        out = StringIO()
+        call_command('generate_thumbnails', '--model', 'books', '--workers', '1', stdout=out, stderr=StringIO())
+        self.assertIn('0 image(s) traitée(s), 1 déjà à jour', out.getvalue())
+
+    @override_settings(BOOKS_THUMBNAIL_WORKERS=1)
+    def test_upload_does_not_wait_for_the_rendering(self):
+        self.addCleanup(self.shutdown_pool)
+        book = self.create_book(upload('dune.jpg'))
+        deadline = time.monotonic() + 30
+        while not thumbnails.has_derivatives(book.cover.name) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(thumbnails.has_derivatives(book.cover.name))
+
+    def shutdown_pool(self):
+        if thumbnails._pool is not None:
+            thumbnails._pool.shutdown()
+            thumbnails._pool = None
@@ -0,0 +1,60 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from books.models import Author, Book, Loan
+
+
+class DirtyFieldsTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name='Test', last_name='Author')
+        self.book = Book.objects.create(title='Tracked', isbn='9780000000002', author=author, copies_total=3, copies_available=3)
+        self.loan = Loan.objects.create(book=self.book, borrower_name='A', borrower_email='a@example.com', card_number='111')
+
+    def test_unchanged_save_skips_the_query(self):
+        book = Book.objects.get(pk=self.book.pk)
+        with self.assertNumQueries(0):
+            book.save()
+        loan = Loan.objects.get(pk=self.loan.pk)
+        with self.assertNumQueries(0):
+            loan.save()
+
+    def test_only_changed_columns_are_written(self):
+        book = Book.objects.get(pk=self.book.pk)
+        book.publisher = 'Gallimard'
+        self.assertEqual(book.changed_fields(), {'publisher': ''})
+        with CaptureQueriesContext(connection) as ctx:
+            book.save()
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "books_book"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('SET "publisher"', updates[0])
+        self.assertNotIn('"copies_available"', updates[0])
+        # not an indexed column: the search index is left alone
+        self.assertFalse(any('books_book_fts' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(book.changed_fields(), {})
+
+    def test_status_change_without_reselecting_the_loan(self):
+        loan = Loan.objects.get(pk=self.loan.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            loan.mark_returned()
+        sql = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse(any(s.startswith('SELECT') and 'FROM "books_loan"' in s for s in sql))
+        self.assertTrue(any(s.startswith('UPDATE "books_loan" SET "returned_at"') for s in sql))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 3)
+
+    def test_refresh_is_not_a_change(self):
+        # copies moved by a conditional UPDATE elsewhere must not be written back
+        self.book.decrement_available()
+        self.assertEqual(self.book.copies_available, 1)
+        with self.assertNumQueries(0):
+            self.book.save()
+
+    def test_unloaded_instances_fall_back_to_a_full_save(self):
+        loan = Loan(pk=self.loan.pk, book=self.book, borrower_name='A', borrower_email='a@example.com',
+                    card_number='111', borrowed_at=self.loan.borrowed_at, due_date=self.loan.due_date,
+                    status=Loan.STATUS_CANCELED)
+        loan._state.adding = False
+        loan.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 3)
@@ -0,0 +1,72 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from books.forms import LoanCreateForm
+from books.models import Author, Book
+from books.search import isbn_prefix, suggest_books
+
+
+@override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0)
+class TypeaheadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='George', last_name='Orwell')
+        cls.nineteen = Book.objects.create(title='1984', isbn='9782070368228', author=author, copies_total=2, copies_available=2)
+        cls.farm = Book.objects.create(title='La Ferme des animaux', isbn='9782070375165', author=author, copies_total=1, copies_available=0)
+        cls.other = Book.objects.create(title='Hommage à la Catalogne', isbn='9791000000004', author=author)
+
+    def search(self, q):
+        return self.client.get(reverse('books:api_book_typeahead'), {'q': q}).json()['results']
+
+    def test_isbn_prefix(self):
+        self.assertEqual([r['title'] for r in self.search('978-207')], ['1984', 'La Ferme des animaux'])
+        self.assertEqual([r['title'] for r in self.search('979')], ['Hommage à la Catalogne'])
+        # an ISBN-10 is looked up under its 978 form
+        self.assertEqual([r['id'] for r in self.search('2070368228')], [self.nineteen.pk])
+        self.assertEqual(isbn_prefix('207037'), '978207037')
+        self.assertIsNone(isbn_prefix('ferme'))
+
+    def test_title_prefix(self):
+        rows = self.search('ferm anim')
+        self.assertEqual([r['id'] for r in rows], [self.farm.pk])
+        self.assertEqual(set(rows[0]), {'id', 'title', 'isbn', 'copies_available', 'author_first_name', 'author_last_name'})
+        # not an author search
+        self.assertEqual(self.search('orwell'), [])
+        self.assertEqual(self.search('f'), [])
+        # digits: the ISBN range first, then titles
+        self.assertEqual([r['id'] for r in self.search('1984')], [self.nineteen.pk])
+
+    def test_isbn_range_uses_the_unique_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite query plan')
+        qs = Book.objects.filter(isbn__gte='978207', isbn__lt='978208').order_by('isbn').values('id')[:10]
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('INDEX sqlite_autoindex_books_book_1 (isbn>? AND isbn<?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertEqual(len(suggest_books(Book.objects.all(), '978207', limit=1)), 1)
+
+    def test_form_renders_and_validates_a_single_book(self):
+        Book.objects.bulk_create([
+            Book(title=f'Livre {i}', isbn=f'97810000{i:05d}', author=self.farm.author) for i in range(50)
+        ])
+        resp = self.client.get(reverse('books:loan_create'))
+        self.assertContains(resp, 'book_picker.js')
+        self.assertContains(resp, reverse('books:api_book_typeahead'))
+        self.assertNotContains(resp, 'Livre 1')
+        resp = self.client.get(reverse('books:hold_create'), {'book': self.farm.pk})
+        self.assertContains(resp, 'value="La Ferme des animaux (9782070375165)"')
+
+        data = {'book': self.nineteen.pk, 'borrower_name': 'A', 'borrower_email': 'a@example.com', 'card_number': '1'}
+        form = LoanCreateForm(data)
+        # the book by id and the FK check of model validation, the card's
+        # loan count in the form and in Loan.clean(): no catalog scan
+        with self.assertNumQueries(4):
+            self.assertTrue(form.is_valid())
+        self.assertFalse(LoanCreateForm(dict(data, book=999)).is_valid())
+        self.assertFalse(LoanCreateForm(dict(data, book='x')).is_valid())
+        # nothing picked (typing clears the hidden id): an error, not a crash
+        self.assertEqual(self.client.post(reverse('books:loan_create'), dict(data, book='')).status_code, 200)
@@ -1,5 +1,9 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.urls import reverse
+from books import services
 from books.models import Book, Loan, Author
 
 
@@ -53,3 +57,33 @@ class LoanViewsTest(TestCase):
         self.assertEqual(resp.status_code, 200)
         loan.refresh_from_db()
         self.assertEqual(loan.status, Loan.STATUS_RETURNED)
+
+    def lose_the_race(self):
+        """Take every copy between the form validation and the checkout, as a
+        concurrent checkout would."""
+        lock_book = services.lock_book
+
+        def take_the_copies_then_lock(book_id):
+            Book.objects.filter(pk=book_id).update(copies_available=0)
+            return lock_book(book_id)
+        return mock.patch('books.services.lock_book', take_the_copies_then_lock)
+
+    def test_checkout_losing_the_race_redisplays_the_form(self):
+        data = {'book': self.book.pk, 'borrower_name': 'John Doe', 'borrower_email': 'john@example.com',
+                'card_number': 'CARD123', 'comments': ''}
+        for name in ('books:loan_create', 'books:loan_create_fbv'):
+            with self.lose_the_race():
+                resp = self.client.post(reverse(name), data)
+            self.assertEqual(resp.status_code, 200, name)
+            self.assertTemplateUsed(resp, 'loans/loan_form.html')
+            self.assertTrue(resp.context['form'].non_field_errors(), name)
+        self.assertFalse(Loan.objects.exists())
+
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        add = reverse('admin:books_loan_add')
+        with self.lose_the_race():
+            resp = self.client.post(add, dict(data, status=Loan.STATUS_BORROWED), follow=True)
+        self.assertRedirects(resp, add)
+        self.assertContains(resp, 'pas été créé')
+        self.assertFalse(Loan.objects.exists())
@@ -0,0 +1,167 @@
+"""Thumbnails and WebP variants of the catalog images.
+
+Each size of SIZES is rendered for every book cover, author photo and
+category image, in the format of the original (PNG for PNG/GIF originals,
+JPEG otherwise) and in WebP, and stored beside it: ``covers/dune.jpg`` gets
+``covers/dune.small.jpg``, ``covers/dune.small.webp``,
+``covers/dune.medium.jpg``... Templates pick them with ``{% picture %}`` or
+``|thumbnail_url`` (books.templatetags.book_extras).
+
+After an upload the rendering is handed to a pool of
+``BOOKS_THUMBNAIL_WORKERS`` processes once the transaction commits, so the
+request does not wait for Pillow; until the derivatives exist the helpers
+serve the original. With 0 workers it runs in the saving thread instead.
+``manage.py generate_thumbnails`` renders the missing ones in bulk.
+"""
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name -> bounding box (width, height); the aspect ratio is kept
+SIZES = {
+    'small': (200, 300),
+    'medium': (400, 600),
+}
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+# model label -> image field with derivatives
+IMAGE_FIELDS = {
+    'books.Book': 'cover',
+    'books.Author': 'photo',
+    'books.Category': 'image',
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def fallback_extension(name):
+    """Extension of the non-WebP derivatives of `name`."""
+    return 'png' if os.path.splitext(name)[1].lower() in ('.png', '.gif') else 'jpg'
+
+
+def derivative_name(name, size, extension):
+    return f'{os.path.splitext(name)[0]}.{size}.{extension}'
+
+
+def derivative_names(name):
+    """``{(size, extension): storage name}`` of all the derivatives of `name`."""
+    fallback = fallback_extension(name)
+    return {
+        (size, extension): derivative_name(name, size, extension)
+        for size in SIZES for extension in (fallback, 'webp')
+    }
+
+
+def render(data, fallback):
+    """The derivatives of the image bytes `data`: ``{(size, extension): bytes}``.
+
+    Pure function of its arguments: this is what runs in the worker processes."""
+    derivatives = {}
+    with Image.open(io.BytesIO(data)) as original:
+        # photos from a camera: apply the EXIF orientation before resizing
+        original = ImageOps.exif_transpose(original)
+        original = original.convert('RGB' if fallback == 'jpg' else 'RGBA')
+        for size, box in SIZES.items():
+            image = original.copy()
+            image.thumbnail(box, Image.Resampling.LANCZOS)
+            for extension, fmt, options in (
+                (fallback, 'JPEG' if fallback == 'jpg' else 'PNG', {'quality': JPEG_QUALITY, 'optimize': True}),
+                ('webp', 'WEBP', {'quality': WEBP_QUALITY, 'method': 4}),
+            ):
+                buffer = io.BytesIO()
+                image.save(buffer, fmt, **options)
+                derivatives[size, extension] = buffer.getvalue()
+    return derivatives
+
+
+def store(name, derivatives, storage=None):
+    """Save the output of render() beside `name`, replacing older versions."""
+    storage = storage or default_storage
+    names = derivative_names(name)
+    for key, content in derivatives.items():
+        path = names[key]
+        if storage.exists(path):
+            storage.delete(path)
+        storage.save(path, ContentFile(content))
+
+
+def generate(name, storage=None):
+    """Render and store the derivatives of image `name` in this thread."""
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as f:
+        data = f.read()
+    store(name, render(data, fallback_extension(name)), storage)
+
+
+def has_derivatives(name, storage=None):
+    storage = storage or default_storage
+    return storage.exists(derivative_name(name, next(iter(SIZES)), 'webp'))
+
+
+def urls(file, size):
+    """``(webp url, fallback url)`` of the `size` derivatives of the FieldFile
+    `file`, or None while they are not rendered."""
+    if size not in SIZES:
+        raise ValueError(f'Unknown thumbnail size {size!r}, expected one of {", ".join(SIZES)}')
+    if not has_derivatives(file.name, file.storage):
+        return None
+    names = derivative_names(file.name)
+    return (
+        file.storage.url(names[size, 'webp']),
+        file.storage.url(names[size, fallback_extension(file.name)]),
+    )
+
+
+def workers():
+    return getattr(settings, 'BOOKS_THUMBNAIL_WORKERS', 2)
+
+
+def get_pool():
+    """The process pool shared by the uploads of this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the workers only need Pillow, not a copy of a threaded
+            # process with open database connections
+            _pool = ProcessPoolExecutor(workers(), mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def schedule(name, storage=None):
+    """Render the derivatives of `name` once the current transaction commits."""
+    storage = storage or default_storage
+    transaction.on_commit(lambda: _submit(name, storage))
+
+
+def _submit(name, storage):
+    try:
+        if not workers():
+            generate(name, storage)
+            return
+        with storage.open(name, 'rb') as f:
+            data = f.read()
+    except Exception:
+        logger.exception('Thumbnails of %s failed', name)
+        return
+    future = get_pool().submit(render, data, fallback_extension(name))
+    future.add_done_callback(lambda future: _done(name, storage, future))
+
+
+def _done(name, storage, future):
+    try:
+        store(name, future.result(), storage)
+    except Exception:
+        logger.exception('Thumbnails of %s failed', name)
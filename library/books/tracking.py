@@ -0,0 +1,71 @@
+"""Dirty-field tracking for models.
+
+An instance remembers the column values it was loaded (or last saved) with.
+``save()`` then writes only the columns that changed, and skips the query
+entirely when nothing did; signal handlers read the previous values from
+memory instead of selecting the row again.
+"""
+from django.db.models.fields.files import FieldFile
+
+_MISSING = object()
+
+
+def _comparable(value):
+    # FieldFile.save() changes the file in place: compare by stored name
+    return value.name if isinstance(value, FieldFile) else value
+
+
+class DirtyFieldsMixin:
+    """Mix into a model; values are compared with ``!=``, so fields holding
+    mutable objects (JSON...) must be reassigned, not mutated in place."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def _snapshot(self, attnames=None):
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred or (attnames is not None and field.attname not in attnames):
+                continue
+            loaded[field.attname] = _comparable(getattr(self, field.attname))
+
+    def loaded_value(self, attname, default=None):
+        """Value of `attname` when the instance was loaded or last saved."""
+        value = getattr(self, '_loaded_values', {}).get(attname, _MISSING)
+        return default if value is _MISSING else value
+
+    def is_tracked(self, attname):
+        return attname in getattr(self, '_loaded_values', {})
+
+    def changed_fields(self):
+        """``{attname: loaded value}`` of the fields modified since."""
+        loaded = getattr(self, '_loaded_values', {})
+        return {
+            attname: old for attname, old in loaded.items()
+            if attname in self.__dict__ and _comparable(getattr(self, attname)) != old
+        }
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and getattr(self, '_loaded_values', None)
+                and kwargs.get('update_fields') is None and not kwargs.get('force_insert') and not args):
+            changed = self.changed_fields()
+            if not changed:
+                return
+            names = {f.attname: f.name for f in self._meta.concrete_fields}
+            kwargs['update_fields'] = [names[attname] for attname in changed]
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._snapshot(None if update_fields is None else self._attnames(update_fields))
+
+    def _attnames(self, names):
+        fields = {f.name: f.attname for f in self._meta.concrete_fields}
+        return {fields.get(name, name) for name in names}
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # the fresh values are what the database holds: not changes to write back
+        self._snapshot(None if fields is None else self._attnames(fields))
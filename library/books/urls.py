@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'books'
 
@@ -18,9 +18,30 @@ urlpatterns = [
     # loans (class-based)
     path('loans/active/', views.ActiveLoanListView.as_view(), name='loans_active'),
     path('loans/late/', views.LateLoanListView.as_view(), name='loans_late'),
+    path('loans/fines/', views.FinesReportView.as_view(), name='loans_fines'),
     path('loans/history/<str:card_number>/', views.UserLoanHistoryView.as_view(), name='loan_history'),
     path('loans/create/', views.LoanCreateView.as_view(), name='loan_create'),
     path('loans/<int:pk>/return/', views.LoanReturnView.as_view(), name='loan_return'),
+    path('holds/create/', views.hold_create, name='hold_create'),
+    path('holds/<int:pk>/cancel/', views.hold_cancel, name='hold_cancel'),
+    path('holds/<str:card_number>/', views.hold_list, name='hold_list'),
+    path('loans/return/batch/', views.loan_return_batch, name='loan_return_batch'),
+    path('loans/checkout/batch/', views.loan_checkout_batch, name='loan_checkout_batch'),
+
+    path('loans/export/', views.loan_export, name='loan_export'),
+    path('export/', views.book_export, name='book_export'),
+
+    # read-only JSON API
+    path('api/books/', api.BookApiList.as_view(), name='api_book_list'),
+    path('api/books/typeahead/', api.book_typeahead, name='api_book_typeahead'),
+    path('api/books/<int:pk>/', api.BookApiDetail.as_view(), name='api_book_detail'),
+    path('api/authors/', api.AuthorApiList.as_view(), name='api_author_list'),
+    path('api/authors/<int:pk>/', api.AuthorApiDetail.as_view(), name='api_author_detail'),
+    path('api/categories/', api.CategoryApiList.as_view(), name='api_category_list'),
+    path('api/categories/<int:pk>/', api.CategoryApiDetail.as_view(), name='api_category_detail'),
+    path('api/availability/', api.AvailabilityApi.as_view(), name='api_availability'),
+
+    path('cache/stats/', views.cache_stats, name='cache_stats'),
 
     # function-based alternatives (prefix 'fbv/')
     path('fbv/', views.book_list_fbv, name='book_list_fbv'),
@@ -31,4 +52,11 @@ urlpatterns = [
     path('fbv/authors/<int:pk>/', views.author_detail_fbv, name='author_detail_fbv'),
     path('fbv/loans/create/', views.loan_create_fbv, name='loan_create_fbv'),
     path('fbv/loans/<int:pk>/return/', views.loan_return_fbv, name='loan_return_fbv'),
+
+    # async alternatives for ASGI (prefix 'async/')
+    path('async/', views.book_list_async, name='book_list_async'),
+    path('async/category/<int:category_id>/', views.book_list_async, name='book_by_category_async'),
+    path('async/author/<int:author_id>/', views.book_list_async, name='book_by_author_async'),
+    path('async/<int:pk>/', views.book_detail_async, name='book_detail_async'),
+    path('async/availability/', api.availability_async, name='availability_async'),
 ]
\ No newline at end of file
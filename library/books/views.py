@@ -1,52 +1,81 @@
+from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy, reverse
-from django.views.generic import ListView, DetailView, CreateView, View
-from django.utils import timezone
-from .models import Book, Author, Loan, Category
-from .forms import LoanCreateForm
-from django.db.models import Q
-
-
-class BookListView(ListView):
+from django.utils.decorators import method_decorator
+from django.views.generic import ListView, DetailView, CreateView, TemplateView, View
+from .models import Book, Author, Hold, Loan, LoanArchive, Category, HOLD_PICKUP_PERIOD
+from .forms import BatchCheckoutForm, HoldCreateForm, LoanCreateForm, LoanExportForm
+from . import archive, exports, search, services
+from .pagination import CursorPaginationMixin, MergedCursorPaginator
+from .cache import cache_catalog_page
+from .replicas import use_replica
+from . import cache as page_cache
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+
+
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
+class BookListView(CursorPaginationMixin, ListView):
     model = Book
     template_name = 'books/book_list.html'
     context_object_name = 'books'
     paginate_by = 8
+    cursor_ordering = ('title', 'id')
+
+    def get_pagination_mode(self):
+        # relevance-ranked search results can't be keyset-paginated on (title, id)
+        if self.request.GET.get('q'):
+            return 'offset'
+        return super().get_pagination_mode()
 
     def get_queryset(self):
         qs = super().get_queryset().select_related('author', 'category')
         q = self.request.GET.get('q')
         category_id = self.kwargs.get('category_id') or self.request.GET.get('category')
         author_id = self.kwargs.get('author_id') or self.request.GET.get('author')
-        if q:
-            qs = qs.filter(Q(title__icontains=q) | Q(isbn__icontains=q) | Q(author__first_name__icontains=q) | Q(author__last_name__icontains=q))
         if category_id:
             qs = qs.filter(category_id=category_id)
         if author_id:
             qs = qs.filter(author_id=author_id)
+        if q:
+            # relevance-ranked through the search index
+            return search.search_books(qs, q)
         return qs.order_by('title')
 
 
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
 class BookDetailView(DetailView):
     model = Book
+    queryset = Book.objects.select_related('author')
     template_name = 'books/book_detail.html'
     context_object_name = 'book'
 
 
-class AuthorListView(ListView):
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
+class AuthorListView(CursorPaginationMixin, ListView):
     model = Author
     template_name = 'books/author_list.html'
     context_object_name = 'authors'
     paginate_by = 12
+    # names are nullable: sort on non-NULL copies so the keyset comparison holds
+    cursor_ordering = ('sort_last_name', 'sort_first_name', 'id')
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = super().get_queryset().annotate(
+            sort_last_name=Coalesce('last_name', Value('')),
+            sort_first_name=Coalesce('first_name', Value('')),
+        )
         q = self.request.GET.get('q')
         if q:
             qs = qs.filter(Q(first_name__icontains=q) | Q(last_name__icontains=q))
-        return qs.order_by('last_name', 'first_name')
+        return qs.order_by('sort_last_name', 'sort_first_name', 'id')
 
 
+@method_decorator(use_replica, name='dispatch')
+@method_decorator(cache_catalog_page, name='dispatch')
 class AuthorDetailView(DetailView):
     model = Author
     template_name = 'books/author_detail.html'
@@ -58,36 +87,58 @@ class AuthorDetailView(DetailView):
         return ctx
 
 
-class ActiveLoanListView(ListView):
+class ActiveLoanListView(CursorPaginationMixin, ListView):
     model = Loan
     template_name = 'loans/active_loans.html'
     context_object_name = 'loans'
     paginate_by = 15
+    cursor_ordering = ('-borrowed_at', '-id')
 
     def get_queryset(self):
-        return Loan.objects.filter(status=Loan.STATUS_BORROWED).select_related('book')
+        # late loans are still out and must stay returnable from this list
+        return Loan.objects.filter(status__in=[Loan.STATUS_BORROWED, Loan.STATUS_LATE]).select_related('book')
 
 
-class LateLoanListView(ListView):
+class LateLoanListView(CursorPaginationMixin, ListView):
     model = Loan
     template_name = 'loans/late_loans.html'
     context_object_name = 'loans'
     paginate_by = 15
+    cursor_ordering = ('-borrowed_at', '-id')
 
     def get_queryset(self):
-        return Loan.objects.filter(status=Loan.STATUS_BORROWED, due_date__lt=timezone.now()).select_related('book')
+        # STATUS_LATE is maintained by the overdue sweeper (books.sweeper)
+        return Loan.objects.filter(status=Loan.STATUS_LATE).select_related('book').with_penalties()
+
+
+class FinesReportView(TemplateView):
+    """Outstanding fines per card and per month, each one GROUP BY query per
+    loan table (books.archive)."""
+    template_name = 'loans/fines_report.html'
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['by_card'] = archive.fines_report(by='card')
+        ctx['by_month'] = archive.fines_report(by='month')
+        return ctx
 
 
-class UserLoanHistoryView(ListView):
+class UserLoanHistoryView(CursorPaginationMixin, ListView):
     model = Loan
     template_name = 'loans/history.html'
     context_object_name = 'loans'
     paginate_by = 20
+    cursor_ordering = ('-borrowed_at', '-id')
 
     def get_queryset(self):
         card = self.kwargs.get('card_number')
         return Loan.objects.filter(card_number=card).select_related('book')
 
+    def get_cursor_paginator(self, queryset, page_size):
+        # the loans moved to the archive (books.archive) are part of the history
+        archived = LoanArchive.objects.filter(card_number=self.kwargs.get('card_number')).select_related('book')
+        return MergedCursorPaginator([queryset, archived], page_size, self.cursor_ordering)
+
 
 class LoanCreateView(CreateView):
     model = Loan
@@ -98,14 +149,21 @@ class LoanCreateView(CreateView):
         return reverse('books:loans_active')
 
     def form_valid(self, form):
-        # model clean() will enforce availability and max loans
-        return super().form_valid(form)
+        # model clean() will enforce availability and max loans;
+        # the copy itself is reserved atomically by the checkout engine
+        try:
+            self.object = services.checkout(form.save(commit=False))
+        except ValidationError as e:
+            # a concurrent checkout took the last copy or card slot since clean()
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
 
 
 class LoanReturnView(View):
     def post(self, request, pk):
         loan = get_object_or_404(Loan, pk=pk)
-        loan.mark_returned()
+        services.return_loan(loan)
         return redirect('books:loans_active')
 
 
@@ -120,15 +178,17 @@ def index_redirect(request):
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 
+@use_replica
+@cache_catalog_page
 def book_list_fbv(request, category_id=None, author_id=None):
     q = request.GET.get('q')
     qs = Book.objects.select_related('author', 'category').all().order_by('title')
-    if q:
-        qs = qs.filter(Q(title__icontains=q) | Q(isbn__icontains=q) | Q(author__first_name__icontains=q) | Q(author__last_name__icontains=q))
     if category_id:
         qs = qs.filter(category_id=category_id)
     if author_id:
         qs = qs.filter(author_id=author_id)
+    if q:
+        qs = search.search_books(qs, q)
 
     page = request.GET.get('page', 1)
     paginator = Paginator(qs, 8)
@@ -143,11 +203,15 @@ def book_list_fbv(request, category_id=None, author_id=None):
     return render(request, 'books/book_list.html', context)
 
 
+@use_replica
+@cache_catalog_page
 def book_detail_fbv(request, pk):
-    book = get_object_or_404(Book, pk=pk)
+    book = get_object_or_404(Book.objects.select_related('author'), pk=pk)
     return render(request, 'books/book_detail.html', {'book': book})
 
 
+@use_replica
+@cache_catalog_page
 def author_list_fbv(request):
     q = request.GET.get('q')
     qs = Author.objects.all().order_by('last_name', 'first_name')
@@ -164,31 +228,218 @@ def author_list_fbv(request):
     return render(request, 'books/author_list.html', {'authors': page_obj.object_list, 'page_obj': page_obj})
 
 
+@use_replica
+@cache_catalog_page
 def author_detail_fbv(request, pk):
     author = get_object_or_404(Author, pk=pk)
     books = author.books.all()
     return render(request, 'books/author_detail.html', {'author': author, 'books': books})
 
 
+import json
+
 from django.contrib import messages
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
 
 
 def loan_create_fbv(request):
     if request.method == 'POST':
         form = LoanCreateForm(request.POST)
         if form.is_valid():
-            loan = form.save()
-            messages.success(request, 'Emprunt créé avec succès.')
-            return redirect('books:loans_active')
+            try:
+                services.checkout(form.save(commit=False))
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.success(request, 'Emprunt créé avec succès.')
+                return redirect('books:loans_active')
     else:
         form = LoanCreateForm()
     return render(request, 'loans/loan_form.html', {'form': form})
 
 
+def cache_stats(request):
+    """Page cache hit/miss counters of this process, for monitoring."""
+    version, changed = page_cache.catalog_version()
+    return JsonResponse(dict(page_cache.stats(), catalog_version=version, catalog_changed_at=changed))
+
+
+@require_POST
+def loan_return_batch(request):
+    """Return many loans in one transaction.
+
+    Accepts a JSON body ``{"loan_ids": [1, 2, 3]}`` or form-encoded
+    ``loan_ids`` values; answers ``{"returned": n}``."""
+    if request.content_type == 'application/json':
+        try:
+            ids = json.loads(request.body or b'{}').get('loan_ids', [])
+        except (ValueError, AttributeError):
+            return JsonResponse({'error': 'JSON invalide.'}, status=400)
+    else:
+        ids = request.POST.getlist('loan_ids')
+    try:
+        ids = [int(pk) for pk in ids]
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Identifiants d\'emprunt invalides.'}, status=400)
+    return JsonResponse({'returned': services.return_loans(ids)})
+
+
+@require_POST
+def loan_checkout_batch(request):
+    """Self-service kiosk checkout: several books for one card, all or nothing.
+
+    JSON body (or form values) with ``card_number``, ``borrower_name``,
+    ``borrower_email`` and ``book_ids``; answers 201 with the created loans or
+    400 with per-item ``errors`` keyed by book id."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'JSON invalide.'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'JSON invalide.'}, status=400)
+    else:
+        data = request.POST.dict()
+        data['book_ids'] = json.dumps(request.POST.getlist('book_ids'))
+    form = BatchCheckoutForm(data)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data(escape_html=True)}, status=400)
+    cd = form.cleaned_data
+    try:
+        loans = services.checkout_batch(
+            cd['book_ids'], cd['card_number'], cd['borrower_name'], cd['borrower_email'], cd['comments'],
+        )
+    except ValidationError as e:
+        return JsonResponse({'errors': e.message_dict}, status=400)
+    return JsonResponse({
+        'loans': [{'id': loan.pk, 'book_id': loan.book_id, 'due_date': loan.due_date} for loan in loans],
+    }, status=201)
+
+
 def loan_return_fbv(request, pk):
     loan = get_object_or_404(Loan, pk=pk)
     if request.method == 'POST':
-        loan.mark_returned()
+        services.return_loan(loan)
         messages.success(request, 'Emprunt marqué comme rendu.')
         return redirect('books:loans_active')
     return render(request, 'loans/loan_return.html', {'loan': loan})
+
+
+def hold_create(request):
+    """Queue a card for a book with no copy on the shelf."""
+    if request.method == 'POST':
+        form = HoldCreateForm(request.POST)
+        if form.is_valid():
+            cd = form.cleaned_data
+            try:
+                hold = services.place_hold(cd['book'].pk, cd['card_number'], cd['borrower_name'], cd['borrower_email'])
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.success(request, f'Réservation enregistrée : position {hold.position()} dans la file.')
+                return redirect('books:hold_list', card_number=hold.card_number)
+    else:
+        form = HoldCreateForm(initial={'book': request.GET.get('book')})
+    return render(request, 'loans/hold_form.html', {'form': form, 'pickup_days': HOLD_PICKUP_PERIOD.days})
+
+
+def hold_list(request, card_number):
+    holds = Hold.objects.filter(card_number=card_number, status__in=Hold.ACTIVE_STATUSES).select_related('book')
+    return render(request, 'loans/holds.html', {'holds': holds, 'card_number': card_number})
+
+
+@require_POST
+def hold_cancel(request, pk):
+    hold = get_object_or_404(Hold, pk=pk)
+    if services.cancel_hold(hold):
+        messages.success(request, 'Réservation annulée.')
+    return redirect('books:hold_list', card_number=hold.card_number)
+
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+
+def _export_response(queryset, columns, fmt, name):
+    response = StreamingHttpResponse(exports.stream(queryset, columns, fmt), content_type=exports.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{name}-{timezone.localdate():%Y%m%d}.{fmt}"'
+    return response
+
+
+@use_replica
+@staff_member_required
+def loan_export(request):
+    """Stream loans as CSV (default) or JSON Lines (``?format=jsonl``),
+    filtered by ``status``, ``since``/``until`` (borrow dates) and ``card_number``."""
+    form = LoanExportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data(escape_html=True)}, status=400)
+    cd = form.cleaned_data
+    qs = exports.loan_querysets(cd['status'], cd['since'], cd['until'], cd['card_number'])
+    return _export_response(qs, exports.LOAN_COLUMNS, cd['format'] or 'csv', 'emprunts')
+
+
+@use_replica
+@staff_member_required
+def book_export(request):
+    """Stream the catalog as CSV (default) or JSON Lines (``?format=jsonl``)."""
+    fmt = request.GET.get('format') or 'csv'
+    if fmt not in exports.FORMATS:
+        return JsonResponse({'error': 'Format inconnu.'}, status=400)
+    return _export_response(exports.book_queryset(), exports.BOOK_COLUMNS, fmt, 'catalogue')
+
+
+# Async variants of the catalog pages, for the ASGI deployment
+# (library_project/asgi.py). Everything the templates show is fetched here
+# with the async ORM: rendering must not trigger a lazy query.
+
+from django.http import Http404
+from .pagination import CursorPaginator, InvalidCursor
+
+
+async def _offset_page(qs, number, per_page):
+    """Paginator.get_page() with the async ORM."""
+    paginator = Paginator(qs, per_page)
+    paginator.count = await qs.acount()
+    page = paginator.get_page(number)
+    page.object_list = [obj async for obj in page.object_list]
+    return paginator, page
+
+
+@use_replica
+@cache_catalog_page
+async def book_list_async(request, category_id=None, author_id=None):
+    qs = Book.objects.select_related('author', 'category')
+    category_id = category_id or request.GET.get('category')
+    author_id = author_id or request.GET.get('author')
+    if category_id:
+        qs = qs.filter(category_id=category_id)
+    if author_id:
+        qs = qs.filter(author_id=author_id)
+    q = request.GET.get('q')
+    if q:
+        # relevance order: offset pages, as in BookListView
+        paginator, page_obj = await _offset_page(search.search_books(qs, q), request.GET.get('page'), 8)
+    else:
+        paginator = CursorPaginator(qs, 8, BookListView.cursor_ordering)
+        try:
+            page_obj = await paginator.apage(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Curseur de pagination invalide.')
+    context = {
+        'books': page_obj.object_list, 'page_obj': page_obj, 'paginator': paginator,
+        'is_paginated': page_obj.has_other_pages(),
+    }
+    return render(request, 'books/book_list.html', context)
+
+
+@use_replica
+@cache_catalog_page
+async def book_detail_async(request, pk):
+    try:
+        book = await Book.objects.select_related('author').aget(pk=pk)
+    except Book.DoesNotExist:
+        raise Http404
+    return render(request, 'books/book_detail.html', {'book': book})
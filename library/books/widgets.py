@@ -0,0 +1,35 @@
+from django import forms
+from django.urls import reverse_lazy
+
+
+class BookPicker(forms.Widget):
+    """Typeahead in place of a <select> of the whole catalog.
+
+    The form posts the book id (hidden input); the text box asks
+    ``api/books/typeahead/`` for matches as the user types. Only the selected
+    book is looked up when rendering, and ModelChoiceField validates the
+    submitted id with a single ``get(pk=...)``."""
+
+    template_name = 'books/widgets/book_picker.html'
+    url = reverse_lazy('books:api_book_typeahead')
+
+    class Media:
+        js = ('books/js/book_picker.js',)
+
+    def selected_label(self, value):
+        if value in (None, ''):
+            return ''
+        # ModelChoiceField hands its ModelChoiceIterator over as `choices`
+        queryset = getattr(self.choices, 'queryset', None)
+        if queryset is None:
+            return ''
+        try:
+            book = queryset.filter(pk=value).values('title', 'isbn').first()
+        except (TypeError, ValueError):
+            return ''
+        return f"{book['title']} ({book['isbn']})" if book else ''
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget'].update(url=str(self.url), label=self.selected_label(value))
+        return context
@@ -4,3 +4,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_project.settings')
 
 application = get_asgi_application()
+
+# server processes only: the in-process overdue sweeper, if configured
+from books import sweeper  # noqa: E402
+
+sweeper.start_from_settings()
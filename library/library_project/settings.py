@@ -22,6 +22,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first: times the whole request, see books.metrics
+    'books.metrics.QueryMetricsMiddleware',
+    # removed at startup unless BOOKS_PROFILING, see books.profiling
+    'books.profiling.ProfilingMiddleware',
+    # removed at startup unless BOOKS_READ_REPLICAS, see books.replicas
+    'books.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -55,9 +61,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            # concurrent requests: a transaction that reads then writes must
+            # wait for the write lock, not fail with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    },
+    # read replica stand-in: a copy of db.sqlite3 refreshed by
+    # `manage.py sync_replica`, used once listed in BOOKS_READ_REPLICAS
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['books.replicas.ReplicaRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -75,8 +97,51 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+CACHES = {
+    # must be shared between processes in production (memcached, redis):
+    # it holds the catalog version used to invalidate cached pages
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 LOAN_PENALTY_PER_DAY = Decimal('0.50')
 
+# Lifetime in seconds of cached catalog pages (0 disables the page cache)
+BOOKS_PAGE_CACHE_TIMEOUT = 600
+
+# Seconds between two in-process runs of the overdue sweeper, in the server
+# processes only (None: use the `sweep_overdue` management command from cron)
+BOOKS_OVERDUE_SWEEP_INTERVAL = None
+
+# Loans closed for this many days are moved to the archive table by
+# `manage.py archive_loans` (books.archive)
+BOOKS_LOAN_ARCHIVE_AFTER_DAYS = 365
+
+# A SELECT repeated this many times in one request is logged as a probable N+1
+BOOKS_METRICS_N_PLUS_ONE = 5
+# When set, /metrics requires the header `Authorization: Bearer <token>`
+BOOKS_METRICS_TOKEN = None
+
+# Request profiling (books.profiling): off, the middleware is not loaded
+BOOKS_PROFILING = False
+# Share of the requests profiled at random, from 0 to 1
+BOOKS_PROFILING_SAMPLE_RATE = 0
+# A request slower than this (ms) has the next one of its view profiled
+BOOKS_PROFILING_SLOW_MS = None
+BOOKS_PROFILING_DIR = BASE_DIR / 'profiles'
+# Number of profiles kept
+BOOKS_PROFILING_KEEP = 200
+
+# Aliases the catalog pages read from (books.replicas); empty: all on default
+BOOKS_READ_REPLICAS = []
+# Upper bound in seconds of the replicas' lag: how long a browser that wrote
+# stays on the primary and a page rendered from a replica may be stale
+BOOKS_REPLICA_LAG = 5
+
+# Processes rendering the thumbnails of uploaded images (0: in the request)
+BOOKS_THUMBNAIL_WORKERS = 2
+
 try:
     from .settings_local import *  # noqa
 except ImportError:
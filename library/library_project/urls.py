@@ -1,12 +1,19 @@
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from books import profiling
+from books.metrics import metrics_view
+
 urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(profiling.profiles_view), name='profiles'),
+    re_path(r'^admin/profiles/(?P<name>[\w.-]+)\.(?P<fmt>prof|folded)$',
+            admin.site.admin_view(profiling.profile_download), name='profile_download'),
     path('admin/', admin.site.urls),
     path('', include(('library.urls_app', 'library'), namespace='library')),
     path('books/', include(('books.urls', 'books'), namespace='books')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
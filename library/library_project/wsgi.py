@@ -4,3 +4,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_project.settings')
 
 application = get_wsgi_application()
+
+# server processes only: the in-process overdue sweeper, if configured
+from books import sweeper  # noqa: E402
+
+sweeper.start_from_settings()
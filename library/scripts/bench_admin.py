@@ -0,0 +1,149 @@
+"""Benchmark: admin pages on a large loan table, former profile vs. current one.
+
+    python scripts/bench_admin.py --loans 1000000
+
+The former profile is the current ModelAdmin with the scaling settings taken
+back out: Django's Paginator (exact COUNT(*) on every page, plus the full
+count of the table), no select_related on the changelist, plain <select>
+widgets listing every book/author and the book page's whole loan history.
+
+At 1M loans (50k books, 2% of the loans on one book) on a laptop: loan
+changelist ~2.5 s -> ~0.12 s, loan add form ~6.8 s -> ~12 ms, the popular
+book's page ~43 s and 20k queries -> ~34 ms and 3 queries.
+
+Exits with an error if a page of the current profile runs more queries at
+full size than with the first thousand loans, or any unbounded COUNT(*) of
+the loan table.
+"""
+import argparse
+import random
+import re
+
+from benchutils import bench_database, measure, print_table, seed_catalog
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db import connection
+from django.forms.models import BaseInlineFormSet
+from django.test import RequestFactory
+
+UNBOUNDED_COUNT = re.compile(r'SELECT COUNT\(\*\).*FROM "books_loan"(?!.*LIMIT)', re.S)
+
+
+def former(admin_class, **overrides):
+    attrs = {
+        'paginator': Paginator, 'show_full_result_count': True,
+        'list_select_related': False, 'autocomplete_fields': (), 'ordering': None,
+    }
+    attrs.update(overrides)
+    return type(f'Former{admin_class.__name__}', (admin_class,), attrs)
+
+
+def seed_loans(n_loans, popular, popular_share, seed=42, batch_size=20_000):
+    """Bulk insert `n_loans` loans, `popular_share` of them on book `popular`."""
+    from books.models import Book, Loan
+
+    rng = random.Random(seed)
+    book_ids = list(Book.objects.values_list('pk', flat=True))
+    statuses = [Loan.STATUS_RETURNED] * 8 + [Loan.STATUS_BORROWED, Loan.STATUS_LATE]
+    for start in range(0, n_loans, batch_size):
+        Loan.objects.bulk_create(
+            [
+                Loan(
+                    book_id=popular if rng.random() < popular_share else rng.choice(book_ids),
+                    borrower_name='Lecteur', borrower_email='lecteur@example.com',
+                    card_number=f'C{rng.randrange(50_000)}', status=rng.choice(statuses),
+                )
+                for _ in range(start, min(start + batch_size, n_loans))
+            ],
+            batch_size=batch_size,
+        )
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=50_000)
+    parser.add_argument('--loans', type=int, default=1_000_000)
+    parser.add_argument('--popular-share', type=float, default=0.02, help='Share of the loans on the most borrowed book.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from books.admin import BookAdmin, LoanAdmin, LoanInline
+    from books.models import Book, Loan
+
+    class FormerLoanInline(LoanInline):
+        formset = BaseInlineFormSet
+        ordering = None
+
+    profiles = {
+        'former': {
+            Loan: former(LoanAdmin)(Loan, admin.site),
+            Book: former(BookAdmin, inlines=(FormerLoanInline,), list_filter=('category', 'author', 'publication_year'))(Book, admin.site),
+        },
+        'current': {Loan: LoanAdmin(Loan, admin.site), Book: BookAdmin(Book, admin.site)},
+    }
+
+    factory = RequestFactory()
+    rows, failures = [], []
+    with bench_database():
+        seed_catalog(args.books)
+        popular = Book.objects.values_list('pk', flat=True).first()
+        user = get_user_model().objects.create_superuser('bench', 'bench@example.com', 'pw')
+        pages = [
+            ('loan changelist', Loan, 'changelist_view', {}, ()),
+            ('loan changelist ?status=late', Loan, 'changelist_view', {'status__exact': 'late'}, ()),
+            ('loan add form', Loan, 'add_view', {}, ()),
+            ('book changelist', Book, 'changelist_view', {}, ()),
+            ('popular book change form', Book, 'change_view', {}, (str(popular),)),
+        ]
+
+        def render(model_admin, view, params, view_args):
+            request = factory.get('/admin/', params)
+            request.user = user
+            response = getattr(model_admin, view)(request, *view_args)
+            response.render()
+            return response
+
+        def queries(model_admin, view, params, view_args):
+            statements = []
+
+            def log(execute, sql, params, many, context):
+                statements.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(log):
+                render(model_admin, view, params, view_args)
+            return statements
+
+        small = min(1000, args.loans)
+        seed_loans(small, popular, args.popular_share, seed=1)
+        baseline = {
+            label: len(queries(profiles['current'][model], view, params, view_args))
+            for label, model, view, params, view_args in pages
+        }
+        seed_loans(args.loans - small, popular, args.popular_share)
+
+        for label, model, view, params, view_args in pages:
+            for name, registry in profiles.items():
+                model_admin = registry[model]
+                captured = queries(model_admin, view, params, view_args)
+                timing = measure(lambda: render(model_admin, view, params, view_args), repeat=args.repeat)
+                rows.append((label, name, f"{timing['median']:.1f}", f"{timing['p95']:.1f}", len(captured)))
+                if name != 'current':
+                    continue
+                if len(captured) > baseline[label]:
+                    failures.append(f'{label}: {len(captured)} queries, {baseline[label]} with {small} loans')
+                if any(UNBOUNDED_COUNT.search(sql) for sql in captured):
+                    failures.append(f'{label}: unbounded COUNT(*) of books_loan')
+
+    print(f'{args.loans} loans, {args.books} books')
+    print_table(('page', 'profile', 'median ms', 'p95 ms', 'queries'), rows)
+    if failures:
+        raise SystemExit('\n'.join(failures))
+
+
+if __name__ == '__main__':
+    main()
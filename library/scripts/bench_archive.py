@@ -0,0 +1,95 @@
+"""Benchmark: hot paths before and after archiving the old closed loans.
+
+    python scripts/bench_archive.py --profile medium
+
+Generates a dataset (``generate_dataset``, 5 years of loans), times a
+checkout (POST of the loan form), the first and a deep page of the active
+loans and a card's history, runs ``archive_loans`` (loans closed more than a
+year ago) and times them again. The page cache is disabled.
+
+Small profile (50k loans) on one CPU: 79 % of the loans archived at 20-27k
+rows/s. The first page of the active loans drops from ~90 ms to ~10 ms: its
+plan scans the books, reads each one's loans through the book_id index, closed
+ones included, and sorts; after archiving there are 5 times fewer. Checkout, a deep active page (its cursor bounds
+the index range) and the history (one more query, on the archive) stay within
+the noise of this host, 8-12 ms.
+"""
+import argparse
+import io
+import itertools
+import time
+
+from benchutils import bench_database, measure, print_table
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', default='small')
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    from books import archive
+    from books.models import Book, Loan, LoanArchive
+    from books.pagination import CursorPaginator
+
+    client = Client()
+    cards = (f'Z{n:06d}' for n in itertools.count())
+
+    def get(url, params=None):
+        response = client.get(url, params)
+        if response.status_code != 200:
+            raise SystemExit(f'{url}: HTTP {response.status_code}')
+        return response
+
+    def timings(books, card):
+        def checkout():
+            response = client.post(reverse('books:loan_create'), {
+                'book': next(books), 'card_number': next(cards), 'borrower_name': 'Bench',
+                'borrower_email': 'bench@example.com',
+            })
+            if response.status_code != 302:
+                raise SystemExit(f'checkout: HTTP {response.status_code}')
+
+        active = reverse('books:loans_active')
+        # the cursor after the 300th active loan (15 per page)
+        loans = Loan.objects.filter(status__in=[Loan.STATUS_BORROWED, Loan.STATUS_LATE])
+        paginator = CursorPaginator(loans, 15, ('-borrowed_at', '-id'))
+        deep = paginator.encode_cursor('n', loans.order_by('-borrowed_at', '-id')[299])
+        history = reverse('books:loan_history', args=[card])
+        return {
+            'checkout': measure(checkout, repeat=args.repeat),
+            'active loans, page 1': measure(lambda: get(active), repeat=args.repeat),
+            'active loans, page 21': measure(lambda: get(active, {'cursor': deep}), repeat=args.repeat),
+            f'history of {card}': measure(lambda: get(history), repeat=args.repeat),
+        }
+
+    with bench_database(), override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0, ALLOWED_HOSTS=['testserver']):
+        call_command('generate_dataset', '--profile', args.profile, '--workers', '0', stdout=io.StringIO())
+        card = Loan.objects.values('card_number').annotate(n=Count('id')).order_by('-n')[0]['card_number']
+        books = iter(list(Book.objects.filter(copies_available__gt=0).order_by('-id').values_list('pk', flat=True)))
+        before = timings(books, card)
+
+        total = Loan.objects.count()
+        start = time.perf_counter()
+        moved = sum(archive.archive_loans())
+        elapsed = time.perf_counter() - start
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        after = timings(books, card)
+        print(f'profile {args.profile}: {moved} of {total} loans archived in {elapsed:.1f}s '
+              f'({moved / elapsed:.0f} rows/s); Loan {Loan.objects.count()}, LoanArchive {LoanArchive.objects.count()} rows')
+    print_table(
+        ('request', 'before median ms', 'after median ms', 'before p95 ms', 'after p95 ms'),
+        [(name, f"{before[name]['median']:.1f}", f"{after[name]['median']:.1f}",
+          f"{before[name]['p95']:.1f}", f"{after[name]['p95']:.1f}") for name in before],
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Benchmark: async views under ASGI vs. sync views under WSGI, with slow clients.
+
+    python scripts/bench_asgi.py --clients 100 --requests 10 --client-delay 0.2
+
+Both handlers are driven in-process the way their servers drive them:
+
+* ASGI: Django's ASGIHandler on one event loop, as a uvicorn worker does;
+  a slow client is an ``await asyncio.sleep()`` in ``send``.
+* WSGI: Django's WSGIHandler on a pool of ``--threads`` threads, as a
+  gunicorn gthread worker does; a slow client holds its thread while the body
+  is written (``time.sleep()``).
+
+Each client requests the catalog page, a book page and the availability
+lookup in turn. Latency is measured from the request to the last byte, so it
+includes the wait for a free WSGI thread. The page cache is disabled.
+
+With fast clients both are bound by the same CPU work (rendering); ASGI pulls
+ahead once clients are slow enough for the WSGI threads to sit idle waiting on
+them (100 clients at 200 ms: ~37 vs. ~107 req/s on a laptop).
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from benchutils import bench_database, print_table, seed_catalog
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import override_settings
+from django.urls import reverse
+
+HOST = 'localhost'
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+def summary(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    return (
+        label, f'{len(latencies) / elapsed:.0f}', f'{statistics.median(latencies):.1f}',
+        f'{percentile(latencies, 95):.1f}', f'{percentile(latencies, 99):.1f}',
+    )
+
+
+def run_asgi(urls, clients, requests, delay):
+    app = ASGIHandler()
+
+    async def call(url):
+        parts = urlsplit(url)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': parts.path, 'raw_path': parts.path.encode(),
+            'query_string': parts.query.encode(), 'headers': [(b'host', HOST.encode())],
+            'server': (HOST, 80), 'client': ('127.0.0.1', 50000),
+        }
+        disconnected = asyncio.Event()
+        received = []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start' and message['status'] != 200:
+                raise SystemExit(f"{url}: HTTP {message['status']}")
+            if message['type'] == 'http.response.body':
+                await asyncio.sleep(delay)
+
+        await app(scope, receive, send)
+        disconnected.set()
+
+    async def client(i, latencies):
+        for n in range(requests):
+            start = time.perf_counter()
+            await call(urls[(i + n) % len(urls)])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async def main():
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i, latencies) for i in range(clients)))
+        return latencies, time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+def run_wsgi(urls, clients, requests, delay, threads):
+    app = WSGIHandler()
+    pool = ThreadPoolExecutor(max_workers=threads)
+    lock = threading.Lock()
+    latencies = []
+
+    def call(url, start):
+        parts = urlsplit(url)
+        environ = {'PATH_INFO': parts.path, 'QUERY_STRING': parts.query, 'HTTP_HOST': HOST, 'SERVER_NAME': HOST}
+        setup_testing_defaults(environ)
+        status = []
+        body = app(environ, lambda s, headers, exc_info=None: status.append(s))
+        for _ in body:
+            pass
+        body.close()
+        if not status[0].startswith('200'):
+            raise SystemExit(f'{url}: HTTP {status[0]}')
+        time.sleep(delay)  # slow client: the thread is busy until the body is out
+        with lock:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    def client(i):
+        for n in range(requests):
+            pool.submit(call, urls[(i + n) % len(urls)], time.perf_counter()).result()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as client_threads:
+        list(client_threads.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=20_000)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=10, help='Requests per client.')
+    parser.add_argument('--client-delay', type=float, default=0.2, help='Seconds a slow client takes to read a response.')
+    parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads.')
+    args = parser.parse_args()
+
+    from books.models import Book
+
+    rows = []
+    with bench_database(), override_settings(BOOKS_PAGE_CACHE_TIMEOUT=0, ALLOWED_HOSTS=[HOST], DEBUG=False):
+        seed_catalog(args.books)
+        ids = list(Book.objects.order_by('?').values_list('pk', flat=True)[:20])
+        availability = '?ids=' + ','.join(map(str, ids))
+        sync_urls = [reverse('books:book_list'), reverse('books:book_detail', args=[ids[0]]),
+                     reverse('books:api_availability') + availability]
+        async_urls = [reverse('books:book_list_async'), reverse('books:book_detail_async', args=[ids[0]]),
+                      reverse('books:availability_async') + availability]
+        latencies, elapsed = run_wsgi(sync_urls, args.clients, args.requests, args.client_delay, args.threads)
+        rows.append(summary(f'WSGI, sync views, {args.threads} threads', latencies, elapsed))
+        latencies, elapsed = run_asgi(async_urls, args.clients, args.requests, args.client_delay)
+        rows.append(summary('ASGI, async views', latencies, elapsed))
+    print(f'{args.clients} clients x {args.requests} requests, {args.client_delay * 1000:.0f} ms per slow client')
+    print_table(('path', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'), rows)
+
+
+if __name__ == '__main__':
+    main()
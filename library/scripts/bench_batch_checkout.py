@@ -0,0 +1,56 @@
+"""Benchmark: kiosk baskets checked out item by item vs. with checkout_batch.
+
+    python scripts/bench_batch_checkout.py --baskets 500 --basket-size 5
+
+The per-item path is what a kiosk did before: LoanCreateForm validation and
+services.checkout() once per scanned book.
+"""
+import argparse
+import time
+
+from benchutils import QueryCounter, bench_database, print_table, seed_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=20_000)
+    parser.add_argument('--baskets', type=int, default=500)
+    parser.add_argument('--basket-size', type=int, default=5)
+    args = parser.parse_args()
+
+    from books.forms import LoanCreateForm
+    from books.models import Book
+    from books import services
+
+    def per_item(card, ids):
+        for pk in ids:
+            form = LoanCreateForm({'book': pk, 'borrower_name': 'Kiosk', 'borrower_email': 'k@example.com', 'card_number': card})
+            if not form.is_valid():
+                raise SystemExit(form.errors)
+            services.checkout(form.save(commit=False))
+
+    def batch(card, ids):
+        services.checkout_batch(ids, card, 'Kiosk', 'k@example.com')
+
+    rows = []
+    with bench_database():
+        seed_catalog(args.books)
+        Book.objects.update(copies_total=args.baskets * 2, copies_available=args.baskets * 2)
+        book_ids = list(Book.objects.values_list('pk', flat=True))
+        for label, fn in (('per item', per_item), ('batch', batch)):
+            start = time.perf_counter()
+            with QueryCounter() as queries:
+                for i in range(args.baskets):
+                    offset = (i * args.basket_size) % (len(book_ids) - args.basket_size)
+                    fn(f'{label}-{i}', book_ids[offset:offset + args.basket_size])
+            elapsed = time.perf_counter() - start
+            rows.append((
+                label, f'{args.baskets / elapsed:.0f}',
+                f'{elapsed / args.baskets * 1000:.2f}', f'{queries.count / args.baskets:.1f}',
+            ))
+    print(f'{args.baskets} baskets of {args.basket_size} books')
+    print_table(('path', 'baskets/s', 'ms/basket', 'queries/basket'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Benchmark: ``manage.py generate_dataset`` with 0 (in process) and N workers.
+
+    python scripts/bench_generate_dataset.py --profile medium --workers 0 4
+
+Each run starts from a fresh database file and prints the rate of every table
+(rows/s) and the total time, end date fixed so that the runs generate the same
+rows. bulk_create spends ~85 % of its time preparing values in Python; the
+workers share that, the SQLite writes stay serial (one statement at a time).
+"""
+import argparse
+import io
+import re
+import time
+
+from benchutils import bench_database, print_table
+
+from django.core.management import call_command
+
+TABLES = ('catégories', 'auteurs', 'livres', 'emprunts')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', default='small')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 4])
+    parser.add_argument('--loans', type=int)
+    args = parser.parse_args()
+
+    rows = []
+    for workers in args.workers:
+        out = io.StringIO()
+        options = ['--profile', args.profile, '--workers', str(workers), '--end-date', '2026-01-01']
+        if args.loans is not None:
+            options += ['--loans', str(args.loans)]
+        with bench_database():
+            start = time.perf_counter()
+            call_command('generate_dataset', *options, stdout=out)
+            elapsed = time.perf_counter() - start
+        rates = dict(re.findall(r'^(\w+) : \d+ en [\d.]+s \((\d+) lignes/s\)', out.getvalue(), re.MULTILINE))
+        post = re.search(r'statistiques en ([\d.]+)s', out.getvalue()).group(1)
+        rows.append((workers, *(rates.get(table, '-') for table in TABLES), f'{post} s', f'{elapsed:.1f} s'))
+    print(f'profile {args.profile}')
+    print_table(('workers', *(f'{table}/s' for table in TABLES), 'post-processing', 'total'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark: offset vs. keyset (cursor) pagination of the catalog.
+
+    python scripts/bench_pagination.py --books 200000 --pages 1 100 1000 10000
+
+Times what BookListView does for a page (8 books ordered by title): Django's
+Paginator (COUNT(*) + OFFSET) against CursorPaginator, whose latency should
+stay flat however deep the page.
+"""
+import argparse
+
+from benchutils import bench_database, measure, print_table, seed_catalog
+
+from django.core.paginator import Paginator
+
+PER_PAGE = 8
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=200_000)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 100, 1000, 10_000])
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    from books.models import Book
+    from books.pagination import CursorPaginator
+
+    rows = []
+    with bench_database():
+        seed_catalog(args.books)
+        qs = Book.objects.select_related('author', 'category').order_by('title', 'id')
+        cursor_paginator = CursorPaginator(qs, PER_PAGE, ('title', 'id'))
+        for number in args.pages:
+            if (number - 1) * PER_PAGE >= args.books:
+                continue
+
+            def offset_page():
+                page = Paginator(qs, PER_PAGE).page(number)
+                return page.paginator.num_pages, list(page.object_list)
+
+            # the token a reader would hold after reaching the previous page
+            token = None
+            if number > 1:
+                last_of_previous = qs[(number - 1) * PER_PAGE - 1]
+                token = cursor_paginator.encode_cursor('n', last_of_previous)
+
+            offset = measure(offset_page, repeat=args.repeat)
+            cursor = measure(lambda: cursor_paginator.page(token), repeat=args.repeat)
+            rows.append((number, f"{offset['median']:.2f}", f"{cursor['median']:.2f}"))
+    print(f'{args.books} books, {PER_PAGE} per page')
+    print_table(('page', 'offset ms', 'cursor ms'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,469 @@
+"""Load test: every route of books/urls.py, with throughput, latency
+percentiles and SQL queries per request, compared with a stored baseline.
+
+    python scripts/bench_routes.py --profile small --concurrency 4 --requests 100
+    python scripts/bench_routes.py --save-baseline
+    python scripts/bench_routes.py --url http://127.0.0.1:8000 --user admin --password secret
+
+By default the requests go through the test client, in this process, to a
+fresh database filled by ``generate_dataset --profile`` (fixed end date: the
+same data on every run), and the SQL statements of each request are counted.
+With --url they go to a running server over HTTP; their parameters (ids,
+cards, words) are then drawn from the database of the current settings, which
+must be the server's, and the queries are not counted.
+
+Each scenario sends --requests requests from --concurrency threads, after a
+few warm-up ones. Write scenarios consume their fixtures (active loans to
+return, waiting holds to cancel) and use fresh card numbers. The page cache is
+disabled unless --page-cache is given (test client only).
+
+The run fails (exit status 1) when a scenario answers an unexpected status,
+or regresses against the baseline (scripts/baselines/routes.json): more
+queries per request than the baseline (+0.5, for the mix of cached and
+uncached pages), or a median cost above baseline x (1 + --tolerance) +
+--slack-ms. With the test client the cost is the CPU time of the thread that
+served the request: wall-clock latencies under concurrency depend on who gets
+the CPU and SQLite's write lock, and flip between runs (p50, p95 and p99 are
+reported all the same). The async views' own code runs on asgiref's event
+loop thread and is not counted, their queries are. Over HTTP the cost is the
+median latency. The baseline holds the timings of the machine that recorded
+it: record your own with --save-baseline before comparing.
+"""
+import argparse
+import http.cookiejar
+import itertools
+import json
+import queue
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchutils import QueryCounter, bench_database, percentile, print_table
+
+from django.core.management import call_command
+from django.test import Client, override_settings
+from django.urls import reverse
+
+BASELINE = Path(__file__).resolve().parent / 'baselines' / 'routes.json'
+END_DATE = '2026-01-01'
+
+
+class Scenario:
+    """Requests to one route: `kwargs` (URL arguments), `params` (query
+    string), `data` (form body) and `json` are values or callables of the
+    Fixtures; `prepare(fixtures, n)` fills the fixtures a write scenario
+    consumes and returns how many requests they allow."""
+
+    def __init__(self, route, method='GET', label=None, kwargs=None, params=None, data=None, json=None,
+                 status=200, staff=False, requests=None, prepare=None):
+        self.route = route
+        self.label = label or (f'{route} (POST)' if method == 'POST' else route)
+        self.method = method
+        self.kwargs, self.params, self.data, self.json = kwargs, params, data, json
+        self.status = status
+        self.staff = staff
+        self.requests = requests
+        self.prepare = prepare
+
+    def build(self, fixtures):
+        def value(v):
+            return v(fixtures) if callable(v) else v
+        path = reverse(f'books:{self.route}', kwargs=value(self.kwargs))
+        return self.method, path, value(self.params), value(self.data), value(self.json)
+
+
+class Fixtures:
+    """Parameters of the requests, drawn from the database."""
+
+    def __init__(self, seed=42, size=500):
+        from books import dataset
+        from books.models import Author, Book, BorrowerCard, Category
+
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.words = dataset.WORDS
+        self.last_names = dataset.LAST_NAMES
+        self.pools = {
+            'books': self.sample(Book, size),
+            'authors': self.sample(Author, size),
+            'categories': list(Category.objects.values_list('pk', flat=True)[:size]),
+            'cards': list(BorrowerCard.objects.values_list('pk', flat=True)[:size]),
+        }
+        self.queues = {}
+        token = f'{int(time.time()) % 10 ** 6:06d}'
+        self.cards = (f'B{token}-{n}' for n in itertools.count())
+
+    def sample(self, model, size):
+        # random ids of the id range (ORDER BY RANDOM() would scan the table)
+        from django.db.models import Max, Min
+        bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return []
+        ids = [self.rng.randint(bounds['low'], bounds['high']) for _ in range(size * 2)]
+        return list(model.objects.filter(pk__in=ids).values_list('pk', flat=True)[:size])
+
+    def pick(self, pool):
+        with self.lock:
+            return self.rng.choice(self.pools[pool])
+
+    def word(self):
+        with self.lock:
+            return self.rng.choice(self.words)
+
+    def last_name(self):
+        with self.lock:
+            return self.rng.choice(self.last_names)
+
+    def card(self):
+        with self.lock:
+            return next(self.cards)
+
+    def fill(self, name, ids):
+        self.queues[name] = queue.SimpleQueue()
+        for pk in ids:
+            self.queues[name].put(pk)
+        return len(ids)
+
+    def take(self, name):
+        return self.queues[name].get_nowait()
+
+    def borrower(self):
+        card = self.card()
+        return {'card_number': card, 'borrower_name': 'Banc d’essai', 'borrower_email': f'{card.lower()}@example.org'}
+
+    def loan_form(self):
+        return dict(self.borrower(), book=self.take('available_books'), comments='')
+
+    def hold_form(self):
+        return dict(self.borrower(), book=self.take('unavailable_books'))
+
+    def batch_checkout(self):
+        return dict(self.borrower(), book_ids=[self.take('available_books'), self.take('available_books')])
+
+
+def active_loans(per_request):
+    def prepare(fixtures, n):
+        from books.models import Loan
+        ids = Loan.objects.exclude(status__in=Loan.CLOSED_STATUSES).order_by('-id').values_list('pk', flat=True)
+        return fixtures.fill('active_loans', list(ids[:n * per_request])) // per_request
+    return prepare
+
+
+def available_books(per_request):
+    # a different book for each loan: none runs out of copies during the scenario
+    def prepare(fixtures, n):
+        from books.models import Book
+        ids = Book.objects.filter(copies_available__gt=0).values_list('pk', flat=True)
+        return fixtures.fill('available_books', list(ids[:n * per_request])) // per_request
+    return prepare
+
+
+def unavailable_books(fixtures, n):
+    from books.models import Book
+    return fixtures.fill('unavailable_books', list(Book.objects.filter(copies_available=0).values_list('pk', flat=True)[:n]))
+
+
+def waiting_holds(fixtures, n):
+    from books.models import Hold
+    return fixtures.fill('waiting_holds', list(Hold.objects.filter(status=Hold.STATUS_WAITING).values_list('pk', flat=True)[:n]))
+
+
+def hold_cards(fixtures, n):
+    from books.models import Hold
+    fixtures.pools['hold_cards'] = list(Hold.objects.values_list('card_number', flat=True)[:n]) or ['-']
+    return n
+
+
+def pick(pool, key='pk'):
+    return lambda f: {key: f.pick(pool)}
+
+
+SCENARIOS = [
+    Scenario('book_list'),
+    Scenario('book_search', params=lambda f: {'q': f.word()}),
+    Scenario('book_by_category', kwargs=pick('categories', 'category_id')),
+    Scenario('book_by_author', kwargs=pick('authors', 'author_id')),
+    Scenario('book_detail', kwargs=pick('books')),
+    Scenario('author_list'),
+    Scenario('author_search', params=lambda f: {'q': f.last_name()}),
+    Scenario('author_detail', kwargs=pick('authors')),
+    Scenario('loans_active'),
+    Scenario('loans_late'),
+    Scenario('loans_fines', requests=20),
+    Scenario('loan_history', kwargs=pick('cards', 'card_number')),
+    Scenario('loan_create', label='loan_create (form)'),
+    Scenario('loan_create', 'POST', data=lambda f: f.loan_form(), status=302, prepare=available_books(1)),
+    Scenario('loan_return', 'POST', kwargs=lambda f: {'pk': f.take('active_loans')}, status=302,
+             prepare=active_loans(1)),
+    Scenario('loan_return_batch', 'POST', data=lambda f: {'loan_ids': [f.take('active_loans') for _ in range(3)]},
+             prepare=active_loans(3)),
+    Scenario('loan_checkout_batch', 'POST', json=lambda f: f.batch_checkout(), status=201,
+             prepare=available_books(2)),
+    Scenario('hold_create', label='hold_create (form)'),
+    Scenario('hold_create', 'POST', data=lambda f: f.hold_form(), status=302, prepare=unavailable_books),
+    Scenario('hold_list', kwargs=pick('hold_cards', 'card_number'), prepare=hold_cards),
+    Scenario('hold_cancel', 'POST', kwargs=lambda f: {'pk': f.take('waiting_holds')}, status=302,
+             prepare=waiting_holds),
+    Scenario('loan_export', params=pick('cards', 'card_number'), staff=True),
+    Scenario('book_export', staff=True, requests=5),
+    Scenario('api_book_list', params={'limit': 50}),
+    Scenario('api_book_typeahead', params=lambda f: {'q': f.word()[:3]}),
+    Scenario('api_book_detail', kwargs=pick('books')),
+    Scenario('api_author_list'),
+    Scenario('api_author_detail', kwargs=pick('authors')),
+    Scenario('api_category_list'),
+    Scenario('api_category_detail', kwargs=pick('categories')),
+    Scenario('api_availability', params=lambda f: {'ids': ','.join(str(f.pick('books')) for _ in range(20))}),
+    Scenario('cache_stats'),
+    Scenario('book_list_fbv'),
+    Scenario('book_by_category_fbv', kwargs=pick('categories', 'category_id')),
+    Scenario('book_by_author_fbv', kwargs=pick('authors', 'author_id')),
+    Scenario('book_detail_fbv', kwargs=pick('books')),
+    Scenario('author_list_fbv'),
+    Scenario('author_detail_fbv', kwargs=pick('authors')),
+    Scenario('loan_create_fbv', label='loan_create_fbv (form)'),
+    Scenario('loan_create_fbv', 'POST', data=lambda f: f.loan_form(), status=302, prepare=available_books(1)),
+    Scenario('loan_return_fbv', label='loan_return_fbv (form)', kwargs=lambda f: {'pk': f.take('active_loans')},
+             prepare=active_loans(1)),
+    Scenario('loan_return_fbv', 'POST', kwargs=lambda f: {'pk': f.take('active_loans')}, status=302,
+             prepare=active_loans(1)),
+    Scenario('book_list_async'),
+    Scenario('book_by_category_async', kwargs=pick('categories', 'category_id')),
+    Scenario('book_by_author_async', kwargs=pick('authors', 'author_id')),
+    Scenario('book_detail_async', kwargs=pick('books')),
+    Scenario('availability_async', params=lambda f: {'ids': ','.join(str(f.pick('books')) for _ in range(20))}),
+]
+
+
+def uncovered_routes():
+    from books import urls
+    return {pattern.name for pattern in urls.urlpatterns} - {s.route for s in SCENARIOS}
+
+
+class TestClientSession:
+    """One thread's test client, with the SQL statements of its connection counted."""
+
+    def __init__(self, staff):
+        self.client = Client()
+        if staff is not None:
+            self.client.force_login(staff)
+        self.counter = QueryCounter()
+        self.counter.__enter__()
+
+    def send(self, method, path, params, data, json_body):
+        self.counter.count = 0
+        cpu = time.thread_time()
+        if json_body is not None:
+            response = self.client.post(path, json.dumps(json_body), content_type='application/json')
+        elif method == 'POST':
+            response = self.client.post(path, data)
+        else:
+            response = self.client.get(path, params)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code, self.counter.count, (time.thread_time() - cpu) * 1000
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """One thread's cookie session with the server at `base`."""
+
+    def __init__(self, base, credentials):
+        self.base = base.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+        # the CSRF cookie, from a page with a form
+        self.open('GET', reverse('books:loan_create'))
+        if credentials:
+            username, password = credentials
+            status = self.open('POST', '/admin/login/', data={'username': username, 'password': password, 'next': '/admin/'})[0]
+            if status != 302:
+                raise SystemExit(f'Login of {username} failed (HTTP {status})')
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def open(self, method, path, params=None, data=None, json_body=None):
+        url = self.base + path + ('?' + urllib.parse.urlencode(params, doseq=True) if params else '')
+        headers = {'X-CSRFToken': self.csrf_token(), 'Referer': self.base + path}
+        body = None
+        if json_body is not None:
+            body, headers['Content-Type'] = json.dumps(json_body).encode(), 'application/json'
+        elif method == 'POST':
+            body = urllib.parse.urlencode(data or {}, doseq=True).encode()
+        request = urllib.request.Request(url, body, headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status, None, None
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, None, None
+
+    def send(self, method, path, params, data, json_body):
+        return self.open(method, path, params, data, json_body)
+
+
+def run_scenario(scenario, fixtures, pool, sessions, n, warmup):
+    if scenario.prepare:
+        n = min(n, scenario.prepare(fixtures, n + warmup) - warmup)
+    if n <= 0:
+        return None
+    requests = [scenario.build(fixtures) for _ in range(n + warmup)]
+
+    def send(request):
+        session = sessions(scenario.staff)
+        start = time.perf_counter()
+        try:
+            status, queries, cpu = session.send(*request)
+        except Exception as e:
+            status, queries, cpu = repr(e), None, None
+        return (time.perf_counter() - start) * 1000, status, queries, cpu
+
+    list(pool.map(send, requests[:warmup]))
+    start = time.perf_counter()
+    results = list(pool.map(send, requests[warmup:]))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(r[0] for r in results)
+    errors = [r[1] for r in results if r[1] != scenario.status]
+    queries = [r[2] for r in results if r[2] is not None]
+    cpu = sorted(r[3] for r in results if r[3] is not None)
+    return {
+        'requests': n,
+        'rps': round(n / elapsed, 1),
+        'p50': round(percentile(latencies, 50), 2),
+        'p95': round(percentile(latencies, 95), 2),
+        'p99': round(percentile(latencies, 99), 2),
+        'cpu': round(percentile(cpu, 50), 2) if cpu else None,
+        'queries': round(statistics.mean(queries), 2) if queries else None,
+        'errors': len(errors),
+        'error': str(errors[0]) if errors else None,
+    }
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    """``{label: [regressions]}`` against the baseline results."""
+    regressions = {}
+    for label, result in results.items():
+        base = baseline.get(label)
+        problems = []
+        if result['errors']:
+            problems.append(f"{result['errors']} error(s): {result['error']}")
+        if base:
+            metric = 'cpu' if result['cpu'] is not None and base.get('cpu') is not None else 'p50'
+            if result[metric] > base[metric] * (1 + tolerance) + slack_ms:
+                problems.append(f"{metric} {result[metric]} ms > {base[metric]} ms")
+            if result['queries'] is not None and base['queries'] is not None and result['queries'] > base['queries'] + 0.5:
+                problems.append(f"{result['queries']} queries > {base['queries']}")
+        if problems:
+            regressions[label] = problems
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', default='small', help='generate_dataset profile (test client).')
+    parser.add_argument('--url', help='Base URL of a running server instead of the test client.')
+    parser.add_argument('--user', help='Staff user of the server, for the exports (--url).')
+    parser.add_argument('--password')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=100, help='Measured requests per scenario.')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='Scenario labels or route names to run.')
+    parser.add_argument('--page-cache', action='store_true', help='Keep the page cache enabled.')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Record the results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed relative median increase.')
+    parser.add_argument('--slack-ms', type=float, default=2.0, help='Allowed absolute median increase.')
+    args = parser.parse_args()
+
+    missing = uncovered_routes()
+    if missing:
+        raise SystemExit(f'Routes without a scenario: {", ".join(sorted(missing))}')
+    scenarios = [s for s in SCENARIOS if not args.only or s.label in args.only or s.route in args.only]
+    config = {'profile': args.profile, 'concurrency': args.concurrency,
+              'mode': 'http' if args.url else 'test client', 'page_cache': 'server' if args.url else args.page_cache}
+
+    local = threading.local()
+
+    def run(staff_user):
+        def sessions(staff):
+            key = 'staff' if staff else 'anonymous'
+            if not hasattr(local, key):
+                if args.url:
+                    credentials = (args.user, args.password) if staff and args.user else None
+                    setattr(local, key, HttpSession(args.url, credentials))
+                else:
+                    setattr(local, key, TestClientSession(staff_user if staff else None))
+            return getattr(local, key)
+
+        fixtures = Fixtures()
+        results = {}
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            for scenario in scenarios:
+                if scenario.staff and args.url and not args.user:
+                    print(f'{scenario.label}: skipped (needs --user)', file=sys.stderr)
+                    continue
+                result = run_scenario(scenario, fixtures, pool, sessions,
+                                      min(args.requests, scenario.requests or args.requests), args.warmup)
+                if result is None:
+                    print(f'{scenario.label}: skipped (no fixture)', file=sys.stderr)
+                    continue
+                results[scenario.label] = result
+        return results
+
+    if args.url:
+        results = run(None)
+    else:
+        cache = {} if args.page_cache else {'BOOKS_PAGE_CACHE_TIMEOUT': 0}
+        with bench_database(), override_settings(ALLOWED_HOSTS=['testserver'], **cache):
+            from django.contrib.auth.models import User
+            call_command('generate_dataset', '--profile', args.profile, '--end-date', END_DATE, verbosity=0)
+            staff = User.objects.create_superuser('bench', 'bench@example.org', 'bench')
+            results = run(staff)
+
+    baseline = {}
+    if args.baseline.exists() and not args.save_baseline:
+        recorded = json.loads(args.baseline.read_text())
+        if recorded['config'] != config:
+            print(f'Baseline recorded with {recorded["config"]}, not compared.', file=sys.stderr)
+        else:
+            baseline = recorded['routes']
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+
+    rows = []
+    for label, r in results.items():
+        base = baseline.get(label)
+        metric = 'cpu' if r['cpu'] is not None else 'p50'
+        delta = f"{(r[metric] / base[metric] - 1) * 100:+.0f}%" if base and base.get(metric) else ''
+        rows.append((label, r['requests'], r['rps'], r['p50'], r['p95'], r['p99'],
+                     '-' if r['cpu'] is None else r['cpu'], '-' if r['queries'] is None else r['queries'],
+                     r['errors'], delta,
+                     'REGRESSION' if label in regressions else ''))
+    print(f"{config['mode']}, profile {args.profile}, concurrency {args.concurrency}")
+    print_table(('scenario', 'n', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'cpu ms', 'queries', 'errors', 'vs base', ''),
+                rows)
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(exist_ok=True)
+        args.baseline.write_text(json.dumps({'config': config, 'routes': results}, indent=1, sort_keys=True) + '\n')
+        print(f'Baseline written to {args.baseline}')
+    if regressions:
+        for label, problems in regressions.items():
+            print(f'{label}: {"; ".join(problems)}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
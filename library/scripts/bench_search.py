@@ -0,0 +1,55 @@
+"""Benchmark: catalog search through the FTS5 index vs. the former icontains scan.
+
+    python scripts/bench_search.py --sizes 100000 1000000
+
+For each catalog size, times the first result page (count + 8 rows, what
+BookListView does) of a few typical queries on both paths.
+"""
+import argparse
+
+from benchutils import bench_database, measure, print_table, seed_catalog
+
+from django.db.models import Q
+
+
+QUERIES = ['amour', 'jardin secret', 'mart', '9780000001']
+
+
+def icontains_page(q):
+    from books.models import Book
+    qs = Book.objects.select_related('author', 'category').filter(
+        Q(title__icontains=q) | Q(isbn__icontains=q) | Q(author__first_name__icontains=q) | Q(author__last_name__icontains=q)
+    ).order_by('title')
+    return qs.count(), list(qs[:8])
+
+
+def fts_page(q):
+    from books.models import Book
+    from books import search
+    qs = search.search_books(Book.objects.select_related('author', 'category'), q)
+    return qs.count(), list(qs[:8])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        with bench_database():
+            seed_catalog(size)
+            for q in QUERIES:
+                legacy = measure(lambda: icontains_page(q), repeat=args.repeat)
+                fts = measure(lambda: fts_page(q), repeat=args.repeat)
+                rows.append((
+                    size, q,
+                    f"{legacy['median']:.1f}", f"{fts['median']:.1f}",
+                    f"x{legacy['median'] / max(fts['median'], 0.001):.1f}",
+                ))
+    print_table(('books', 'query', 'icontains ms', 'fts5 ms', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
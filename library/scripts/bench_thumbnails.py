@@ -0,0 +1,79 @@
+"""Benchmark: cover uploads with the thumbnails rendered in the request vs. in
+the process pool, and the backfill command with 1 and N processes.
+
+    python scripts/bench_thumbnails.py --uploads 20 --backfill 200 --workers 4
+
+Covers are 1600x2400 JPEG noise, so that Pillow has real work. One CPU: a
+1600x2400 upload takes ~160 ms with the rendering, ~9 ms without.
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from benchutils import bench_database, print_table
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from PIL import Image
+
+
+def cover(seed):
+    buffer = io.BytesIO()
+    Image.effect_noise((1600, 2400), 40 + seed % 20).convert('RGB').save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=20)
+    parser.add_argument('--backfill', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from books import thumbnails
+    from books.models import Author, Book
+
+    media = tempfile.mkdtemp()
+    data = [cover(i) for i in range(8)]
+    rows = []
+    try:
+        with bench_database(), override_settings(MEDIA_ROOT=media):
+            author = Author.objects.create(first_name='Bench', last_name='Mark')
+            isbn = iter(range(10 ** 9))
+            for label, workers in (('in the request', 0), (f'pool of {args.workers}', args.workers)):
+                with override_settings(BOOKS_THUMBNAIL_WORKERS=workers):
+                    if workers:
+                        thumbnails.get_pool().submit(int).result()  # start the workers outside the timing
+                    samples = []
+                    for i in range(args.uploads):
+                        start = time.perf_counter()
+                        Book.objects.create(title='Cover', isbn=str(next(isbn)), author=author,
+                                            cover=SimpleUploadedFile(f'cover{i}.jpg', data[i % len(data)]))
+                        samples.append((time.perf_counter() - start) * 1000)
+                    samples.sort()
+                    rows.append((f'upload, {label}', f'{samples[len(samples) // 2]:.1f} ms', f'{samples[-1]:.1f} ms'))
+
+            Book.objects.bulk_create([
+                Book(title='Cover', isbn=str(next(isbn)), author=author, cover=f'covers/backfill{i}.jpg')
+                for i in range(args.backfill)
+            ])
+            os.makedirs(os.path.join(media, 'covers'), exist_ok=True)
+            for i in range(args.backfill):
+                with open(os.path.join(media, 'covers', f'backfill{i}.jpg'), 'wb') as f:
+                    f.write(data[i % len(data)])
+            for workers in (1, args.workers):
+                start = time.perf_counter()
+                call_command('generate_thumbnails', '--force', '--model', 'books', '--workers', str(workers), stdout=io.StringIO())
+                elapsed = time.perf_counter() - start
+                rows.append((f'backfill, {workers} process(es)', f'{Book.objects.count() / elapsed:.1f} images/s', ''))
+    finally:
+        shutil.rmtree(media)
+    print_table(('case', 'median / rate', 'max'), rows)
+
+
+if __name__ == '__main__':
+    main()
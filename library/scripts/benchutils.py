@@ -0,0 +1,136 @@
+"""Shared helpers for the scripts/bench_*.py benchmarks.
+
+Run a benchmark from the project directory, e.g.::
+
+    python scripts/bench_search.py --sizes 100000 1000000
+
+Each benchmark works on a throw-away database (a temporary SQLite file by
+default) created with Django's test database machinery, so it never touches
+db.sqlite3.
+"""
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+WORDS = (
+    'amour guerre paix nuit jour mer ciel terre feu ombre lumière secret voyage '
+    'jardin maison rivière montagne étoile histoire roi reine enfant silence '
+    'chemin hiver été printemps automne rêve mémoire ville forêt île temps'
+).split()
+FIRST_NAMES = 'Jean Marie Pierre Anne Louis Claire Paul Sophie Victor Émile Camille Hélène'.split()
+LAST_NAMES = 'Martin Bernard Dubois Durand Lefebvre Moreau Laurent Simon Michel Garcia Roux Fournier'.split()
+
+
+@contextmanager
+def bench_database(name=None):
+    """Create a fresh migrated database for the duration of the block."""
+    settings_dict = connection.settings_dict
+    old_name = settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        # on disk rather than in memory: closer to production I/O
+        settings_dict['TEST']['NAME'] = name or os.path.join(tempfile.gettempdir(), 'library_bench.sqlite3')
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def isbn13(n):
+    """A valid ISBN-13 (978 prefix + checksum) derived from an integer."""
+    body = f'978{n % 10 ** 9:09d}'
+    total = sum(int(ch) * (1 if i % 2 == 0 else 3) for i, ch in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def seed_catalog(n_books, seed=42, batch_size=5000):
+    """Bulk insert `n_books` books (and one author per ten books), bypassing signals."""
+    from books.models import Author, Book
+    from books import search
+
+    rng = random.Random(seed)
+    n_authors = max(1, n_books // 10)
+    Author.objects.bulk_create(
+        [Author(first_name=rng.choice(FIRST_NAMES), last_name=f'{rng.choice(LAST_NAMES)}{i}') for i in range(n_authors)],
+        batch_size=batch_size,
+    )
+    author_ids = list(Author.objects.values_list('pk', flat=True))
+    for start in range(0, n_books, batch_size):
+        Book.objects.bulk_create(
+            [
+                Book(
+                    title=' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).capitalize(),
+                    isbn=isbn13(i), author_id=rng.choice(author_ids),
+                    copies_total=3, copies_available=rng.randint(0, 3),
+                )
+                for i in range(start, min(start + batch_size, n_books))
+            ],
+            batch_size=batch_size,
+        )
+    search.reset_backend()
+    search.get_backend().rebuild()
+
+
+def measure(fn, repeat=7, warmup=1):
+    """Run `fn` and return latency statistics in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'min': samples[0],
+        'median': statistics.median(samples),
+        'p95': samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+    }
+
+
+def percentile(samples, q):
+    """Nearest-rank `q`-th percentile (0-100) of the sorted list `samples`."""
+    return samples[min(len(samples), max(1, math.ceil(q / 100 * len(samples)))) - 1]
+
+
+class QueryCounter:
+    """Count the SQL statements run on `connection` (no 9000-query log cap)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._wrapper.__exit__(*exc)
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print('  '.join('-' * w for w in widths))
+    for row in rows:
+        print('  '.join(str(c).ljust(w) for c, w in zip(row, widths)))